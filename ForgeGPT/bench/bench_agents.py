@@ -0,0 +1,92 @@
+"""
+End-to-end latency of LibraryEvolutionAgent: the zero-shot ReAct loop against the
+task graph (src/agents.py).
+
+The LLM is a FakeListLLM replaying a ReAct transcript with a fixed delay per call,
+and every tool sleeps for a fixed time. The environment setup only records the build
+session (the containers start when a build needs them), so it costs nothing in either
+path and the numbers show how much of the per-library latency comes from sequential LLM
+round-trips.
+
+Run from the ForgeGPT directory:
+    python -m bench.bench_agents --libraries 3 --llm-delay 0.5 --tool-delay 0.2
+"""
+import argparse
+import json
+import time
+
+from langchain_core.language_models import FakeListLLM
+
+from src import agents
+
+REACT_STEPS = [
+    ("LibraryAnalysis", "{path}"),
+    ("MigrationExpert", "{{'dependencies': ['dep1', 'dep2']}}"),
+    ("LibraryMigration", "{{'analysis': {{}}, 'knowledge': {{}}}}"),
+    ("LibraryValidation", "/path/to/migrated/library"),
+]
+
+
+class SlowFakeListLLM(FakeListLLM):
+    """FakeListLLM that sleeps on every call (its own `sleep` only applies to streaming)."""
+    delay: float = 0.0
+
+    def _call(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return super()._call(*args, **kwargs)
+
+
+def react_transcript(path):
+    responses = [
+        f"Thought: next step\nAction: {tool}\nAction Input: {tool_input.format(path=path)}"
+        for tool, tool_input in REACT_STEPS
+    ]
+    responses.append("Thought: I now know the final answer\nFinal Answer: migrated and validated")
+    return responses
+
+
+def slow(func, delay):
+    def wrapper(*args):
+        time.sleep(delay)
+        return func(*args)
+    return wrapper
+
+
+def make_agent(path, llm_delay, tool_delay):
+    agent = agents.LibraryEvolutionAgent(llm=SlowFakeListLLM(responses=react_transcript(path), delay=llm_delay))
+    for sub_agent, method in ((agent.analysis_agent, "analyze"), (agent.expert_agent, "provide_migration_knowledge"),
+                              (agent.migration_agent, "migrate"), (agent.validation_agent, "validate")):
+        setattr(sub_agent, method, slow(getattr(sub_agent, method), tool_delay))
+    # LibraryMigration 的输入在 ReAct 中是字符串
+    agent.agent.tools[2].func = lambda args: agent.migration_agent.migrate({}, {})
+    return agent
+
+
+def run(n_libraries, llm_delay, tool_delay):
+    rows = []
+    for i in range(n_libraries):
+        path = f"/workspaces/TEE-Forge-It/forked_repo/lib{i}-sgx"
+        agent = make_agent(path, llm_delay, tool_delay)
+        latency = agent.compare_latency([path])[path]
+        state = agent.evolve_graph(path)
+        rows.append(dict(latency, library=path, graph_llm_calls=state["llm_calls"],
+                         cached_graph_seconds=state["seconds"], timings=state["timings"]))
+    return {"llm_delay": llm_delay, "tool_delay": tool_delay, "results": rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ReAct loop vs task graph latency of LibraryEvolutionAgent.")
+    parser.add_argument("--libraries", type=int, default=3)
+    parser.add_argument("--llm-delay", type=float, default=0.5, help="seconds per LLM call")
+    parser.add_argument("--tool-delay", type=float, default=0.2, help="seconds per tool call")
+    parser.add_argument("--output", default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.libraries, args.llm_delay, args.tool_delay)
+    print(f"{'library':<50} {'react s':>8} {'graph s':>8} {'cached s':>9} {'llm calls':>10}")
+    for row in report["results"]:
+        print(f"{row['library']:<50} {row['react_seconds']:8.2f} {row['graph_seconds']:8.2f} "
+              f"{row['cached_graph_seconds']:9.2f} {row['graph_llm_calls']:10d}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
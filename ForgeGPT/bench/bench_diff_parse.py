@@ -0,0 +1,72 @@
+"""
+Compare the list-based diff parser (parse_changes) with the streaming
+parser (iter_all_changes) on a changes/ corpus: wall-clock time and peak memory.
+
+Run from the ForgeGPT directory:
+    python -m bench.bench_diff_parse                      # synthetic corpus
+    python -m bench.bench_diff_parse --changes-dir /workspaces/TEE-Forge-It/changes
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from src.diff.diff_hunk_read import load_project_changes, parse_changes, iter_all_changes
+from bench.synthetic import write_changes_corpus
+
+
+def legacy_parse(directory):
+    result = {}
+    for name in sorted(os.listdir(directory)):
+        changes = load_project_changes(os.path.join(directory, name))
+        if changes is not None:
+            result[name] = parse_changes(changes)
+    return sum(len(hunk.lines) for hunks in result.values() for file_hunks in hunks.values() for hunk in file_hunks)
+
+
+def streaming_parse(directory):
+    return sum(len(hunk.lines) for _, _, hunk in iter_all_changes(directory))
+
+
+def streaming_headers_only(directory):
+    # consumers that only need hunk positions never materialize the lines
+    return sum(hunk.old_count for _, _, hunk in iter_all_changes(directory))
+
+
+def measure(fn, directory):
+    start = time.perf_counter()
+    n_lines = fn(directory)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn(directory)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak, "hunk_lines": n_lines}
+
+
+def run(directory):
+    return {
+        "legacy": measure(legacy_parse, directory),
+        "streaming": measure(streaming_parse, directory),
+        "streaming_headers": measure(streaming_headers_only, directory),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark diff corpus parsing.")
+    parser.add_argument("--changes-dir", default=None, help="existing changes/ directory (default: synthetic)")
+    parser.add_argument("--projects", type=int, default=40)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.changes_dir:
+        report = run(args.changes_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_changes_corpus(tmp_dir, args.projects, args.files, args.lines)
+            report = run(tmp_dir)
+    for name, row in report.items():
+        print(f"{name:<18} {row['seconds'] * 1000:10.2f} ms  peak {row['peak_bytes'] / 1e6:8.2f} MB  "
+              f"lines={row['hunk_lines']}")
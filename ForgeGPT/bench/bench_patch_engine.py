@@ -0,0 +1,73 @@
+"""
+Benchmark the multi-hunk patch engine against the per-hunk functions
+apply_hunk_on_new_file / revert_hunk_on_new_file on large generated Rust files.
+
+Run from the ForgeGPT directory:
+    python -m bench.bench_patch_engine --lines 20000 --edits 200
+"""
+import argparse
+import random
+import time
+
+from src.diff.diff_hunk_read import parse_diff_hunks
+from src.diff.apply_diff_hunk import apply_hunk_on_new_file
+from src.diff.undo_diff_hunk import revert_hunk_on_new_file
+from src.diff.patch_engine import apply_hunks, revert_hunks
+from bench.synthetic import generate_rust_file, mutate, make_diff
+
+
+def _timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(n_lines, n_edits, context, repeat, seed):
+    rng = random.Random(seed)
+    before = generate_rust_file(n_lines, rng)
+    after = mutate(before, n_edits, rng)
+    hunks = parse_diff_hunks(make_diff(before, after, context))
+
+    def legacy_apply():
+        content = before
+        for hunk in hunks:
+            content = apply_hunk_on_new_file(hunk, content)
+        return content
+
+    def legacy_revert():
+        content = after
+        for hunk in hunks:
+            content = revert_hunk_on_new_file(hunk, content)
+        return content
+
+    rows = []
+    for name, fn, expected in (
+        ("legacy_apply", legacy_apply, after),
+        ("engine_apply", lambda: apply_hunks(before, hunks).content, after),
+        ("legacy_revert", legacy_revert, before),
+        ("engine_revert", lambda: revert_hunks(after, hunks).content, before),
+    ):
+        seconds, content = _timed(fn, repeat)
+        correct = content.rstrip("\n") == expected.rstrip("\n")
+        rows.append({"name": name, "seconds": seconds, "correct": correct})
+    return {"lines": len(before.splitlines()), "hunks": len(hunks), "context": context, "results": rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hunk apply/revert implementations.")
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--context", type=int, default=0, help="diff context lines (repo_diff uses --unified=0)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.lines, args.edits, args.context, args.repeat, args.seed)
+    print(f"{report['lines']} lines, {report['hunks']} hunks, context={report['context']}")
+    for row in report["results"]:
+        print(f"{row['name']:<15} {row['seconds'] * 1000:10.2f} ms  correct={row['correct']}")
@@ -0,0 +1,157 @@
+"""
+Recall-vs-latency report for the memory-mapped vector store (src/embed/vector_store.py)
+against the pickled langchain FAISS store.
+
+Documents are canned build logs with clustered random embeddings (no model server).
+Every configuration is loaded and queried in a fresh subprocess so load time and the
+resident memory it adds are measured in isolation. Recall@k is measured against
+exact search over the float32 vectors.
+
+Run from the ForgeGPT directory:
+    python -m bench.bench_vector_store --documents 10000 --dim 768
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench import synthetic
+from bench.fakes import FakeEmbedder
+
+CONFIGS = [
+    ("flat", None), ("flat", "fp16"), ("flat", "pq"),
+    ("ivf", None), ("ivf", "fp16"), ("ivf", "pq"),
+    ("hnsw", None), ("hnsw", "fp16"), ("hnsw", "pq"),
+]
+
+
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+class _FixedEmbedder(FakeEmbedder):
+    """Returns precomputed query vectors in order; documents are never re-embedded here."""
+
+    def __init__(self, queries):
+        super().__init__(queries.shape[1])
+        self.queries = queries
+        self.next = 0
+
+    def embed_query(self, text):
+        vector = self.queries[self.next % len(self.queries)]
+        self.next += 1
+        return vector.tolist()
+
+
+def make_corpus(n_documents, dim, n_queries, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n_documents // 50), dim)).astype(np.float32)
+    assignment = rng.integers(0, len(centers), n_documents)
+    vectors = centers[assignment] + 0.35 * rng.normal(size=(n_documents, dim)).astype(np.float32)
+    queries = centers[rng.integers(0, len(centers), n_queries)] + 0.35 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+    text_rng = random.Random(seed)
+    texts = [synthetic.canned_build_log(text_rng, f"project-{i % 40}", n_errors=2, n_compiling=20, colored=False)
+             for i in range(n_documents)]
+    metadatas = [{"project": f"project-{i % 40}", "file": "src/lib.rs", "hunk_index": i} for i in range(n_documents)]
+    return vectors, queries.astype(np.float32), texts, metadatas
+
+
+def exact_neighbors(vectors, queries, k):
+    distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def child(path, kind, queries_path, k):
+    """Load one store, run all queries and print a JSON row (run in a subprocess)."""
+    queries = np.load(queries_path)
+    embedder = _FixedEmbedder(queries)
+    rss_before = _rss_kb()
+    start = time.perf_counter()
+    if kind == "legacy":
+        from langchain_community.vectorstores import FAISS
+        store = FAISS.load_local(path, embedder, allow_dangerous_deserialization=True)
+    else:
+        from src.embed.vector_store import VectorStore
+        store = VectorStore(path, embedder)
+    load_seconds = time.perf_counter() - start
+    latencies, results = [], []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        docs = store.similarity_search(f"query {i}", k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([doc.metadata["hunk_index"] for doc in docs])
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "rss_mb": (_rss_kb() - rss_before) / 1024,
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000,
+        "results": results,
+    }))
+
+
+def _disk_mb(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2 ** 20
+
+
+def run(n_documents, dim, n_queries, k, seed):
+    from langchain_community.vectorstores import FAISS
+    from src.embed.vector_store import write_vector_store
+    vectors, queries, texts, metadatas = make_corpus(n_documents, dim, n_queries, seed)
+    truth = exact_neighbors(vectors, queries, k)
+    work = tempfile.mkdtemp(prefix="bench_vector_store_")
+    queries_path = os.path.join(work, "queries.npy")
+    np.save(queries_path, queries)
+
+    legacy_path = os.path.join(work, "legacy")
+    FAISS.from_embeddings(list(zip(texts, vectors.tolist())), FakeEmbedder(dim), metadatas=metadatas).save_local(legacy_path)
+    targets = [("legacy", "faiss-pickle", legacy_path)]
+    for index_type, compression in CONFIGS:
+        path = os.path.join(work, f"{index_type}-{compression or 'fp32'}")
+        write_vector_store(path, vectors, texts, metadatas, index_type, compression)
+        targets.append(("store", f"{index_type}/{compression or 'fp32'}", path))
+
+    rows = []
+    for kind, name, path in targets:
+        output = subprocess.check_output(
+            [sys.executable, "-m", "bench.bench_vector_store", "--child", path, kind, queries_path, str(k)],
+            text=True, stderr=subprocess.DEVNULL)
+        row = json.loads(output.strip().splitlines()[-1])
+        hits = sum(len(set(found) & set(expected)) for found, expected in zip(row.pop("results"), truth.tolist()))
+        row.update(name=name, recall=hits / truth.size, disk_mb=_disk_mb(path))
+        rows.append(row)
+    return {"documents": n_documents, "dim": dim, "queries": n_queries, "k": k, "results": rows}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Recall/latency/memory of the vector store index types.")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=768, help="nomic-embed-text produces 768-dim vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.documents, args.dim, args.queries, args.k, args.seed)
+    print(f"{report['documents']} documents, dim {report['dim']}, {report['queries']} queries, recall@{report['k']}")
+    print(f"{'store':<14} {'recall':>7} {'load ms':>9} {'rss MB':>8} {'disk MB':>8} {'median ms':>10} {'p95 ms':>8}")
+    for row in report["results"]:
+        print(f"{row['name']:<14} {row['recall']:7.3f} {row['load_seconds'] * 1000:9.1f} {row['rss_mb']:8.1f} "
+              f"{row['disk_mb']:8.1f} {row['median_ms']:10.3f} {row['p95_ms']:8.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
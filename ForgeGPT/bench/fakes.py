@@ -0,0 +1,147 @@
+"""
+Deterministic stand-ins for the LLM, the embedder, the vector store, the SGX
+builds and docker, so the pipeline's hot paths can be benchmarked offline.
+"""
+import hashlib
+import math
+import os
+import re
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:  # the pure-Python benchmarks do not need langchain
+    Embeddings = object
+
+
+class FakeEmbedder(Embeddings):
+    """
+    Hashing embedder with the embed_documents/embed_query interface of OllamaEmbeddings.
+    Tokens are hashed into `dim` buckets and the vector is L2-normalized.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = [0.0] * self.dim
+        for token in re.findall(r"[A-Za-z_][A-Za-z0-9_]*|E\d{4}", text):
+            digest = hashlib.md5(token.encode()).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._embed(text)
+
+
+class FakeDocument:
+    def __init__(self, page_content, metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+class FakeVectorStore:
+    """
+    Brute-force cosine search over FakeEmbedder vectors; similarity_search mirrors
+    the FAISS vector store call used by generate_hunk.
+    """
+
+    def __init__(self, texts, metadatas, embedder):
+        self.embedder = embedder
+        self.documents = [FakeDocument(t, m) for t, m in zip(texts, metadatas)]
+        self.vectors = embedder.embed_documents(texts)
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        q = self.embedder.embed_query(query)
+        scored = [(sum(a * b for a, b in zip(q, v)), doc) for v, doc in zip(self.vectors, self.documents)]
+        scored.sort(key=lambda item: -item[0])
+        return [(doc, score) for score, doc in scored[:k]]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+
+# 固定的 SGX 迁移补丁，作为假 LLM 的输出
+CANNED_HUNKS = [
+    "@@ -0,0 +1,1 @@\n+#![cfg_attr(not(target_env = \"sgx\"), no_std)]",
+    "@@ -0,0 +1,3 @@\n+#[cfg(not(target_env = \"sgx\"))]\n+#[macro_use]\n+extern crate sgx_tstd as std;",
+    "@@ -0,0 +1,1 @@\n+use std::prelude::v1::*;",
+]
+
+
+class FakeLLM:
+    """
+    Deterministic LLM: summaries for diff-summary prompts, a canned hunk (chosen by
+    the prompt hash) otherwise. Counts calls and approximate prompt/completion tokens.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def invoke(self, prompt):
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        self.calls += 1
+        self.prompt_tokens += len(text) // 4
+        if "summarize the modifications" in text:
+            answer = "Replaced std imports with sgx_tstd and added the no_std prelude."
+        else:
+            digest = int(hashlib.md5(text.encode()).hexdigest(), 16)
+            answer = "```diff\n" + CANNED_HUNKS[digest % len(CANNED_HUNKS)] + "\n```"
+        self.completion_tokens += len(answer) // 4
+        return answer
+
+    __call__ = invoke
+
+
+class FakeBuilder:
+    """
+    Replaces xargo/cargo builds: raises RuntimeError with a canned log for the
+    first `failures` calls, then succeeds.
+    """
+
+    def __init__(self, logs, failures):
+        self.logs = logs
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, work_dir, project_name, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError(self.logs[(self.calls - 1) % len(self.logs)])
+        return f"    Finished release [optimized] target(s) for {project_name}\n"
+
+
+FAKE_DOCKER = """#!/bin/sh
+# docker stand-in: `exec` prints the forwarded variables and sleeps like a build
+[ "$1" = exec ] || exit 0
+shift
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -e) eval "echo \\"$2=\\${$2}\\""; shift 2 ;;
+        -w) shift 2 ;;
+        *) break ;;
+    esac
+done
+sleep "${FAKE_DOCKER_SECONDS:-0.5}"
+echo "    Finished release [optimized] target(s)"
+"""
+
+
+def install_fake_docker(bin_dir):
+    """
+    Write a `docker` executable into bin_dir that stands in for the SGX containers.
+    """
+    path = os.path.join(bin_dir, "docker")
+    with open(path, 'w') as f:
+        f.write(FAKE_DOCKER)
+    os.chmod(path, 0o755)
+    return path
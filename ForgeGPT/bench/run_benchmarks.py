@@ -0,0 +1,526 @@
+"""
+Offline benchmark suite for the pipeline's hot paths.
+
+Every benchmark runs on synthetic inputs (bench/synthetic.py) with a deterministic
+fake LLM and embedder (bench/fakes.py), so no model server, docker container or
+network is needed. Results are written as JSON and two result files can be compared.
+A benchmark that fails is recorded with status "error" and the others still run;
+the exit status is then 1. Temporary directories live until their benchmark ends.
+
+Run from the ForgeGPT directory:
+    python -m bench.run_benchmarks --output bench_results.json
+    python -m bench.run_benchmarks --only patch --repeat 10
+    python -m bench.run_benchmarks --compare old_results.json new_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from bench import synthetic
+from bench.fakes import FakeEmbedder, FakeLLM, FakeBuilder, FakeVectorStore
+
+BENCHMARKS = {}
+_cleanup = None  # ExitStack of the benchmark being run
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function receives the scale factor and
+    returns (fn, params): fn is the zero-argument callable that gets timed.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Skip(Exception):
+    pass
+
+
+def _temp_dir(prefix):
+    """
+    A temporary directory removed when the benchmark being run finishes.
+    """
+    return _cleanup.enter_context(tempfile.TemporaryDirectory(prefix=prefix))
+
+
+def _require(module_name):
+    try:
+        __import__(module_name)
+    except ImportError as e:
+        raise Skip(f"missing dependency: {e}")
+
+
+@benchmark("parse_diff_hunks")
+def bench_parse_diff_hunks(scale):
+    from src.diff.diff_hunk_read import parse_diff_hunks
+    rng = random.Random(0)
+    before = synthetic.generate_rust_file(5000 * scale, rng)
+    diff_text = synthetic.make_diff(before, synthetic.mutate(before, 100 * scale, rng))
+    return (lambda: parse_diff_hunks(diff_text)), {"diff_bytes": len(diff_text)}
+
+
+@benchmark("iter_diff_hunks")
+def bench_iter_diff_hunks(scale):
+    from src.diff.diff_hunk_read import iter_diff_hunks
+    rng = random.Random(0)
+    before = synthetic.generate_rust_file(5000 * scale, rng)
+    diff_text = synthetic.make_diff(before, synthetic.mutate(before, 100 * scale, rng))
+    return (lambda: [hunk.lines for hunk in iter_diff_hunks(diff_text)]), {"diff_bytes": len(diff_text)}
+
+
+def _patch_inputs(scale):
+    from src.diff.diff_hunk_read import parse_diff_hunks
+    rng = random.Random(1)
+    before = synthetic.generate_rust_file(5000 * scale, rng)
+    after = synthetic.mutate(before, 50 * scale, rng)
+    return before, after, parse_diff_hunks(synthetic.make_diff(before, after))
+
+
+@benchmark("patch_apply_legacy")
+def bench_patch_apply_legacy(scale):
+    from src.diff.apply_diff_hunk import apply_hunk_on_new_file
+    before, _, hunks = _patch_inputs(scale)
+
+    def run():
+        content = before
+        for hunk in hunks:
+            content = apply_hunk_on_new_file(hunk, content)
+        return content
+    return run, {"hunks": len(hunks)}
+
+
+@benchmark("patch_apply_engine")
+def bench_patch_apply_engine(scale):
+    from src.diff.patch_engine import apply_hunks
+    before, _, hunks = _patch_inputs(scale)
+    return (lambda: apply_hunks(before, hunks)), {"hunks": len(hunks)}
+
+
+@benchmark("patch_revert_legacy")
+def bench_patch_revert_legacy(scale):
+    from src.diff.undo_diff_hunk import revert_hunk_on_new_file
+    _, after, hunks = _patch_inputs(scale)
+
+    def run():
+        content = after
+        for hunk in hunks:
+            content = revert_hunk_on_new_file(hunk, content)
+        return content
+    return run, {"hunks": len(hunks)}
+
+
+@benchmark("patch_revert_engine")
+def bench_patch_revert_engine(scale):
+    from src.diff.patch_engine import revert_hunks
+    _, after, hunks = _patch_inputs(scale)
+    return (lambda: revert_hunks(after, hunks)), {"hunks": len(hunks)}
+
+
+@benchmark("remove_ansi_colors")
+def bench_remove_ansi_colors(scale):
+    from src.compilation.format import remove_ansi_colors
+    rng = random.Random(2)
+    log = "".join(synthetic.canned_build_log(rng, n_errors=20, n_compiling=200) for _ in range(5 * scale))
+    return (lambda: remove_ansi_colors(log)), {"log_bytes": len(log)}
+
+
+@benchmark("error_extraction")
+def bench_error_extraction(scale):
+    _require("langchain_community")
+    from src.embed.error_embed import get_all_error_texts
+    tmp_dir = _temp_dir("bench_errors_")
+    synthetic.write_deltacompile_corpus(tmp_dir, 10 * scale, 5, 10)
+    return (lambda: get_all_error_texts(tmp_dir)), {"projects": 10 * scale}
+
+
+@benchmark("semantic_group")
+def bench_semantic_group(scale):
+    """
+    Rule/AST grouping of a large diff (no LLM: unclassified groups keep generic summaries).
+    """
+    try:
+        from src.diff.group import semantic_group_diff_actions
+    except Exception as e:  # src.model.chatgpt builds its client at import time
+        raise Skip(f"cannot import src.diff.group: {e}")
+    rng = random.Random(0)
+    before = synthetic.generate_rust_file(5000 * scale, rng)
+    after = synthetic.mutate(before, 100 * scale, rng)
+    diff_text = synthetic.make_diff(before, after)
+    return (lambda: semantic_group_diff_actions(diff_text, after, use_llm=False)), {"diff_bytes": len(diff_text)}
+
+
+@benchmark("semantic_revert")
+def bench_semantic_revert(scale):
+    """
+    Mechanical revert of every semantic group of a large diff (no LLM).
+    """
+    try:
+        from src.diff.group import semantic_group_diff_actions
+        from src.diff.undo_diff import revert_semantic_group
+    except Exception as e:
+        raise Skip(f"cannot import src.diff.undo_diff: {e}")
+    rng = random.Random(0)
+    before = synthetic.generate_rust_file(5000 * scale, rng)
+    after = synthetic.mutate(before, 100 * scale, rng)
+    diff_text = synthetic.make_diff(before, after)
+    groups = semantic_group_diff_actions(diff_text, after, use_llm=False)
+
+    def run():
+        return [revert_semantic_group(diff_text, after, group) for group in groups]
+    return run, {"groups": len(groups)}
+
+
+@benchmark("build_scheduler")
+def bench_build_scheduler(scale):
+    """
+    Four concurrent make builds of 8 short jobs each sharing the scheduler's jobserver.
+    """
+    import shutil
+    from src.compilation.scheduler import BuildScheduler
+    if shutil.which("make") is None:
+        raise Skip("make is not installed")
+    work_dir = _temp_dir("bench-scheduler-")
+    with open(os.path.join(work_dir, "Makefile"), 'w') as f:
+        f.write(f"all: $(addprefix job,1 2 3 4 5 6 7 8)\njob%:\n\t@sleep {0.02 * scale:.2f}\n")
+    scheduler = BuildScheduler(cpus=4, memory_mb=1 << 20)
+
+    def build(project):
+        with scheduler.slot(project, containerized=False) as slot:
+            subprocess.run(["make", "-s", "-C", work_dir], env={**os.environ, **slot.env},
+                           pass_fds=slot.pass_fds, check=True)
+
+    def run():
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(build, [f"project-{i}" for i in range(4)]))
+        return scheduler.report()
+    return run, {"builds": 4, "jobs": 32, "cpus": 4}
+
+
+@benchmark("build_scheduler_container")
+def bench_build_scheduler_container(scale):
+    """
+    Four concurrent containerized builds, then one alone, through run_sgx_helper and a
+    user-style helper that knows nothing of the build environment, with a fake docker
+    that sleeps like a build. Every build must see its CARGO_BUILD_JOBS (forwarded by
+    docker_env.sh) and the build alone gets every core.
+    """
+    from bench.fakes import install_fake_docker
+    from src.compilation import compile as compile_module
+    from src.compilation import scheduler as scheduler_module
+    if not os.path.exists("/bin/bash"):
+        raise Skip("bash is not installed")
+    work_dir = _temp_dir("bench-container-")
+    bin_dir = _temp_dir("bench-docker-")
+    install_fake_docker(bin_dir)
+    helpers = os.path.join(bin_dir, "helpers.sh")
+    with open(helpers, 'w') as f:
+        # 与 .bashrc 中的脚本一样，只调用 docker exec
+        f.write('docker-sgx-xargo-build() { docker exec -w "/root/$2/$1" forge-sgx-xargo bash -lc make 2>&1; }\n')
+    seconds = 0.2 * scale
+    scheduler = scheduler_module.BuildScheduler(cpus=4, memory_mb=1 << 20)
+
+    def run():
+        from concurrent.futures import ThreadPoolExecutor
+        saved = {name: os.environ.get(name) for name in ("PATH", "FAKE_DOCKER_SECONDS", "FORGE_BUILD_CACHE")}
+        os.environ.update(PATH=bin_dir + os.pathsep + os.environ["PATH"], FAKE_DOCKER_SECONDS=f"{seconds:.2f}",
+                          FORGE_BUILD_CACHE="0")
+        previous, scheduler_module._SCHEDULER = scheduler_module._SCHEDULER, scheduler
+        previous_helpers, compile_module.SGX_HELPERS = compile_module.SGX_HELPERS, helpers
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    outputs = list(pool.map(lambda p: compile_module.run_sgx_helper(work_dir, p, "xargo"),
+                                            [f"project-{i}" for i in range(4)]))
+                alone = compile_module.run_sgx_helper(work_dir, "straggler", "xargo")
+        finally:
+            scheduler_module._SCHEDULER = previous
+            compile_module.SGX_HELPERS = previous_helpers
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        # 每个构建都要在容器里看到自己的 CARGO_BUILD_JOBS
+        jobs = [int(re.search(r"CARGO_BUILD_JOBS=(\d+)", output).group(1)) for output in outputs]
+        assert "CARGO_BUILD_JOBS=4" in alone, (outputs, alone)
+        return dict(scheduler.report(), jobs=jobs)
+    return run, {"builds": 4, "cpus": 4, "seconds_per_build": seconds}
+
+
+def _error_documents(scale):
+    rng = random.Random(3)
+    texts = [synthetic.canned_build_log(rng, n_errors=2, n_compiling=3, colored=False) for _ in range(200 * scale)]
+    metadatas = [{"project": f"project-{i % 20}", "file": "src/lib.rs", "hunk_index": i} for i in range(len(texts))]
+    return texts, metadatas
+
+
+@benchmark("index_build")
+def bench_index_build(scale):
+    _require("faiss")
+    _require("langchain_community")
+    from langchain_community.vectorstores import FAISS
+    texts, metadatas = _error_documents(scale)
+    embedder = FakeEmbedder()
+    return (lambda: FAISS.from_texts(texts, embedder, metadatas=metadatas)), {"documents": len(texts)}
+
+
+@benchmark("index_stream_build")
+def bench_index_stream_build(scale):
+    """
+    Streaming batched build of the same documents, each repeated by 3 projects (deduped by content).
+    """
+    _require("faiss")
+    from src.embed.index_builder import StreamingIndexBuilder
+    texts, metadatas = _error_documents(scale)
+    embedder = FakeEmbedder()
+    tmp_dir = _temp_dir("bench_stream_")
+
+    def run():
+        builder = StreamingIndexBuilder(os.path.join(tmp_dir, "store"), embedder, batch_size=64)
+        for copy in range(3):
+            for text, metadata in zip(texts, metadatas):
+                builder.add(text, dict(metadata, project=f"{metadata['project']}-fork{copy}"))
+        return builder.finish()
+    return run, {"documents": 3 * len(texts)}
+
+
+@benchmark("index_query")
+def bench_index_query(scale):
+    _require("faiss")
+    _require("langchain_community")
+    from langchain_community.vectorstores import FAISS
+    texts, metadatas = _error_documents(scale)
+    embedder = FakeEmbedder()
+    vectordb = FAISS.from_texts(texts, embedder, metadatas=metadatas)
+    queries = texts[:50]
+    return (lambda: [vectordb.similarity_search(q, k=4) for q in queries]), {"documents": len(texts), "queries": len(queries)}
+
+
+def _hybrid_retriever(texts, metadatas, embedder):
+    from src.embed.hybrid_retriever import HybridRetriever
+    from src.embed.vector_store import build_vector_store
+    store = build_vector_store(texts, metadatas, embedder, _temp_dir("bench_store_"))
+    return HybridRetriever(store)
+
+
+@benchmark("hybrid_query")
+def bench_hybrid_query(scale):
+    """
+    HybridRetriever over the same documents as index_query: lexical lookups answer
+    exact error matches, the rest are fused with vector search.
+    """
+    _require("faiss")
+    _require("langchain_core")
+    texts, metadatas = _error_documents(scale)
+    retriever = _hybrid_retriever(texts, metadatas, FakeEmbedder())
+    queries = texts[:50]
+    return (lambda: [retriever.search(q, k=4) for q in queries]), {"documents": len(texts), "queries": len(queries)}
+
+
+def _generate_hunk_fixture(scale):
+    _require("langchain_community")
+    try:
+        from src.migration import migrate
+    except Exception as e:  # the model modules build their clients at import time
+        raise Skip(f"cannot import src.migration.migrate: {e}")
+    rng = random.Random(4)
+    repo_path = synthetic.generate_crate(_temp_dir("bench_migrate_"), "demo-sgx", 1, 2000 * scale)
+    with open(os.path.join(repo_path, "src", "lib.rs")) as f:
+        rust_code = f.read()
+    logs = [synthetic.canned_build_log(rng, "demo-sgx") for _ in range(4)]
+    embedder = FakeEmbedder()
+    texts, metadatas = _error_documents(1)
+    reference_diff = synthetic.make_diff(rust_code[:2000], synthetic.mutate(rust_code[:2000], 5, rng))
+    for metadata in metadatas:
+        metadata.update(original_code=rust_code[:2000], git_diff=reference_diff)
+    try:
+        _require("faiss")
+        vectordb = _hybrid_retriever(texts, metadatas, embedder)
+    except Skip:
+        vectordb = FakeVectorStore(texts, metadatas, embedder)
+
+    def run_generate_hunk(builder, memo):
+        llm = FakeLLM()
+        patched = {
+            "verify_sgx_project": builder,
+            "get_reference_example_from_metadata": lambda metadata: (metadata["original_code"], metadata["git_diff"]),
+            "get_fix_memo": lambda: memo,
+        }
+        saved = {name: getattr(migrate, name) for name in patched}
+        try:
+            for name, value in patched.items():
+                setattr(migrate, name, value)
+            with contextlib.redirect_stdout(io.StringIO()):
+                migrate.generate_hunk(rust_code, repo_path, "src/lib.rs", vectordb, embedder, llm)
+        finally:
+            for name, value in saved.items():
+                setattr(migrate, name, value)
+        return llm.calls
+    return rust_code, logs, run_generate_hunk
+
+
+@benchmark("prompt_slice")
+def bench_prompt_slice(scale):
+    """
+    Slice a large file around the diagnostic spans of a build log for the repair prompt.
+    """
+    from src.migration.slicer import slice_source
+    rng = random.Random(4)
+    repo_path = synthetic.generate_crate(_temp_dir("bench_slice_"), "demo-sgx", 1, 2000 * scale)
+    with open(os.path.join(repo_path, "src", "lib.rs")) as f:
+        rust_code = f.read()
+    log = synthetic.canned_build_log(rng, "demo-sgx")
+    excerpt = slice_source(rust_code, log, "src/lib.rs")
+    return (lambda: slice_source(rust_code, log, "src/lib.rs")), {
+        "file_lines": len(excerpt.lines), "kept_lines": excerpt.kept_lines,
+        "file_chars": len(rust_code), "prompt_chars": len(excerpt.text)}
+
+
+@benchmark("generate_hunk_loop")
+def bench_generate_hunk_loop(scale):
+    """
+    generate_hunk with two failing builds before success: retrieval, diff summary,
+    hunk generation and patch application run for real, builds and LLM are fakes.
+    """
+    from src.migration.fix_memo import FixMemo
+    rust_code, logs, run_generate_hunk = _generate_hunk_fixture(scale)
+    # 每次都用空的 fix memo，测的是检索 + LLM 的路径
+    run = lambda: run_generate_hunk(FakeBuilder(logs, failures=2), FixMemo(None, seed=False))
+    return run, {"file_lines": len(rust_code.splitlines()), "failing_builds": 2}
+
+
+@benchmark("generate_hunk_memo_hit")
+def bench_generate_hunk_memo_hit(scale):
+    """
+    generate_hunk for an error whose fix is already in the fix memo: one failing
+    build, then the memoized patch is applied and verified without retrieval or LLM.
+    """
+    from src.migration.fix_memo import FixMemo
+    rust_code, logs, run_generate_hunk = _generate_hunk_fixture(scale)
+    memo = FixMemo(None, seed=False)
+    fixed = "\n".join(["#![cfg_attr(not(target_env = \"sgx\"), no_std)]", rust_code])
+    memo.learn(logs[0], "src/lib.rs", rust_code, fixed)
+
+    def run():
+        llm_calls = run_generate_hunk(FakeBuilder(logs, failures=1), memo)
+        assert llm_calls == 0, "the memoized fix was not used"
+        return llm_calls
+    return run, {"file_lines": len(rust_code.splitlines()), "failing_builds": 1}
+
+
+def _run_one(setup, scale, repeat, warmup):
+    global _cleanup
+    with contextlib.ExitStack() as _cleanup:
+        try:
+            fn, params = setup(scale)
+            for _ in range(warmup):
+                fn()
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+        finally:
+            _cleanup = None
+    return {
+        "status": "ok",
+        "params": params,
+        "repeat": repeat,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def run_benchmarks(names=None, scale=1, repeat=5, warmup=1):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        try:
+            results[name] = _run_one(setup, scale, repeat, warmup)
+        except Skip as e:
+            results[name] = {"status": "skipped", "reason": str(e)}
+        except Exception as e:
+            # 一个基准失败不影响其它基准
+            traceback.print_exc()
+            results[name] = {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+        print(f"{name:<24} {_format_row(results[name])}", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+        },
+        "benchmarks": results,
+    }
+
+
+def _format_row(row):
+    if row["status"] != "ok":
+        return f"{row['status']}: {row.get('reason', '')}"
+    return f"median {row['median'] * 1000:10.3f} ms  min {row['min'] * 1000:10.3f} ms"
+
+
+def compare(base_path, new_path):
+    """
+    Print the median time ratio (new / base) of every benchmark present in both files.
+    """
+    with open(base_path) as f:
+        base = json.load(f)["benchmarks"]
+    with open(new_path) as f:
+        new = json.load(f)["benchmarks"]
+    print(f"{'benchmark':<24} {'base ms':>10} {'new ms':>10} {'ratio':>8}")
+    for name in sorted(set(base) | set(new)):
+        b, n = base.get(name), new.get(name)
+        if not b or not n or b["status"] != "ok" or n["status"] != "ok":
+            print(f"{name:<24} {'-':>10} {'-':>10} {'n/a':>8}")
+            continue
+        ratio = n["median"] / b["median"] if b["median"] else float("inf")
+        print(f"{name:<24} {b['median'] * 1000:10.3f} {n['median'] * 1000:10.3f} {ratio:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--only", nargs="*", help="run benchmarks whose name contains any of these")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        report = run_benchmarks(args.only, args.scale, args.repeat, args.warmup)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved benchmark results to {args.output}", file=sys.stderr)
+        if any(row["status"] == "error" for row in report["benchmarks"].values()):
+            sys.exit(1)
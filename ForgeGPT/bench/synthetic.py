@@ -0,0 +1,154 @@
+"""
+Synthetic inputs for the offline benchmarks: Rust sources, diffs, change corpora
+and canned build logs. Everything is generated from a seed so runs are comparable.
+"""
+import difflib
+import json
+import os
+import random
+
+
+def generate_rust_file(n_lines, rng):
+    """
+    Generate a Rust source file of roughly n_lines lines made of small functions,
+    with the repetitive structure (closing braces, blank lines) real crates have.
+    """
+    lines = ["#![allow(dead_code)]", "use std::vec::Vec;", ""]
+    i = 0
+    while len(lines) < n_lines:
+        lines.append(f"pub fn item_{i}(input: &[u8]) -> Vec<u8> {{")
+        for j in range(rng.randint(2, 8)):
+            lines.append(f"    let v{j} = input.len() + {rng.randint(0, 1000)};")
+        lines.append("    input.to_vec()")
+        lines.append("}")
+        lines.append("")
+        i += 1
+    return "\n".join(lines) + "\n"
+
+
+def mutate(content, n_edits, rng):
+    """
+    Apply n_edits random line insertions, deletions and modifications.
+    """
+    lines = content.splitlines()
+    for k in range(n_edits):
+        pos = rng.randrange(len(lines))
+        op = rng.choice(("insert", "delete", "modify"))
+        if op == "insert":
+            lines.insert(pos, f"    // sgx port {k}")
+        elif op == "delete":
+            del lines[pos]
+        else:
+            lines[pos] = lines[pos].replace("std::", "sgx_tstd::") + f" // edit {k}"
+    return "\n".join(lines) + "\n"
+
+
+def make_diff(before, after, context=0, rel_file="src/lib.rs"):
+    """
+    Unified diff between two contents, with a `diff --git` header like repo_diff.py output.
+    """
+    return f"diff --git a/{rel_file} b/{rel_file}\n" + "".join(difflib.unified_diff(
+        before.splitlines(True), after.splitlines(True), f"a/{rel_file}", f"b/{rel_file}", n=context))
+
+
+def generate_crate(directory, name, n_files, lines_per_file, seed=0):
+    """
+    Write a minimal Cargo crate (Cargo.toml + src/*.rs) and return its path.
+    """
+    rng = random.Random(seed)
+    crate_dir = os.path.join(directory, name)
+    os.makedirs(os.path.join(crate_dir, "src"), exist_ok=True)
+    with open(os.path.join(crate_dir, "Cargo.toml"), "w") as f:
+        f.write(f'[package]\nname = "{name}"\nversion = "0.1.0"\nedition = "2018"\n\n[dependencies]\n')
+    modules = [f"module_{i}" for i in range(1, n_files)]
+    with open(os.path.join(crate_dir, "src", "lib.rs"), "w") as f:
+        f.write("".join(f"pub mod {m};\n" for m in modules))
+        f.write(generate_rust_file(lines_per_file, rng))
+    for m in modules:
+        with open(os.path.join(crate_dir, "src", f"{m}.rs"), "w") as f:
+            f.write(generate_rust_file(lines_per_file, rng))
+    return crate_dir
+
+
+def write_changes_corpus(directory, n_projects, files_per_project, lines_per_file, seed=0):
+    """
+    Write {project}.json files shaped like repo_diff.py output: {rel_file: {"git_diff": text}}.
+    """
+    rng = random.Random(seed)
+    for p in range(n_projects):
+        changes = {}
+        for f in range(files_per_project):
+            before = [f"    let value_{i} = compute({i});\n" for i in range(lines_per_file)]
+            after = list(before)
+            for k in range(rng.randint(5, 40)):
+                # SGX ports mostly touch small blocks (imports, cfg attributes, helper bodies)
+                pos = rng.randrange(len(after))
+                after[pos:pos + rng.randint(1, 8)] = [
+                    f"    let value_{k}_{j} = sgx_compute({k});\n" for j in range(rng.randint(1, 12))]
+            rel_file = f"src/module_{f}.rs"
+            changes[rel_file] = {"git_diff": make_diff("".join(before), "".join(after), 0, rel_file)}
+        with open(os.path.join(directory, f"project-{p}-sgx.json"), "w") as fp:
+            json.dump(changes, fp)
+
+
+_RED = "\x1b[0m\x1b[1m\x1b[38;5;9m"
+_BLUE = "\x1b[0m\x1b[1m\x1b[38;5;12m"
+_GREEN = "\x1b[0m\x1b[1m\x1b[32m"
+_RESET = "\x1b[0m"
+
+# (code, message, snippet) modelled on the errors met when porting crates to the SGX SDK
+ERROR_TEMPLATES = [
+    ("E0433", "failed to resolve: use of undeclared crate or module `std`", "use std::collections::HashMap;"),
+    ("E0432", "unresolved import `std::sync::Mutex`", "use std::sync::Mutex;"),
+    ("E0463", "can't find crate for `std`", "extern crate std;"),
+    ("E0425", "cannot find function `getrandom` in crate `libc`", "libc::getrandom(buf, len, 0)"),
+    ("E0412", "cannot find type `Vec` in this scope", "fn collect() -> Vec<u8> {"),
+    ("E0599", "no method named `to_string` found for reference `&str` in the current scope", "name.to_string()"),
+]
+
+
+def canned_build_log(rng, project="demo-sgx", n_errors=3, n_compiling=40, colored=True):
+    """
+    A cargo/xargo build log with `Compiling` lines and rustc diagnostics.
+    """
+    red, blue, green, reset = (_RED, _BLUE, _GREEN, _RESET) if colored else ("", "", "", "")
+    out = [f"{green}    Updating{reset} git repository `https://github.com/apache/teaclave-sgx-sdk.git`"]
+    for i in range(n_compiling):
+        out.append(f"{green}   Compiling{reset} dep_{i} v0.{i}.0")
+    out.append(f"{green}   Compiling{reset} {project} v0.1.0 (/root/sgx/{project})")
+    for _ in range(n_errors):
+        code, message, snippet = rng.choice(ERROR_TEMPLATES)
+        line = rng.randint(1, 2000)
+        col = rng.randint(1, 40)
+        out.append(f"{red}error[{code}]{reset}: {message}")
+        out.append(f"{blue}  --> {reset}src/lib.rs:{line}:{col}")
+        out.append(f"{blue}   |{reset}")
+        out.append(f"{blue}{line:<4}|{reset} {snippet}")
+        out.append(f"{blue}   |{reset}     {red}^^^^{reset}")
+        out.append("")
+    out.append(f"{red}error{reset}: aborting due to {n_errors} previous errors")
+    out.append(f"{red}error{reset}: could not compile `{project}`")
+    return "\n".join(out) + "\n"
+
+
+def write_deltacompile_corpus(directory, n_projects, files_per_project, hunks_per_file, seed=0):
+    """
+    Write {project}.deltacompile.json files in the delta_compile output schema.
+    """
+    rng = random.Random(seed)
+    for p in range(n_projects):
+        project = f"project-{p}-sgx"
+        results = {}
+        for f in range(files_per_project):
+            entries = []
+            for idx in range(hunks_per_file):
+                hunk = f"-use std::vec::Vec;\n+use sgx_tstd::vec::Vec; // {idx}"
+                for toolchain in ("xargo", "cargo"):
+                    if rng.random() < 0.6:
+                        entries.append({"hunk_index": idx, "hunk": hunk, f"{toolchain}_compilable": False,
+                                        f"{toolchain}_error": canned_build_log(rng, project, n_compiling=5)})
+                    else:
+                        entries.append({"hunk_index": idx, "hunk": hunk, f"{toolchain}_compilable": True})
+            results[f"src/module_{f}.rs"] = entries
+        with open(os.path.join(directory, f"{project}.deltacompile.json"), "w") as fp:
+            json.dump(results, fp)
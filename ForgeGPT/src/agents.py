@@ -1,5 +1,15 @@
+import json
+import operator
+import os
+import threading
+import time
+from typing import Annotated, TypedDict
+
 from langchain.agents import Tool, initialize_agent, AgentType
 from langchain.llms import OpenAI  # 你可以替换为本地模型或其他 LLM
+from langgraph.graph import StateGraph, START, END
+
+from src.compilation.session import BuildSession
 
 class LibraryAnalysisAgent:
     def analyze(self, library_path: str) -> dict:
@@ -21,24 +31,112 @@ class LibraryValidationAgent:
         # TODO: 编译和单元测试，返回验证结果
         return True
 
-class LibraryEvolutionAgent:
+class EnvironmentSetupAgent:
+    """
+    Build environment (a BuildSession) of a library's work dir. setup has no side
+    effects; the docker-sgx-xargo/cargo containers start on the first session() call
+    and stay up until teardown.
+    """
     def __init__(self):
+        self.sessions = {}
+        self._open = set()
+        self._lock = threading.Lock()
+
+    def setup(self, library_path: str) -> dict:
+        with self._lock:
+            session = self.sessions.get(library_path)
+            if session is None:
+                session = self.sessions[library_path] = BuildSession(library_path)
+        return {"work_dir": session.work_dir, "project": session.project_name}
+
+    def session(self, library_path: str) -> BuildSession:
+        """
+        The open session of library_path, starting its containers on first use.
+        """
+        with self._lock:
+            session = self.sessions.get(library_path)
+            if session is None:
+                session = self.sessions[library_path] = BuildSession(library_path)
+            if library_path not in self._open:
+                session.open()
+                self._open.add(library_path)
+        return session
+
+    def teardown(self, library_path: str = None):
+        """
+        Close the session of library_path, or every session when None.
+        """
+        with self._lock:
+            paths = [library_path] if library_path else list(self.sessions)
+            for path in paths:
+                session = self.sessions.pop(path, None)
+                if path in self._open:
+                    self._open.discard(path)
+                    session.close()
+
+class ToolCache:
+    """
+    Memoized tool results keyed by tool name and JSON-encoded arguments.
+    """
+    def __init__(self):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def call(self, name, func, *args):
+        key = (name, json.dumps(args, sort_keys=True, default=str))
+        with self._lock:
+            if key in self.results:
+                self.hits += 1
+                return self.results[key]
+        result = func(*args)
+        with self._lock:
+            self.misses += 1
+            self.results[key] = result
+        return result
+
+def _merge(left, right):
+    return {**(left or {}), **(right or {})}
+
+class EvolutionState(TypedDict, total=False):
+    library_path: str
+    analysis: dict
+    knowledge: dict
+    environment: dict
+    migrated_path: str
+    valid: bool
+    attempts: int
+    decision: str
+    # 并行分支各自写入耗时，按 key 合并
+    timings: Annotated[dict, _merge]
+    llm_calls: Annotated[int, operator.add]
+
+PLAN_PROMPT = """Validation of the TEE migration of the Rust library {library_path} failed after {attempts} attempt(s).
+Migration advice used: {knowledge}
+Should the migration be retried with the same inputs? Answer with exactly one word: RETRY or STOP."""
+
+class LibraryEvolutionAgent:
+    def __init__(self, llm=None, max_attempts=3):
         self.analysis_agent = LibraryAnalysisAgent()
         self.expert_agent = MigrationExpertAgent()
         self.migration_agent = LibraryMigrationAgent()
         self.validation_agent = LibraryValidationAgent()
-        self.llm = OpenAI(temperature=0)  # 你可以替换为本地 LLM
+        self.environment_agent = EnvironmentSetupAgent()
+        self.llm = llm or OpenAI(temperature=0)  # 你可以替换为本地 LLM
+        self.max_attempts = max_attempts
+        self.cache = ToolCache()
 
         # 定义每个 agent 的工具包装
         self.tools = [
             Tool(
                 name="LibraryAnalysis",
-                func=lambda path: self.analysis_agent.analyze(path),
+                func=lambda path: self.cache.call("LibraryAnalysis", self.analysis_agent.analyze, path),
                 description="分析 Rust 库依赖"
             ),
             Tool(
                 name="MigrationExpert",
-                func=lambda analysis: self.expert_agent.provide_migration_knowledge(analysis),
+                func=lambda analysis: self.cache.call("MigrationExpert", self.expert_agent.provide_migration_knowledge, analysis),
                 description="提供迁移建议"
             ),
             Tool(
@@ -59,9 +157,100 @@ class LibraryEvolutionAgent:
             verbose=True
         )
 
+        self.graph = self._build_graph()
+
     def evolve(self, upstream_library_path: str):
         # 这里可以通过 agent.run 触发多 agent 协作
         result = self.agent.run(f"迁移并验证 Rust 库 {upstream_library_path} 到 TEE 环境")
         return result
 
+    def _timed(self, name, update_fn):
+        def node(state):
+            start = time.perf_counter()
+            update = update_fn(state)
+            update["timings"] = {name: time.perf_counter() - start}
+            return update
+        return node
+
+    def _analyze(self, state):
+        return {"analysis": self.cache.call("LibraryAnalysis", self.analysis_agent.analyze, state["library_path"])}
+
+    def _retrieve_knowledge(self, state):
+        # 迁移知识只按库检索，不等待依赖分析
+        query = {"library_path": state["library_path"]}
+        return {"knowledge": self.cache.call("MigrationExpert", self.expert_agent.provide_migration_knowledge, query)}
+
+    def _setup_environment(self, state):
+        # 容器有状态，不走 ToolCache；只记录会话，迁移/验证真正构建时才启动容器
+        return {"environment": self.environment_agent.setup(state["library_path"])}
+
+    def _migrate(self, state):
+        path = self.migration_agent.migrate(state["analysis"], state["knowledge"])
+        return {"migrated_path": path, "attempts": state.get("attempts", 0) + 1}
+
+    def _validate(self, state):
+        return {"valid": self.validation_agent.validate(state["migrated_path"])}
+
+    def _plan(self, state):
+        # 只有验证失败、下一步需要判断时才调用 LLM
+        if state["attempts"] >= self.max_attempts:
+            return {"decision": "STOP"}
+        answer = self.llm.invoke(PLAN_PROMPT.format(
+            library_path=state["library_path"], attempts=state["attempts"], knowledge=state["knowledge"]))
+        answer = answer if isinstance(answer, str) else getattr(answer, "content", str(answer))
+        return {"decision": "RETRY" if "RETRY" in answer.upper() else "STOP", "llm_calls": 1}
+
+    def _build_graph(self):
+        """
+        analyze, retrieve_knowledge and setup_environment run in parallel from START,
+        migrate waits for all three, then validate. Only a failed validation goes
+        through the LLM (plan), which decides between another migration and stopping.
+        """
+        graph = StateGraph(EvolutionState)
+        nodes = {
+            "analyze": self._analyze,
+            "retrieve_knowledge": self._retrieve_knowledge,
+            "setup_environment": self._setup_environment,
+            "migrate": self._migrate,
+            "validate": self._validate,
+            "plan": self._plan,
+        }
+        for name, fn in nodes.items():
+            graph.add_node(name, self._timed(name, fn))
+        for branch in ("analyze", "retrieve_knowledge", "setup_environment"):
+            graph.add_edge(START, branch)
+        graph.add_edge(["analyze", "retrieve_knowledge", "setup_environment"], "migrate")
+        graph.add_edge("migrate", "validate")
+        graph.add_conditional_edges("validate", lambda state: END if state["valid"] else "plan", ["plan", END])
+        graph.add_conditional_edges("plan", lambda state: "migrate" if state["decision"] == "RETRY" else END, ["migrate", END])
+        return graph.compile()
+
+    def evolve_graph(self, upstream_library_path: str) -> dict:
+        """
+        Run the task graph for one library. Returns the final state with the
+        per-node "timings", "llm_calls" and the end-to-end "seconds".
+        """
+        start = time.perf_counter()
+        try:
+            state = self.graph.invoke({"library_path": upstream_library_path, "timings": {}, "llm_calls": 0})
+        finally:
+            self.environment_agent.teardown(upstream_library_path)
+        state["seconds"] = time.perf_counter() - start
+        return state
+
+    def compare_latency(self, library_paths):
+        """
+        {library_path: {"react_seconds", "graph_seconds"}} for the ReAct loop and the task graph.
+        """
+        results = {}
+        for path in library_paths:
+            # 两种执行方式都从空缓存开始
+            self.cache = ToolCache()
+            start = time.perf_counter()
+            self.evolve(path)
+            react_seconds = time.perf_counter() - start
+            self.cache = ToolCache()
+            results[path] = {"react_seconds": react_seconds, "graph_seconds": self.evolve_graph(path)["seconds"]}
+        return results
+
 # ...existing code...
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Shared cache of the compiled dependency crates (sgx_tstd and friends) across the
+forked projects and their trials.
+
+Every build gets RUSTC_WRAPPER=rustc_wrapper.py (see there for what is cached and
+how it is keyed) and FORGE_RUSTC_CACHE=<cache>/<toolchain>, so a dependency is
+compiled once per toolchain rather than once per project per trial. BuildSession
+creates the containers with the cache directory mounted at `mount`
+(compile.container_env; FORGE_BUILD_CACHE_MOUNT, default the same path) and
+run_sgx_helper passes the variables of BuildCache.env into them with
+`docker exec -e` (docker_env.sh). The wrapper needs python3 in the containers.
+
+The cache is kept under FORGE_BUILD_CACHE_GB by removing the least recently used
+entries; hits and misses are counted from each toolchain's events.log.
+
+    cache = get_build_cache("forked_repo")
+    env = cache.env("xargo")
+    cache.prune()
+    cache.stats()   # {"xargo": {"hits": 412, "misses": 37, "hit_rate": 0.92, ...}}
+"""
+import os
+import shutil
+import threading
+import time
+
+WRAPPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rustc_wrapper.py")
+MAX_CACHE_GB = float(os.getenv("FORGE_BUILD_CACHE_GB", "20"))
+STALE_STAGING_SECONDS = 3600
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class BuildCache:
+    """
+    :param root: cache directory on the host
+    :param mount: the same directory as seen inside the build containers (default: root)
+    :param max_bytes: size prune() keeps the cache under
+    """
+
+    def __init__(self, root, mount=None, max_bytes=int(MAX_CACHE_GB * (1 << 30))):
+        self.root = os.path.abspath(root)
+        self.mount = mount or self.root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.install()
+
+    def install(self):
+        """
+        Copy the wrapper into the cache directory, where the containers can run it.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        target = os.path.join(self.root, "rustc_wrapper.py")
+        with open(WRAPPER, 'rb') as f:
+            source = f.read()
+        if os.path.isfile(target):
+            with open(target, 'rb') as f:
+                if f.read() == source:
+                    return
+        with open(target + ".tmp", 'wb') as f:
+            f.write(source)
+        os.chmod(target + ".tmp", 0o755)
+        os.replace(target + ".tmp", target)
+
+    def env(self, toolchain):
+        return {
+            "RUSTC_WRAPPER": f"{self.mount}/rustc_wrapper.py",
+            "FORGE_RUSTC_CACHE": f"{self.mount}/{toolchain}",
+            # 增量编译的产物无法复用，缓存的依赖也用不上
+            "CARGO_INCREMENTAL": "0",
+        }
+
+    def toolchains(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _entries(self, toolchain=None):
+        """
+        (path, last used) of every cache entry, oldest first.
+        """
+        entries = []
+        for name in [toolchain] if toolchain else self.toolchains():
+            entries_dir = os.path.join(self.root, name, "entries")
+            if not os.path.isdir(entries_dir):
+                continue
+            for shard in os.listdir(entries_dir):
+                shard_dir = os.path.join(entries_dir, shard)
+                for key in os.listdir(shard_dir):
+                    path = os.path.join(shard_dir, key)
+                    if key.startswith(".tmp-"):
+                        # 写入中途被杀掉的暂存目录
+                        if time.time() - os.stat(path).st_mtime > STALE_STAGING_SECONDS:
+                            shutil.rmtree(path, ignore_errors=True)
+                        continue
+                    entries.append((path, os.stat(path).st_mtime))
+        entries.sort(key=lambda entry: entry[1])
+        return entries
+
+    def stats(self):
+        """
+        Hits, misses, hit rate, entries and bytes per toolchain.
+        """
+        result = {}
+        for toolchain in self.toolchains():
+            counts = {"hit": 0, "miss": 0}
+            log_path = os.path.join(self.root, toolchain, "events.log")
+            if os.path.isfile(log_path):
+                with open(log_path, 'r') as f:
+                    for line in f:
+                        event = line.split(' ', 1)[0]
+                        if event in counts:
+                            counts[event] += 1
+            lookups = counts["hit"] + counts["miss"]
+            result[toolchain] = {
+                "hits": counts["hit"],
+                "misses": counts["miss"],
+                "hit_rate": counts["hit"] / lookups if lookups else 0.0,
+                "entries": len(self._entries(toolchain)),
+                "bytes": _dir_size(os.path.join(self.root, toolchain)),
+            }
+        return result
+
+    def prune(self, max_bytes=None):
+        """
+        Remove the least recently used entries until the cache is under max_bytes.
+        Returns (entries removed, bytes freed).
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = [(path, _dir_size(path)) for path, _ in self._entries()]
+            total = sum(size for _, size in entries)
+            removed = freed = 0
+            for path, size in entries:
+                if total - freed <= max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                freed += size
+            return removed, freed
+
+    def clear(self, toolchain=None):
+        with self._lock:
+            for name in [toolchain] if toolchain else self.toolchains():
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+_CACHES = {}
+_caches_lock = threading.Lock()
+
+
+def get_build_cache(work_dir):
+    """
+    The cache shared by the builds under work_dir, in FORGE_BUILD_CACHE_DIR or
+    <work_dir>/.forge-build-cache; None when FORGE_BUILD_CACHE=0.
+    """
+    if os.getenv("FORGE_BUILD_CACHE", "1") == "0":
+        return None
+    root = os.path.abspath(os.getenv("FORGE_BUILD_CACHE_DIR") or os.path.join(work_dir, ".forge-build-cache"))
+    with _caches_lock:
+        if root not in _CACHES:
+            _CACHES[root] = BuildCache(root, os.getenv("FORGE_BUILD_CACHE_MOUNT"))
+        return _CACHES[root]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Inspect or clean the shared dependency build cache.")
+    parser.add_argument("work_dir", nargs="?", default="forked_repo")
+    parser.add_argument("--prune", action="store_true", help="remove least recently used entries above FORGE_BUILD_CACHE_GB")
+    parser.add_argument("--clear", action="store_true", help="remove every entry")
+    parser.add_argument("--toolchain", help="with --clear: only this toolchain")
+    args = parser.parse_args()
+
+    cache = get_build_cache(args.work_dir)
+    if cache is None:
+        raise SystemExit("the build cache is disabled (FORGE_BUILD_CACHE=0)")
+    if args.clear:
+        cache.clear(args.toolchain)
+    if args.prune:
+        removed, freed = cache.prune()
+        print(f"Removed {removed} entries ({freed / (1 << 20):.1f} MB)")
+    print(json.dumps(cache.stats(), indent=2))
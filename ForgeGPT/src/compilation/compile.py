@@ -1,56 +1,178 @@
 import os
+import shlex
+import signal
 import subprocess
+import threading
+import time
+from src.compilation.build_cache import get_build_cache
+from src.compilation.scheduler import get_build_scheduler
+from src.compilation.vendor import offline_env
+from src.tracing import span
 
-def xargo_compile_sgx_project(work_dir, project_name):
+# docker 脚本默认是 .bashrc 中的函数（bash -i 加载）；FORGE_SGX_HELPERS 指向另一个脚本文件时 source 它，
+# 例如随仓库提供的 sgx_helpers.sh。check 脚本（可选）在容器里只做类型检查
+SGX_HELPERS = os.getenv("FORGE_SGX_HELPERS") or None
+# 包装 docker 命令，把构建环境传进容器，见 docker_env.sh
+DOCKER_ENV_SHIM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docker_env.sh")
+BUILD_HELPERS = {"xargo": "docker-sgx-xargo-build", "cargo": "docker-sgx-cargo-build"}
+CHECK_HELPERS = {"xargo": "docker-sgx-xargo-check", "cargo": "docker-sgx-cargo-check"}
+
+# 检查常见 Rust 编译错误关键字
+ERROR_KEYWORDS = [
+	'error:', 'panicked at', "thread 'main' panicked", 'failed to compile', 'could not compile', 'aborting due to', 'error[E', 'error: could not', "error: process didn't exit successfully"
+]
+EXTRA_ERROR_KEYWORDS = {"cargo": ['failed to parse']}
+
+# 每个项目的编译次数统计，批量迁移时多个线程同时编译
+_build_stats_lock = threading.Lock()
+BUILD_STATS = {}
+
+
+class HelperNotFound(Exception):
+	"""The docker helper is not defined in ~/.bashrc (or SGX_HELPERS)."""
+
+
+class BuildTimeout(RuntimeError):
+	"""The build was killed after its time limit; the message is the output so far."""
+
+
+def _empty_stats():
+	return {"builds": 0, "failures": 0, "seconds": 0.0, "checks": 0, "check_failures": 0, "check_seconds": 0.0, "by_toolchain": {}}
+
+
+def _record_build(project_name, toolchain, seconds, success, tier="build"):
+	with _build_stats_lock:
+		stats = BUILD_STATS.setdefault(project_name, _empty_stats())
+		if tier == "check":
+			stats["checks"] += 1
+			stats["check_seconds"] += seconds
+			if not success:
+				stats["check_failures"] += 1
+			return
+		stats["builds"] += 1
+		stats["seconds"] += seconds
+		if not success:
+			stats["failures"] += 1
+		stats["by_toolchain"][toolchain] = stats["by_toolchain"].get(toolchain, 0) + 1
+
+
+def get_build_stats(project_name):
 	"""
-	使用 .bashrc 中的 docker-sgx-xargo-build 脚本编译 forked_repo 下的 SGX 库项目。
-	:param project_name: forked_repo 下的子目录名（即 SGX 库项目名）
+	Builds, checks, their failures and seconds recorded for project_name in this process.
+	"""
+	with _build_stats_lock:
+		stats = BUILD_STATS.get(project_name, _empty_stats())
+		return dict(stats, by_toolchain=dict(stats["by_toolchain"]))
+
+
+def helper_source():
+	"""Where the docker-sgx-* helpers come from, for messages."""
+	return SGX_HELPERS or "~/.bashrc"
+
+
+def helper_command(helper, *args):
 	"""
+	The shell command that runs helper with args: the function from ~/.bashrc, or from
+	SGX_HELPERS when set, with docker wrapped by docker_env.sh.
+	"""
+	quoted = " ".join(shlex.quote(str(arg)) for arg in args)
+	script = f"source {shlex.quote(DOCKER_ENV_SHIM)} && {helper} {quoted}"
+	if SGX_HELPERS:
+		return f"bash -c {shlex.quote(f'source {shlex.quote(SGX_HELPERS)} && {script}')}"
 	# 调用 bash -i -c 保证加载 .bashrc 并执行函数
-	cmd = f"bash -i -c 'docker-sgx-xargo-build {project_name} {os.path.basename(work_dir)}'"
-	process = subprocess.Popen(cmd, shell=True, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-	output_lines = []
-	for line in process.stdout:
-		print(line, end='')  # 实时输出
-		output_lines.append(line)
-	process.stdout.close()
-	process.wait()
-	output = ''.join(output_lines)
-	# 检查常见 Rust 编译错误关键字
-	error_keywords = [
-		'error:', 'panicked at', "thread 'main' panicked", 'failed to compile', 'could not compile', 'aborting due to', 'error[E', 'error: could not', "error: process didn't exit successfully"
-	]
-	if any(keyword in output for keyword in error_keywords):
+	return f"bash -i -c {shlex.quote(script)}"
+
+
+def container_env(work_dir):
+	"""
+	The environment of docker-sgx-*-create for work_dir: the shared build cache
+	(build_cache.py) is mounted at the path the builds under work_dir use.
+	"""
+	build_cache = get_build_cache(work_dir)
+	mounts = [f"{build_cache.root}:{build_cache.mount}"] if build_cache else []
+	return {**os.environ, "FORGE_DOCKER_MOUNTS": " ".join(mounts)}
+
+
+def run_sgx_helper(work_dir, project_name, toolchain, tier="build", timeout=None):
+	"""
+	在 docker 中对 forked_repo 下的 SGX 库项目运行 build 或 check 脚本。
+	Raises RuntimeError with the output when the output contains a Rust error and
+	HelperNotFound when the helper is not defined (see helper_command).
+	:param tier: "build" (BUILD_HELPERS) or "check" (CHECK_HELPERS)
+	:param timeout: seconds after which the helper's process group is killed (BuildTimeout)
+	"""
+	helper = (CHECK_HELPERS if tier == "check" else BUILD_HELPERS)[toolchain]
+	cmd = helper_command(helper, project_name, os.path.basename(work_dir))
+	start = time.perf_counter()
+	# 全局调度：等待 CPU token 与内存配额，构建期间占用
+	# 依赖 crate 的产物在所有项目间共享
+	build_cache = get_build_cache(work_dir)
+	cache_env = build_cache.env(toolchain) if build_cache else {}
+	# vendor.py 生成镜像后所有构建都离线（xargo 的 sysroot 除外，见 vendor.py）
+	# .cargo/config.toml 在挂载的 work_dir 里，容器内的 cargo 同样能读到
+	vendor_env = offline_env(work_dir, toolchain)
+	with get_build_scheduler().slot(project_name) as slot, \
+			span(f"{tier}.{toolchain}", category=tier, project=project_name, jobs=slot.jobs) as build_span:
+		# 容器看不到宿主机的环境变量：FORGE_DOCKER_ENV 里的变量由 docker_env.sh 以 docker exec -e 传入
+		docker_env = {**slot.env, **cache_env, **vendor_env}
+		env = {**os.environ, **docker_env, "FORGE_DOCKER_ENV": " ".join(sorted(docker_env))}
+		process = subprocess.Popen(cmd, shell=True, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+								   start_new_session=True, env=env, pass_fds=slot.pass_fds)
+		timed_out = threading.Event()
+
+		def kill():
+			timed_out.set()
+			try:
+				os.killpg(process.pid, signal.SIGKILL)
+			except ProcessLookupError:
+				pass
+		timer = threading.Timer(timeout, kill) if timeout is not None else None
+		if timer:
+			timer.start()
+		output_lines = []
+		try:
+			for line in process.stdout:
+				print(line, end='')  # 实时输出
+				output_lines.append(line)
+			process.stdout.close()
+			process.wait()
+		finally:
+			if timer:
+				timer.cancel()
+		output = ''.join(output_lines)
+		build_span.set(returncode=process.returncode, output_lines=len(output_lines), timed_out=timed_out.is_set())
+		# 结果属性要在 span 关闭前写入
+		if timed_out.is_set():
+			build_span.set(success=False)
+			_record_build(project_name, toolchain, time.perf_counter() - start, False, tier)
+			raise BuildTimeout(f"{tier}.{toolchain} killed after {timeout:.0f}s\n{output}")
+		if process.returncode == 127 and f"{helper}: command not found" in output:
+			build_span.set(helper_missing=True)
+			raise HelperNotFound(helper)
+		success = not any(keyword in output for keyword in ERROR_KEYWORDS + EXTRA_ERROR_KEYWORDS.get(toolchain, []))
+		build_span.set(success=success)
+		_record_build(project_name, toolchain, time.perf_counter() - start, success, tier)
+	if not success:
 		print("编译失败：", output)
 		raise RuntimeError(output)
 	print("编译成功：", output)
 	return output
 
+
+def xargo_compile_sgx_project(work_dir, project_name):
+	"""
+	使用 .bashrc（或 SGX_HELPERS）中的 docker-sgx-xargo-build 脚本编译 forked_repo 下的 SGX 库项目。
+	:param project_name: forked_repo 下的子目录名（即 SGX 库项目名）
+	"""
+	return run_sgx_helper(work_dir, project_name, "xargo")
+
+
 def cargo_compile_sgx_project(work_dir, project_name):
 	"""
-	使用 .bashrc 中的 docker-sgx-cargo-build 脚本编译 forked_repo 下的 SGX 库项目。
+	使用 .bashrc（或 SGX_HELPERS）中的 docker-sgx-cargo-build 脚本编译 forked_repo 下的 SGX 库项目。
 	:param project_name: forked_repo 下的子目录名（即 SGX 库项目名）
 	"""
-	# 调用 bash -i -c 保证加载 .bashrc 并执行函数
-	cmd = f"bash -i -c 'docker-sgx-cargo-build {project_name} {os.path.basename(work_dir)}'"
-	process = subprocess.Popen(cmd, shell=True, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-	output_lines = []
-	for line in process.stdout:
-		print(line, end='')  # 实时输出
-		output_lines.append(line)
-	process.stdout.close()
-	process.wait()
-	output = ''.join(output_lines)
-	# 检查常见 Rust 编译错误关键字
-	error_keywords = [
-     	'failed to parse',
-		'error:', 'panicked at', "thread 'main' panicked", 'failed to compile', 'could not compile', 'aborting due to', 'error[E', 'error: could not', "error: process didn't exit successfully"
-	]
-	if any(keyword in output for keyword in error_keywords):
-		print("编译失败：", output)
-		raise RuntimeError(output)
-	print("编译成功：", output)
-	return output
+	return run_sgx_helper(work_dir, project_name, "cargo")
 
 # 示例用法：
 # xargo_compile_sgx_project("sgx-world", 'regex-sgx')
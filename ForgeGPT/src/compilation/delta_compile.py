@@ -2,74 +2,195 @@ import os
 import json
 import subprocess
 import sys 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.append(os.path.join(os.path.dirname(__file__), '../knowledge'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '../diff'))
-from compile import xargo_compile_sgx_project, cargo_compile_sgx_project
-from undo_diff_hunk import revert_hunk_on_new_file
-from diff_hunk_read import parse_diff_hunks
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+from src.tracing import span, get_tracer
+from src.compilation.journal import DeltaCompileJournal
+from src.compilation.diagnostics import parse_diagnostics
+from src.compilation.trial_planner import make_trial_hunks, plan_groups, reverted_regions, conflicting, attribute
+from src.compilation.build_cache import get_build_cache
+from src.compilation.compile import xargo_compile_sgx_project
+from src.compilation.session import keep_containers
+from src.compilation.scheduler import get_build_scheduler
+from src.compilation.verify import verify_sgx_project
+from src.diff.patch_engine import revert_hunks
+from src.diff.diff_hunk_read import parse_diff_hunks
 
-def delta_compile_sgx_project(work_dir, project_name):
+CHANGES_DIR = "/workspaces/TEE-Forge-It/changes"
+# 每个工具链先 check，通过后再完整编译
+BUILDERS = {
+    "xargo": lambda work_dir, project_name: verify_sgx_project(work_dir, project_name, ("xargo",)),
+    "cargo": lambda work_dir, project_name: verify_sgx_project(work_dir, project_name, ("cargo",)),
+}
+
+
+def delta_compile_sgx_project(work_dir, project_name, journal=None, changes_dir=CHANGES_DIR, max_group_size=8):
     """
     遍历每个 git diff hunk，依次还原并测试编译。
+    Independent hunks are reverted together in one build and split again only when
+    the diagnostics cannot be attributed (see trial_planner); max_group_size=1 runs
+    one build per hunk.
     :param project_name: original_repo 下的子目录名（即 SGX 库项目名）
+    :param journal: DeltaCompileJournal; outcomes are appended as soon as each build finishes
+        and (file, hunk, toolchain) entries already in the journal are skipped.
     """
     project_path = f"{work_dir}/{project_name}"
     if not os.path.isdir(project_path):
         raise FileNotFoundError(f"Project path not found: {project_path}")
+    if journal is None:
+        journal = DeltaCompileJournal(os.path.join(changes_dir, f"{project_name}.deltacompile.jsonl"), project_name)
 
     # 读取 diff 信息（假设 diff 文件为 changes/{project_name}.json，结构同 repo_diff.py 输出）
-    diff_json_path = f"/workspaces/TEE-Forge-It/changes/{project_name}.json"
+    diff_json_path = os.path.join(changes_dir, f"{project_name}.json")
     if not os.path.isfile(diff_json_path):
         raise FileNotFoundError(f"Diff json not found: {diff_json_path}")
     with open(diff_json_path, 'r') as f:
         diff_data = json.load(f)
 
-    revert_results = {}
+    files = {}  # rel_file -> (原文件内容, hunks)
     for rel_file, info in diff_data.items():
         file_path = os.path.join(project_path, rel_file)
         if not os.path.isfile(file_path):
             print(f"File not found: {file_path}, skip.")
             continue
-        diff_text = info['git_diff']
         # 解析所有hunk
-       
-        hunks = parse_diff_hunks(diff_text)
+        hunks = parse_diff_hunks(info['git_diff'])
         # 读取新文件内容
         with open(file_path, 'r') as f:
-            orig_content = f.read()
-        for idx, hunk in enumerate(hunks):
-            # 还原hunk
-            try:
-                reverted_content = revert_hunk_on_new_file(hunk, orig_content)
-            except Exception as e:
-                print(f"Failed to revert hunk {idx} in {rel_file}: {e}")
-                continue
-            # 写入临时还原文件
+            files[rel_file] = (f.read(), hunks)
+
+    for toolchain, build in BUILDERS.items():
+        trial_hunks = []
+        for rel_file, (orig_content, hunks) in files.items():
+            pending = [idx for idx in range(len(hunks)) if not journal.is_done(rel_file, idx, toolchain)]
+            trial_hunks.extend(make_trial_hunks(rel_file, orig_content, hunks, pending))
+        groups = deque(plan_groups(trial_hunks, max_group_size))
+        while groups:
+            group = groups.popleft()
+            for subgroup in _run_trial(project_path, project_name, work_dir, files, group, toolchain, build, journal):
+                groups.appendleft(subgroup)
+
+    return journal.results()
+
+
+def _run_trial(project_path, project_name, work_dir, files, group, toolchain, build, journal):
+    """
+    Revert the hunks of `group` together, build once with `toolchain`, record the
+    outcome when the build passes or the group is a single hunk, and return the
+    sub-groups that need another trial (a solo trial for every hunk an error was
+    attributed to).
+    """
+    by_file = {}
+    for th in group:
+        by_file.setdefault(th.rel_file, []).append(th)
+    reverted, regions = {}, {}
+    for rel_file, members in by_file.items():
+        members.sort(key=lambda th: th.index)
+        # 还原hunk
+        with span("patch.revert", project=project_name, file=rel_file, hunks=len(members)) as patch_span:
+            patch = revert_hunks(files[rel_file][0], [th.hunk for th in members])
+            patch_span.set(conflicts=len(patch.conflicts))
+        if not patch.ok:
+            failed = conflicting(members, patch)
+            for th in failed:
+                print(f"Failed to revert hunk {th.index} in {rel_file}: no match near line {th.hunk.new_start}")
+            group = [th for th in group if th not in failed]
+            # 冲突的 hunk 不编译，其余的重新规划
+            return [group] if group else []
+        reverted[rel_file] = patch.content
+        regions.update(reverted_regions(patch.content, members, patch))
+
+    try:
+        for rel_file, content in reverted.items():
+            # 写入临时还原文件，再替换原文件
+            file_path = os.path.join(project_path, rel_file)
             tmp_file_path = file_path + ".revert_tmp"
             with open(tmp_file_path, 'w') as f:
-                f.write(reverted_content)
-            # 用还原内容替换原文件
+                f.write(content)
             os.replace(tmp_file_path, file_path)
-            print(f"Reverted hunk {idx} in {file_path}, testing compilation...")
-            # 编译测试
+        print(f"Reverted {len(group)} hunk(s) in {len(reverted)} file(s), testing {toolchain} compilation...")
+        with span("delta_compile.trial", project=project_name, toolchain=toolchain, hunks=len(group)) as trial_span:
             try:
-                xargo_compile_sgx_project(work_dir, project_name)
-                revert_results.setdefault(rel_file, []).append({"hunk_index": idx, "hunk": "\n".join(hunk.lines), "xargo_compilable": True})
+                build(work_dir, project_name)
+                output, success = None, True
             except Exception as e:
-                revert_results.setdefault(rel_file, []).append({"hunk_index": idx,  "hunk": "\n".join(hunk.lines), "xargo_compilable": False, "xargo_error": str(e)})
-            try:
-                cargo_compile_sgx_project(work_dir, project_name)
-                revert_results.setdefault(rel_file, []).append({"hunk_index": idx,  "hunk": "\n".join(hunk.lines), "cargo_compilable": True})
-            except Exception as e:
-                revert_results.setdefault(rel_file, []).append({"hunk_index": idx,  "hunk": "\n".join(hunk.lines), "cargo_compilable": False, "cargo_error": str(e)})
-            # 恢复原内容，准备下一个hunk
-            with open(file_path, 'w') as f:
-                f.write(orig_content)
+                output, success = str(e), False
+            trial_span.set(success=success)
+    finally:
+        # 恢复原内容，准备下一次试编译
+        for rel_file in reverted:
+            with open(os.path.join(project_path, rel_file), 'w') as f:
+                f.write(files[rel_file][0])
+
+    if success:
+        for th in group:
+            journal.record(th.rel_file, th.index, toolchain, "\n".join(th.hunk.lines), True)
+        return []
+    if len(group) == 1:
+        th = group[0]
+        journal.record(th.rel_file, th.index, toolchain, "\n".join(th.hunk.lines), False, output)
+        return []
+
+    errors = [d for d in parse_diagnostics(output) if not d.is_summary]
+    attributed, unattributed = attribute(errors, regions)
+    if unattributed or not attributed:
+        # 无法归因，二分
+        half = len(group) // 2
+        return [group[half:], group[:half]]
+    # 归因只是嫌疑：每个被归因的 hunk 单独编译确认后才记录
+    suspects = [[th] for th in group if th.key in attributed]
+    # 没有报错的 hunk 可能只是被提前终止的编译掩盖了
+    rest = [th for th in group if th.key not in attributed]
+    return suspects + ([rest] if rest else [])
 
-    return revert_results
 
+def _delta_compile_submodule(work_dir, project, changes_dir):
+    journal = DeltaCompileJournal(os.path.join(changes_dir, f"{project}.deltacompile.jsonl"), project)
+    output_path = os.path.join(changes_dir, f"{project}.deltacompile.json")
+    if journal.complete:
+        print(f"Skipping {project}: delta compile already complete.")
+        if not os.path.isfile(output_path):
+            journal.compact(output_path)
+        return {"success": True}
+    print("Processing project:", project)
 
-def delta_compile_sgx_projects(work_dir):
+    # call git reset --hard to discard any local changes
+    with span("git.reset", project=project):
+        subprocess.run("git reset --hard", shell=True, cwd=os.path.join(work_dir, project))
+
+    try:
+        xargo_compile_sgx_project(work_dir, project)
+    except Exception as e:
+        print(f"Initial xargo compile failed for {project}: {e}")
+        return {"error": f"Initial compile failed: {str(e)}"}
+
+    try:
+        with span("delta_compile.project", project=project):
+            delta_compile_sgx_project(work_dir, project, journal, changes_dir)
+    except Exception as e:
+        print(f"Delta compile failed for {project}: {e}")
+        return {"error": f"Delta compile failed: {str(e)}"}
+
+    # 保存每个项目的结果到 project.deltacompile.json
+    journal.mark_complete()
+    journal.compact(output_path)
+    return {"success": True}
+
+
+def delta_compile_sgx_projects(work_dir, changes_dir=CHANGES_DIR, max_parallel=None):
+    """
+    Delta-compile every submodule of work_dir. Per-hunk outcomes go to
+    {project}.deltacompile.jsonl as they happen; projects whose journal is complete
+    are skipped on restart, and each finished journal is compacted into
+    {project}.deltacompile.json.
+    Projects run concurrently, up to max_parallel at a time (default: the scheduler's
+    CPU tokens); the builds of one project stay serial since its trials edit the tree
+    in place, and every build waits for the global build scheduler (scheduler.py), so
+    the cores are shared between projects instead of each build assuming it owns them.
+    """
     def get_git_submodules(work_dir):
         "/获取所有git子模块路径/"
         gitmodules_path = os.path.join(work_dir, '.gitmodules')
@@ -82,54 +203,40 @@ def delta_compile_sgx_projects(work_dir):
                         submodules.append(line.split('=', 1)[1].strip())
         return submodules
 
-    # docker-sgx-xargo-create
-    subprocess.run(f"bash -i -c 'docker-sgx-xargo-create {work_dir}'", shell=True)
-    # docker-sgx-cargo-create
-    subprocess.run(f"bash -i -c 'docker-sgx-cargo-create {work_dir}'", shell=True)
-
-    projects = get_git_submodules(work_dir)
-    all_results = {}
-    for project in projects:
+    projects = []
+    for project in get_git_submodules(work_dir):
         if not os.path.isdir(os.path.join(work_dir, project)):
             print(f"Skipping non-directory submodule: {project}")
             continue
-        
-        # if project != "cbor-sgx":
-        #     continue
-        print("Processing project:", project)
-        
-        # call git reset --hard to discard any local changes
-        subprocess.run("git reset --hard", shell=True, cwd=os.path.join(work_dir, project))
+        projects.append(project)
 
-        try:
-            xargo_compile_sgx_project(work_dir, project)
-        except Exception as e:
-            print(f"Initial xargo compile failed for {project}: {e}")
-            all_results[project] = {"error": f"Initial compile failed: {str(e)}"}
-            continue
-     
-        try:
-            results = delta_compile_sgx_project(work_dir, project)
-            all_results[project] = {"success": True}
-        except Exception as e:
-            print(f"Delta compile failed for {project}: {e}")
-            all_results[project] = {"error": f"Delta compile failed: {str(e)}"}
-            continue
-        
-        # 保存每个项目的结果到 project.deltacompile.json
-        output_path = os.path.join("/workspaces/TEE-Forge-It/changes", f"{project}.deltacompile.json")
-        with open(output_path, 'w') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-    
-    #docker-sgx-xargo-destroy
-    subprocess.run("bash -i -c 'docker-sgx-xargo-destroy'", shell=True)
-    #docker-sgx-cargo-destroy
-    subprocess.run("bash -i -c 'docker-sgx-cargo-destroy'", shell=True)
-    return all_results
+    scheduler = get_build_scheduler()
+    max_parallel = max_parallel or scheduler.cpus
+    all_results = {}
+    # docker-sgx-xargo/cargo 容器在整个批次期间保持运行
+    with keep_containers(work_dir), \
+            span("delta_compile.batch", projects=len(projects), max_parallel=max_parallel) as batch_span:
+        with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+            futures = {pool.submit(_delta_compile_submodule, work_dir, project, changes_dir): project
+                       for project in projects}
+            for future in as_completed(futures):
+                all_results[futures[future]] = future.result()
+        batch_span.set(**scheduler.report())
+        build_cache = get_build_cache(work_dir)
+        if build_cache:
+            build_cache.prune()
+            cache_stats = build_cache.stats()
+            batch_span.set(build_cache=cache_stats)
+            for toolchain, stats in cache_stats.items():
+                print(f"Build cache {toolchain}: {stats['hits']} hits, {stats['misses']} misses "
+                      f"({stats['hit_rate']:.0%}), {stats['bytes'] / (1 << 20):.0f} MB")
+    return {project: all_results[project] for project in projects}
 
 
 if __name__ == "__main__":
     # Note this requires that the script is run when working directory is /workspaces/TEE-Forge-It
     all_results = delta_compile_sgx_projects("forked_repo")
     for project, result in all_results.items():
-        print(f"Project: {project}, Result: {result}")
\ No newline at end of file
+        print(f"Project: {project}, Result: {result}")
+    for name, row in get_tracer().summary().items():
+        print(f"{name}: {row['count']} calls, {row['total']:.1f}s total")
\ No newline at end of file
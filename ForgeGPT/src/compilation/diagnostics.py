@@ -0,0 +1,82 @@
+import re
+
+from src.compilation.format import remove_ansi_colors
+
+_HEADER_RE = re.compile(r'^(error|warning)(?:\[(E\d{4})\])?: (.*)$')
+_SPAN_RE = re.compile(r'^\s*--> (.+?):(\d+):(\d+)\s*$')
+
+# cargo/rustc 的汇总行，没有位置，也不是独立的错误
+_SUMMARY_RE = re.compile(
+    r"aborting due to|could not compile|process didn't exit successfully|"
+    r"build failed|previous errors?|warnings? emitted")
+
+
+class Diagnostic:
+    """
+    One rustc diagnostic: `error[E0433]: message` plus the primary `--> file:line:col`
+    span when there is one, and the full text block as printed by the compiler.
+    """
+    __slots__ = ('level', 'code', 'message', 'file', 'line', 'column', 'text')
+
+    def __init__(self, level, code, message, file=None, line=None, column=None, text=""):
+        self.level = level
+        self.code = code
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+        self.text = text
+
+    @property
+    def is_summary(self):
+        return self.file is None and bool(_SUMMARY_RE.search(self.message))
+
+    def in_file(self, rel_file):
+        """
+        True if the span points at rel_file (paths in the container are absolute or
+        relative to the crate root).
+        """
+        if self.file is None:
+            return False
+        path = self.file.replace('\\', '/')
+        return path == rel_file or path.endswith('/' + rel_file)
+
+    def __repr__(self):
+        where = f" {self.file}:{self.line}" if self.file else ""
+        return f"<Diagnostic {self.level}[{self.code}]{where}: {self.message[:60]}>"
+
+
+def parse_diagnostics(output, level="error"):
+    """
+    Parse the rustc diagnostics in a build log (ANSI colors are removed first).
+    Only diagnostics of `level` are returned unless level is None.
+    """
+    diagnostics = []
+    current = None
+    block = []
+    for line in remove_ansi_colors(output).splitlines():
+        header = _HEADER_RE.match(line)
+        if header:
+            if current is not None:
+                current.text = "\n".join(block).rstrip()
+            current = Diagnostic(header.group(1), header.group(2), header.group(3))
+            diagnostics.append(current)
+            block = [line]
+            continue
+        if current is None:
+            continue
+        if not line.strip():
+            # 诊断块以空行结束
+            current.text = "\n".join(block).rstrip()
+            current = None
+            continue
+        block.append(line)
+        if current.file is None:
+            span = _SPAN_RE.match(line)
+            if span:
+                current.file, current.line, current.column = span.group(1), int(span.group(2)), int(span.group(3))
+    if current is not None:
+        current.text = "\n".join(block).rstrip()
+    if level is None:
+        return diagnostics
+    return [d for d in diagnostics if d.level == level]
@@ -0,0 +1,32 @@
+# Sourced right before a docker-sgx-* helper runs (compile.helper_command), whichever
+# file defines the helper (~/.bashrc by default). Wraps `docker` so the helpers pass
+# the build environment into the containers without changing their commands:
+#
+#   docker exec           gets `-e NAME` for every NAME in FORGE_DOCKER_ENV (the value
+#                         comes from the caller's environment, e.g. CARGO_BUILD_JOBS)
+#   docker run / create   gets `-v MOUNT` for every "host:container" in FORGE_DOCKER_MOUNTS
+#
+# Helpers that call the docker binary by path (or through sudo) are not wrapped.
+
+docker() {
+    if [ $# -eq 0 ]; then
+        command docker
+        return
+    fi
+    local subcommand=$1 item
+    local extra=()
+    shift
+    case $subcommand in
+        exec)
+            for item in $FORGE_DOCKER_ENV; do
+                extra+=(-e "$item")
+            done
+            ;;
+        run|create)
+            for item in $FORGE_DOCKER_MOUNTS; do
+                extra+=(-v "$item")
+            done
+            ;;
+    esac
+    command docker "$subcommand" "${extra[@]}" "$@"
+}
@@ -13,6 +13,7 @@ def format_delta_compile_results():
     """
     Format the delta compile results saved in the /workspaces/TEE-Forge-It/changes/*.deltacompile.json.
     Remove ansi color codes and save back to the original file.
+    Only needed for results written before the delta-compile journal, which strips colors when recording.
     """
     import os
     import json
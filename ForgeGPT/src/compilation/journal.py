@@ -0,0 +1,123 @@
+import os
+import json
+
+from src.compilation.format import remove_ansi_colors
+
+TOOLCHAINS = ("xargo", "cargo")
+
+
+class DeltaCompileJournal:
+    """
+    Append-only JSONL journal of delta-compile outcomes for one project.
+
+    Every (file, hunk_index, toolchain) outcome is written and fsynced as soon as the
+    build finishes, with ANSI colors already stripped, so a crashed run resumes from
+    the last completed build. A partial last line left by a crash is cut off on open,
+    so the next record starts on a line of its own. `compact` turns the journal into the
+    {project}.deltacompile.json layout written by delta_compile_sgx_project.
+    """
+
+    def __init__(self, path, project):
+        self.path = path
+        self.project = project
+        self.completed = set()  # (rel_file, hunk_index, toolchain)
+        self.complete = False  # whole project finished
+        self._truncate_partial_line()
+        for record in self.records():
+            if record.get("complete"):
+                self.complete = True
+            else:
+                self.completed.add((record["file"], record["hunk_index"], record["toolchain"]))
+
+    def _truncate_partial_line(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # 崩溃时最后一行只写了一半：截到最后一个换行符
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            f.truncate(position)
+
+    def records(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+
+    def _append(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, rel_file, hunk_index, toolchain=None):
+        toolchains = (toolchain,) if toolchain else TOOLCHAINS
+        return all((rel_file, hunk_index, t) in self.completed for t in toolchains)
+
+    def record(self, rel_file, hunk_index, toolchain, hunk, compilable, error=None):
+        record = {
+            "project": self.project,
+            "file": rel_file,
+            "hunk_index": hunk_index,
+            "toolchain": toolchain,
+            "hunk": hunk,
+            "compilable": compilable,
+        }
+        if error is not None:
+            record["error"] = remove_ansi_colors(error)
+        self._append(record)
+        self.completed.add((rel_file, hunk_index, toolchain))
+
+    def mark_complete(self):
+        self._append({"project": self.project, "complete": True})
+        self.complete = True
+
+    def results(self):
+        """
+        Journal content in the delta-compile result schema:
+        {rel_file: [{"hunk_index", "hunk", "<toolchain>_compilable", ["<toolchain>_error"]}, ...]}
+        The last record wins when a (file, hunk, toolchain) was recorded twice.
+        """
+        latest = {}
+        for record in self.records():
+            if record.get("complete"):
+                continue
+            latest[(record["file"], record["hunk_index"], record["toolchain"])] = record
+        results = {}
+        order = {t: i for i, t in enumerate(TOOLCHAINS)}
+        for (rel_file, hunk_index, toolchain), record in sorted(
+                latest.items(), key=lambda item: (item[0][1], order.get(item[0][2], len(order)))):
+            entry = {"hunk_index": hunk_index, "hunk": record["hunk"], f"{toolchain}_compilable": record["compilable"]}
+            if "error" in record:
+                entry[f"{toolchain}_error"] = record["error"]
+            results.setdefault(rel_file, []).append(entry)
+        return results
+
+    def compact(self, output_path):
+        """
+        Write the {project}.deltacompile.json file atomically and return the results.
+        """
+        results = self.results()
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, output_path)
+        return results
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+RUSTC_WRAPPER that caches the compiled dependency crates shared by the forked projects.
+
+Cargo runs `rustc_wrapper.py <rustc> <args>`. A compilation is cached when it builds a
+library of a crate that is not part of the project being built (CARGO_PRIMARY_PACKAGE
+unset) from an immutable source: the registry or a git checkout under CARGO_HOME or
+the vendored mirror (vendor.py), e.g. sgx_tstd from teaclave-sgx-sdk. The key hashes
+the compiler (`rustc -vV`), the arguments with the build directory replaced by a
+placeholder (they hold the crate, its version hash `-C metadata`, features as
+`--cfg`, target, sysroot and the hashes of the crates it links), the target spec,
+the CARGO_PKG_* variables and the files a build script generated in OUT_DIR. On a hit the outputs (`.rlib`, `.rmeta`, `.d`)
+are copied into `--out-dir` and the compiler messages are replayed, so cargo sees
+the same result as from rustc.
+
+The cache lives in FORGE_RUSTC_CACHE (one directory per toolchain, see
+build_cache.py); each hit or miss is appended to its events.log. This file only uses
+the standard library and stays compatible with Python 3.6 (no capture_output/text
+in subprocess): it is copied into the cache directory and runs with the python3 of
+the build containers.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BUILD_ROOT = "@FORGE_BUILD_ROOT@"
+IMMUTABLE_SOURCES = (os.sep + "registry" + os.sep + "src" + os.sep, os.sep + "git" + os.sep + "checkouts" + os.sep,
+                     os.sep + ".forge-vendor" + os.sep)
+CACHED_CRATE_TYPES = {"lib", "rlib", "proc-macro"}
+
+
+def _option(args, name):
+    """
+    Values of `name` given as `name value` or `name=value`.
+    """
+    values = []
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            values.append(args[i + 1])
+        elif arg.startswith(name + "="):
+            values.append(arg[len(name) + 1:])
+    return values
+
+
+def _codegen(args, key):
+    for value in _option(args, "-C"):
+        if value.startswith(key + "="):
+            return value[len(key) + 1:]
+    return None
+
+
+def _source_file(args):
+    return next((arg for arg in args if arg.endswith(".rs") and not arg.startswith("-")), None)
+
+
+def cacheable(args):
+    """
+    The (crate name, extra filename, out dir) of a cacheable compilation, or None.
+    """
+    if os.environ.get("CARGO_PRIMARY_PACKAGE"):
+        return None
+    crate_names, out_dirs = _option(args, "--crate-name"), _option(args, "--out-dir")
+    crate_types = set(_option(args, "--crate-type"))
+    source = _source_file(args)
+    extra = _codegen(args, "extra-filename")
+    if not crate_names or not out_dirs or extra is None or not source:
+        return None
+    if not crate_types or not crate_types <= CACHED_CRATE_TYPES:
+        return None
+    if not any(marker in os.path.abspath(source) for marker in IMMUTABLE_SOURCES):
+        return None
+    return crate_names[0], extra, out_dirs[0]
+
+
+def _hash_file(digest, path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+
+def cache_key(rustc, args, out_dir):
+    build_root = os.path.dirname(os.path.abspath(out_dir))
+    digest = hashlib.sha256()
+    digest.update(subprocess.run([rustc, "-vV"], stdout=subprocess.PIPE).stdout)
+    for arg in args:
+        digest.update(arg.replace(build_root, BUILD_ROOT).encode() + b"\0")
+    for target in _option(args, "--target"):
+        if target.endswith(".json") and os.path.isfile(target):
+            _hash_file(digest, target)
+    for name in sorted(os.environ):
+        if name.startswith("CARGO_PKG_") or name in ("CARGO_CRATE_NAME", "CARGO_MANIFEST_DIR", "RUST_TARGET_PATH"):
+            digest.update(f"{name}={os.environ[name]}\0".encode())
+    # build.rs 生成的代码会被 include! 进来
+    out_env = os.environ.get("OUT_DIR")
+    if out_env and os.path.isdir(out_env):
+        for root, dirs, files in os.walk(out_env):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, out_env).encode() + b"\0")
+                _hash_file(digest, path)
+    return digest.hexdigest()
+
+
+def _outputs(out_dir, crate_name, extra):
+    stems = (f"lib{crate_name}{extra}.", f"{crate_name}{extra}.")
+    return sorted(name for name in os.listdir(out_dir) if name.startswith(stems))
+
+
+def _rewrite(data, old, new):
+    return data.replace(old.encode(), new.encode())
+
+
+def _log(cache_dir, event, crate_name):
+    with open(os.path.join(cache_dir, "events.log"), 'a') as f:
+        f.write(f"{event} {crate_name}\n")
+
+
+def restore(entry, out_dir):
+    build_root = os.path.dirname(os.path.abspath(out_dir))
+    for name in os.listdir(entry):
+        if name == "stderr":
+            continue
+        target = os.path.join(out_dir, name)
+        if name.endswith(".d"):
+            with open(os.path.join(entry, name), 'rb') as f:
+                data = _rewrite(f.read(), BUILD_ROOT, build_root)
+            with open(target, 'wb') as f:
+                f.write(data)
+        else:
+            # 新的 mtime，cargo 的指纹比较源码时才不会判定过期
+            shutil.copyfile(os.path.join(entry, name), target)
+    with open(os.path.join(entry, "stderr"), 'rb') as f:
+        sys.stderr.buffer.write(_rewrite(f.read(), BUILD_ROOT, build_root))
+    sys.stderr.flush()
+    os.utime(entry)  # LRU 清理按最近使用时间
+
+
+def store(entry, out_dir, outputs, stderr):
+    build_root = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    staging = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix=".tmp-")
+    try:
+        for name in outputs:
+            if name.endswith(".d"):
+                with open(os.path.join(out_dir, name), 'rb') as f:
+                    data = _rewrite(f.read(), build_root, BUILD_ROOT)
+                with open(os.path.join(staging, name), 'wb') as f:
+                    f.write(data)
+            else:
+                shutil.copyfile(os.path.join(out_dir, name), os.path.join(staging, name))
+        with open(os.path.join(staging, "stderr"), 'wb') as f:
+            f.write(_rewrite(stderr, build_root, BUILD_ROOT))
+        os.rename(staging, entry)
+    except OSError:
+        # 另一个项目同时编译了同一个依赖并先写入
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def main(argv):
+    rustc, args = argv[1], argv[2:]
+    cache_dir = os.environ.get("FORGE_RUSTC_CACHE")
+    crate = cacheable(args) if cache_dir else None
+    if crate is None:
+        os.execvp(rustc, [rustc] + args)
+    crate_name, extra, out_dir = crate
+    key = cache_key(rustc, args, out_dir)
+    entry = os.path.join(cache_dir, "entries", key[:2], key)
+    if os.path.isdir(entry):
+        restore(entry, out_dir)
+        _log(cache_dir, "hit", crate_name)
+        return 0
+
+    # close_fds=False: rustc 需要继承 cargo 的 jobserver 描述符
+    process = subprocess.Popen([rustc] + args, stderr=subprocess.PIPE, close_fds=False)
+    stderr = []
+    for line in process.stderr:
+        sys.stderr.buffer.write(line)
+        sys.stderr.flush()
+        stderr.append(line)
+    returncode = process.wait()
+    if returncode == 0:
+        store(entry, out_dir, _outputs(out_dir, crate_name, extra), b"".join(stderr))
+        _log(cache_dir, "miss", crate_name)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
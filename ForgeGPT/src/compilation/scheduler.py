@@ -0,0 +1,203 @@
+"""
+Global build scheduler shared by every build of the process.
+
+CPU parallelism is a pool of tokens held in a make-style jobserver pipe (one token per
+core). A build is admitted when it gets a token (its implicit job, as for a make
+child) and when the memory limit leaves room for one more build; builds beyond that
+wait.
+
+A build on the host gets the pipe in MAKEFLAGS/CARGO_MAKEFLAGS
+(`--jobserver-auth=R,W`), so cargo or make asks the same pool for every further job
+and returns the token when the job ends: concurrent builds of several projects share
+the cores without oversubscribing them, and the cores freed by a build that is
+linking are picked up by the others.
+
+Builds inside the docker containers cannot inherit the pipe. Each takes its share
+of the pool at admission instead: cpus // (builds running or waiting), at least the
+implicit token and at most the tokens free at that moment. A build alone gets every
+core and builds that start together split them. The share goes into the container as
+CARGO_BUILD_JOBS (run_sgx_helper forwards it with `docker exec -e`, see
+docker_env.sh); the tokens return to the pool when the build ends.
+
+    with get_build_scheduler().slot("bytes-sgx", containerized=False) as slot:
+        subprocess.run(cmd, env={**os.environ, **slot.env}, pass_fds=slot.pass_fds)
+"""
+import contextlib
+import os
+import threading
+import time
+
+from src.tracing import span
+
+MB_PER_BUILD = int(os.getenv("FORGE_BUILD_MB_PER_BUILD", "2048"))
+
+
+def _available_memory_mb():
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+class Jobserver:
+    """
+    A pipe holding `tokens` one-byte tokens, in the format of the GNU make jobserver.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.read_fd, self.write_fd = os.pipe()
+        os.write(self.write_fd, b"+" * tokens)
+        # 独立的非阻塞读端，不影响子进程继承的阻塞读端
+        self._nonblocking_fd = os.open(f"/proc/self/fd/{self.read_fd}", os.O_RDONLY | os.O_NONBLOCK)
+
+    def acquire(self):
+        """
+        Block until a token is free; returns it (give it back with release).
+        """
+        while True:
+            try:
+                return os.read(self.read_fd, 1)
+            except InterruptedError:
+                continue
+
+    def try_acquire(self, count):
+        """
+        Up to `count` tokens that are free right now, without blocking.
+        """
+        if count <= 0:
+            return b""
+        try:
+            return os.read(self._nonblocking_fd, count)
+        except BlockingIOError:
+            return b""
+
+    def release(self, tokens):
+        if tokens:
+            os.write(self.write_fd, tokens)
+
+    def free(self):
+        """
+        Tokens in the pipe right now (a snapshot).
+        """
+        import fcntl
+        import termios
+        import array
+        size = array.array('i', [0])
+        fcntl.ioctl(self.read_fd, termios.FIONREAD, size)
+        return size[0]
+
+    @property
+    def makeflags(self):
+        return f"-j --jobserver-fds={self.read_fd},{self.write_fd} --jobserver-auth={self.read_fd},{self.write_fd}"
+
+
+class BuildSlot:
+    def __init__(self, project, jobs, env, pass_fds, waited):
+        self.project = project
+        self.jobs = jobs  # tokens held for the build; a host build takes more from the jobserver
+        self.env = env
+        self.pass_fds = pass_fds
+        self.waited = waited  # seconds spent waiting for admission
+
+
+class BuildScheduler:
+    """
+    :param cpus: tokens in the pool (default: the CPUs this process may use)
+    :param memory_mb: memory the builds may use together (default: 80% of MemAvailable)
+    :param mb_per_build: memory reserved per build in flight
+    """
+
+    def __init__(self, cpus=None, memory_mb=None, mb_per_build=MB_PER_BUILD):
+        self.cpus = cpus or len(os.sched_getaffinity(0))
+        if memory_mb is None:
+            available = _available_memory_mb()
+            memory_mb = int(available * 0.8) if available else None
+        self.memory_mb = memory_mb
+        self.mb_per_build = mb_per_build
+        self.jobserver = Jobserver(self.cpus)
+        self.running = {}  # project -> builds in flight
+        self.waiting = 0  # builds waiting for admission
+        self.stats = {"builds": 0, "wait_seconds": 0.0, "max_concurrent": 0, "token_seconds": 0.0}
+        self._cond = threading.Condition()
+
+    def _max_builds(self):
+        if self.memory_mb is None:
+            return self.cpus
+        return max(1, min(self.cpus, self.memory_mb // self.mb_per_build))
+
+    def share(self):
+        """
+        Jobs of a containerized build admitted now: the pool split evenly over the builds
+        running or waiting (call with _cond held).
+        """
+        return max(1, self.cpus // max(1, sum(self.running.values()) + self.waiting))
+
+    @contextlib.contextmanager
+    def slot(self, project, containerized=True):
+        """
+        Admit one build of project: wait for room under the memory limit and for a CPU
+        token and yield the BuildSlot. A containerized build also takes the rest of
+        its share (share()) of the free tokens; a host build gets the jobserver instead.
+        """
+        start = time.perf_counter()
+        with span("scheduler.wait", category="build", project=project) as wait_span:
+            with self._cond:
+                self.waiting += 1
+                while sum(self.running.values()) >= self._max_builds():
+                    self._cond.wait()
+                self.waiting -= 1
+                self.running[project] = self.running.get(project, 0) + 1
+                in_flight = sum(self.running.values())
+                self.stats["max_concurrent"] = max(self.stats["max_concurrent"], in_flight)
+                share = self.share()
+            tokens = self.jobserver.acquire()
+            if containerized:
+                # 容器内的编译拿不到管道：按准入时正在运行和等待的构建数均分
+                tokens += self.jobserver.try_acquire(share - 1)
+            waited = time.perf_counter() - start
+            wait_span.set(waited=waited, jobs=len(tokens), in_flight=in_flight)
+        if containerized:
+            env, pass_fds = {"CARGO_BUILD_JOBS": str(len(tokens))}, ()
+        else:
+            env = {"MAKEFLAGS": self.jobserver.makeflags, "CARGO_MAKEFLAGS": self.jobserver.makeflags}
+            pass_fds = (self.jobserver.read_fd, self.jobserver.write_fd)
+        started = time.perf_counter()
+        try:
+            yield BuildSlot(project, len(tokens), env, pass_fds, waited)
+        finally:
+            self.jobserver.release(tokens)
+            with self._cond:
+                self.running[project] -= 1
+                if not self.running[project]:
+                    del self.running[project]
+                self.stats["builds"] += 1
+                self.stats["wait_seconds"] += waited
+                self.stats["token_seconds"] += len(tokens) * (time.perf_counter() - started)
+                self._cond.notify_all()
+
+    def report(self):
+        with self._cond:
+            return dict(self.stats, cpus=self.cpus, memory_mb=self.memory_mb, max_builds=self._max_builds(),
+                        in_flight=sum(self.running.values()), waiting=self.waiting)
+
+
+_SCHEDULER = None
+_scheduler_lock = threading.Lock()
+
+
+def get_build_scheduler():
+    """
+    The process-wide scheduler; FORGE_BUILD_CPUS and FORGE_BUILD_MEMORY_MB override its limits.
+    """
+    global _SCHEDULER
+    with _scheduler_lock:
+        if _SCHEDULER is None:
+            cpus = os.getenv("FORGE_BUILD_CPUS")
+            memory_mb = os.getenv("FORGE_BUILD_MEMORY_MB")
+            _SCHEDULER = BuildScheduler(int(cpus) if cpus else None, int(memory_mb) if memory_mb else None)
+        return _SCHEDULER
@@ -0,0 +1,109 @@
+import contextlib
+import os
+import subprocess
+import threading
+
+from src.compilation.compile import container_env, get_build_stats, helper_command
+from src.tracing import span
+
+TOOLCHAINS = ("xargo", "cargo")
+
+
+class _Containers:
+    """
+    The docker-sgx-{xargo,cargo} containers. The helpers mount one work dir and
+    `docker-sgx-*-destroy` takes no argument, so only one work dir can be mounted at a
+    time: sessions on the same work dir share the containers (refcounted), sessions on
+    another work dir wait until the last user has closed.
+    """
+
+    def __init__(self):
+        self.work_dir = None
+        self.users = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, work_dir):
+        with self._cond:
+            while self.users and self.work_dir != work_dir:
+                self._cond.wait()
+            if self.users == 0:
+                with span("docker.create", work_dir=os.path.basename(work_dir)):
+                    env = container_env(work_dir)
+                    for toolchain in TOOLCHAINS:
+                        subprocess.run(helper_command(f"docker-sgx-{toolchain}-create", os.path.basename(work_dir)),
+                                       shell=True, env=env)
+                self.work_dir = work_dir
+            self.users += 1
+
+    def release(self):
+        with self._cond:
+            self.users -= 1
+            if self.users == 0:
+                with span("docker.destroy"):
+                    for toolchain in TOOLCHAINS:
+                        subprocess.run(helper_command(f"docker-sgx-{toolchain}-destroy"), shell=True)
+                self.work_dir = None
+                self._cond.notify_all()
+
+
+_CONTAINERS = _Containers()
+
+
+@contextlib.contextmanager
+def keep_containers(work_dir):
+    """
+    Keep the containers for work_dir up across several sessions, e.g. for a whole
+    batch, instead of recreating them whenever no project happens to be building.
+    """
+    _CONTAINERS.acquire(os.path.abspath(work_dir))
+    try:
+        yield
+    finally:
+        _CONTAINERS.release()
+
+
+class BuildSession:
+    """
+    Build environment of one project: keeps the SGX containers for its work dir alive
+    while open and counts the builds the project ran in between.
+
+        with BuildSession(project_path) as session:
+            migrate_project(project_path, state)
+        print(session.stats())
+    """
+
+    def __init__(self, project_path):
+        self.project_path = os.path.abspath(project_path)
+        self.project_name = os.path.basename(self.project_path)
+        self.work_dir = os.path.dirname(self.project_path)
+        self._baseline = None
+
+    def open(self):
+        _CONTAINERS.acquire(self.work_dir)
+        self._baseline = get_build_stats(self.project_name)
+        return self
+
+    def close(self):
+        _CONTAINERS.release()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def stats(self):
+        """
+        Builds, checks, their failures and seconds since the session was opened.
+        """
+        current = get_build_stats(self.project_name)
+        baseline = self._baseline or get_build_stats(None)
+        return {
+            "builds": current["builds"] - baseline["builds"],
+            "failures": current["failures"] - baseline["failures"],
+            "build_seconds": current["seconds"] - baseline["seconds"],
+            "checks": current["checks"] - baseline["checks"],
+            "check_failures": current["check_failures"] - baseline["check_failures"],
+            "check_seconds": current["check_seconds"] - baseline["check_seconds"],
+        }
@@ -0,0 +1,78 @@
+# Optional docker helpers for the SGX builds. By default compile.py runs the user's own
+# docker-sgx-* functions from ~/.bashrc; FORGE_SGX_HELPERS=<path of this file> uses
+# these instead, e.g. on a machine without them.
+#
+#   docker-sgx-{xargo,cargo}-create <work_dir>                start the container, work_dir mounted at /root/<name>
+#   docker-sgx-{xargo,cargo}-{build,check} <project> <name>   run the build or check command in /root/<name>/<project>
+#   docker-sgx-{xargo,cargo}-destroy                          remove the container
+#
+# Nothing about the build is assumed: set the image and the in-container commands of
+# your projects (e.g. the `make` of their sgx/ test enclave) before using the file.
+#
+#   FORGE_SGX_IMAGE                       image of both containers (required by create)
+#   FORGE_SGX_TOOLCHAIN                   RUSTUP_TOOLCHAIN in the containers, if set
+#   FORGE_SGX_{XARGO,CARGO}_BUILD         command of the build helper (not defined when unset)
+#   FORGE_SGX_{XARGO,CARGO}_CHECK         command of the check helper (not defined when unset:
+#                                         verify.py then skips the check tier)
+#   FORGE_SGX_{XARGO,CARGO}_CONTAINER     container names (default forge-sgx-xargo/cargo)
+#
+# A relative <work_dir> is taken under FORGE_SGX_WORK_ROOT (default $HOME), as in the
+# ~/<name> layout the containers mount. The build environment (CARGO_BUILD_JOBS, the
+# build cache, the offline config) and the cache mount are added by docker_env.sh.
+
+_forge_sgx_container() {
+    local var="FORGE_SGX_${1^^}_CONTAINER"
+    echo "${!var:-forge-sgx-$1}"
+}
+
+_forge_sgx_create() {
+    local toolchain=$1 work_dir=$2 container
+    if [ -z "$FORGE_SGX_IMAGE" ]; then
+        echo "sgx_helpers.sh: FORGE_SGX_IMAGE is not set" >&2
+        return 1
+    fi
+    [[ $work_dir = /* ]] || work_dir="${FORGE_SGX_WORK_ROOT:-$HOME}/$work_dir"
+    work_dir=$(realpath "$work_dir") || return 1
+    container=$(_forge_sgx_container "$toolchain")
+    # 只删除本脚本创建的同名容器
+    if [ "$(docker inspect -f '{{index .Config.Labels "forge-sgx"}}' "$container" 2>/dev/null)" = "$toolchain" ]; then
+        docker rm -f "$container" >/dev/null
+    fi
+    local args=(-d --name "$container" --label "forge-sgx=$toolchain" -v "$work_dir:/root/$(basename "$work_dir")")
+    if [ -n "$FORGE_SGX_TOOLCHAIN" ]; then
+        args+=(-e RUSTUP_TOOLCHAIN="$FORGE_SGX_TOOLCHAIN")
+    fi
+    docker run "${args[@]}" "$FORGE_SGX_IMAGE" sleep infinity >/dev/null
+}
+
+_forge_sgx_exec() {
+    local toolchain=$1 command=$2 project=$3 name=$4
+    docker exec -w "/root/$name/$project" "$(_forge_sgx_container "$toolchain")" bash -lc "$command" 2>&1
+}
+
+_forge_sgx_destroy() {
+    local container
+    container=$(_forge_sgx_container "$1")
+    if [ "$(docker inspect -f '{{index .Config.Labels "forge-sgx"}}' "$container" 2>/dev/null)" = "$1" ]; then
+        docker rm -f "$container" >/dev/null
+    fi
+}
+
+docker-sgx-xargo-create() { _forge_sgx_create xargo "$1"; }
+docker-sgx-cargo-create() { _forge_sgx_create cargo "$1"; }
+docker-sgx-xargo-destroy() { _forge_sgx_destroy xargo; }
+docker-sgx-cargo-destroy() { _forge_sgx_destroy cargo; }
+# build 只在设置了对应命令时定义，未定义时 run_sgx_helper 报 HelperNotFound
+if [ -n "$FORGE_SGX_XARGO_BUILD" ]; then
+    docker-sgx-xargo-build() { _forge_sgx_exec xargo "$FORGE_SGX_XARGO_BUILD" "$1" "$2"; }
+fi
+if [ -n "$FORGE_SGX_CARGO_BUILD" ]; then
+    docker-sgx-cargo-build() { _forge_sgx_exec cargo "$FORGE_SGX_CARGO_BUILD" "$1" "$2"; }
+fi
+# check 同样要显式设置命令；未定义时 verify.py 跳过 check 层
+if [ -n "$FORGE_SGX_XARGO_CHECK" ]; then
+    docker-sgx-xargo-check() { _forge_sgx_exec xargo "$FORGE_SGX_XARGO_CHECK" "$1" "$2"; }
+fi
+if [ -n "$FORGE_SGX_CARGO_CHECK" ]; then
+    docker-sgx-cargo-check() { _forge_sgx_exec cargo "$FORGE_SGX_CARGO_CHECK" "$1" "$2"; }
+fi
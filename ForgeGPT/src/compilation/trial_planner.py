@@ -0,0 +1,121 @@
+"""
+Trial planning for delta compile: revert several independent hunks in one build.
+
+Hunks are independent when they live in different files or touch disjoint top-level
+items of the same file; they are grouped into one trial and reverted together. When
+the trial fails, every error diagnostic is attributed to the hunk whose reverted
+item contains its span. Attribution only picks the suspects: each hunk with
+attributed errors gets a trial of its own, whose result is the one recorded, and
+the others go into a new trial, since rustc may have stopped before reaching them.
+A diagnostic that cannot be attributed (another file, an untouched item, no span at
+all) makes the trial ambiguous and the group is split in half.
+
+Hunks touching crate-level items (`#![...]`, `extern crate`, `use`, `mod`,
+`macro_rules!`) change what every other item sees and always get a trial of their own.
+"""
+from src.diff.patch_engine import split_hunk_lines, CONFLICT
+from src.diff.rust_items import top_level_items, items_in_range
+
+
+class TrialHunk:
+    __slots__ = ('rel_file', 'index', 'hunk', 'items', 'solo')
+
+    def __init__(self, rel_file, index, hunk, items, solo):
+        self.rel_file = rel_file
+        self.index = index
+        self.hunk = hunk
+        self.items = items  # indices of the top-level items the hunk touches
+        self.solo = solo
+
+    @property
+    def key(self):
+        return (self.rel_file, self.index)
+
+    def __repr__(self):
+        return f"<TrialHunk {self.rel_file}#{self.index} items={self.items}{' solo' if self.solo else ''}>"
+
+
+def make_trial_hunks(rel_file, content, hunks, indices):
+    """
+    TrialHunks for hunks[i], i in indices, of the post-change file `content`.
+    """
+    items = top_level_items(content)
+    trial_hunks = []
+    for idx in indices:
+        hunk = hunks[idx]
+        touched = items_in_range(items, hunk.new_start, hunk.new_start + hunk.new_count - 1)
+        solo = any(items[i].crate_level for i in touched)
+        trial_hunks.append(TrialHunk(rel_file, idx, hunk, touched, solo))
+    return trial_hunks
+
+
+def plan_groups(trial_hunks, max_group_size=8):
+    """
+    Greedily pack trial hunks into groups without two hunks on the same item of the
+    same file. max_group_size=1 gives one build per hunk.
+    """
+    groups = []
+    for th in trial_hunks:
+        if th.solo or max_group_size <= 1:
+            groups.append(([th], None))
+            continue
+        claimed = {(th.rel_file, i) for i in th.items}
+        for members, used in groups:
+            if used is not None and len(members) < max_group_size and not (claimed & used):
+                members.append(th)
+                used |= claimed
+                break
+        else:
+            groups.append(([th], claimed))
+    return [members for members, _ in groups]
+
+
+def reverted_regions(content, trial_hunks, patch):
+    """
+    Line regions of the reverted file that each reverted hunk is responsible for: the
+    top-level items overlapping the hunk's lines after the revert, or the lines
+    themselves when they are outside any item. Hunks that conflicted get no region.
+    :param patch: PatchResult of revert_hunks(original, [th.hunk for th in trial_hunks])
+    :param content: patch.content
+    """
+    items = top_level_items(content)
+    regions = {}
+    shift = 0
+    for th, outcome in zip(trial_hunks, patch.outcomes):
+        if outcome.actual_line is None:
+            continue
+        old_chunk, new_chunk, _ = split_hunk_lines(th.hunk.lines)
+        start = outcome.actual_line + shift
+        end = start + len(old_chunk) - 1
+        shift += len(old_chunk) - len(new_chunk)
+        touched = items_in_range(items, start, end)
+        if touched:
+            regions[th.key] = [(items[i].start_line, items[i].end_line) for i in touched]
+        else:
+            regions[th.key] = [(start, max(start, end))]
+    return regions
+
+
+def conflicting(trial_hunks, patch):
+    return [th for th, outcome in zip(trial_hunks, patch.outcomes) if outcome.status == CONFLICT]
+
+
+def attribute(diagnostics, regions):
+    """
+    Attribute error diagnostics to hunks.
+    :param regions: {(rel_file, index): [(start_line, end_line), ...]} in the reverted files
+    Returns ({key: [Diagnostic, ...]}, [unattributed Diagnostic, ...]). A diagnostic
+    inside the regions of two hunks is unattributed.
+    """
+    attributed = {}
+    unattributed = []
+    for diagnostic in diagnostics:
+        owners = [
+            key for key, spans in regions.items()
+            if diagnostic.in_file(key[0]) and any(start <= diagnostic.line <= end for start, end in spans)
+        ]
+        if len(owners) == 1:
+            attributed.setdefault(owners[0], []).append(diagnostic)
+        else:
+            unattributed.append(diagnostic)
+    return attributed, unattributed
@@ -0,0 +1,295 @@
+"""
+Vendored dependency mirror for the forked crates, so builds never touch the network.
+
+Each project's lockfiles are resolved once, with the crates that broke the SGX
+toolchain's cargo pinned (SGX_PINS, see Notes.md: libc 0.2.175 needs edition 2021 and
+cc 1.1 uses `dep:` features), and `cargo vendor` copies every registry and git
+dependency of all projects into one directory, <work_dir>/.forge-vendor. The source
+replacement printed by cargo vendor and `[net] offline = true` go to
+<work_dir>/.cargo/config.toml, which cargo reads for every build under work_dir, and
+run_sgx_helper passes CARGO_NET_OFFLINE into the cargo build containers. The
+containers mount the whole work dir, so the config and the mirror are found
+there too; the vendor directory is written relative to work_dir so that it resolves
+at either mount point. Xargo builds the sysroot crates (sgx_tstd and the rest of
+teaclave-sgx-sdk from its Xargo.toml) outside the project: they do not see the
+config and still fetch their git dependencies, so the xargo containers do not get
+CARGO_NET_OFFLINE. The projects are vendored again only when one of their
+Cargo.lock files changed (state in vendor.json).
+
+Lockfiles are resolved by the host's cargo, whose new lockfiles use format version 4;
+the SGX toolchain's cargo only reads up to version 3, so the lockfiles generated here
+are written back at LOCKFILE_VERSION. Existing lockfiles keep their version: cargo
+update does not raise it.
+
+`registry` is a directory source (a vendor directory of .crate contents with
+.cargo-checksum.json files) that replaces crates.io while resolving, so the whole
+flow runs against a local stand-in without network. Cargo ignores `--precise` for
+directory sources, so a stand-in pins by holding only the compatible versions.
+
+    manager = VendorManager("forked_repo")
+    report = manager.vendor()    # {"projects": 40, "crates": 212, "pins": {...}, ...}
+    offline_env("forked_repo")   # {"CARGO_NET_OFFLINE": "true"} once vendored
+"""
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import re
+import time
+import tomllib
+import urllib.parse
+
+from src.tool.manifest import SKIP_DIRS, load_manifest
+from src.tracing import span
+
+VENDOR_DIR = ".forge-vendor"
+CONFIG_MARKER = "# generated by src/compilation/vendor.py"
+# SGX 工具链（nightly-2020-10-25）的 cargo 能解析的最后版本
+SGX_PINS = {"libc": "0.2.77", "cc": "1.0.28"}
+LOCKFILE_VERSION = 3
+_LOCK_VERSION_RE = re.compile(r'^version = (\d+)$', re.M)
+_GIT_SOURCE_RE = re.compile(r'^(source = "git\+[^"?#]*)([^"]*)"$', re.M)
+
+
+def build_roots(project_path):
+    """
+    The Cargo.toml files under project_path that are not members of a workspace found there.
+    """
+    manifests = []
+    for dirpath, dirnames, filenames in os.walk(project_path):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
+        if "Cargo.toml" in filenames:
+            manifests.append(os.path.join(dirpath, "Cargo.toml"))
+    members = set()
+    for path in manifests:
+        try:
+            manifest = load_manifest(path)
+        except (tomllib.TOMLDecodeError, UnicodeDecodeError):
+            continue
+        for member in manifest.members:
+            for member_dir in glob.glob(os.path.join(os.path.dirname(path), member)):
+                members.add(os.path.join(os.path.normpath(member_dir), "Cargo.toml"))
+    return sorted(path for path in manifests if path not in members)
+
+
+def locked_versions(lock_path):
+    """
+    {package: [versions]} in a Cargo.lock.
+    """
+    with open(lock_path, 'rb') as f:
+        data = tomllib.load(f)
+    versions = {}
+    for package in data.get("package", []):
+        versions.setdefault(package["name"], []).append(package["version"])
+    return versions
+
+
+def downgrade_lockfile(lock_path, version=LOCKFILE_VERSION):
+    """
+    Rewrite a Cargo.lock of a newer format at `version`. Returns True if it changed.
+    Version 4 only differs from 3 by percent-encoding the query of git sources.
+    """
+    with open(lock_path, 'r') as f:
+        text = f.read()
+    match = _LOCK_VERSION_RE.search(text)
+    if match is None or int(match.group(1)) <= version:
+        return False
+    text = _LOCK_VERSION_RE.sub(f"version = {version}", text, count=1)
+    text = _GIT_SOURCE_RE.sub(lambda m: f'{m.group(1)}{urllib.parse.unquote(m.group(2))}"', text)
+    with open(lock_path + ".tmp", 'w') as f:
+        f.write(text)
+    os.replace(lock_path + ".tmp", lock_path)
+    return True
+
+
+def offline_env(work_dir, toolchain="cargo"):
+    """
+    The environment that keeps builds under work_dir offline, once it has been vendored.
+    Empty for xargo: its sysroot build is not covered by the mirror (see above).
+    """
+    if toolchain == "xargo":
+        return {}
+    config_path = os.path.join(work_dir, ".cargo", "config.toml")
+    if not os.path.isfile(config_path):
+        return {}
+    with open(config_path, 'r') as f:
+        return {"CARGO_NET_OFFLINE": "true"} if f.readline().strip() == CONFIG_MARKER else {}
+
+
+class VendorManager:
+    """
+    :param work_dir: forked_repo; its .gitmodules lists the projects
+    :param pins: {package: version} forced into every lockfile that contains the package
+    :param registry: directory source replacing crates.io while resolving (a local stand-in)
+    :param cargo: the cargo that resolves; the lockfiles it generates are written back at LOCKFILE_VERSION
+    """
+
+    def __init__(self, work_dir, pins=SGX_PINS, registry=None, cargo="cargo"):
+        self.work_dir = os.path.abspath(work_dir)
+        self.pins = dict(pins)
+        self.registry = os.path.abspath(registry) if registry else None
+        self.cargo = cargo
+        self.vendor_dir = os.path.join(self.work_dir, VENDOR_DIR)
+        self.state_path = os.path.join(self.vendor_dir, "vendor.json")
+        self.config_path = os.path.join(self.work_dir, ".cargo", "config.toml")
+
+    def _cargo(self, args, cwd):
+        cmd = [self.cargo] + args
+        if self.registry:
+            cmd += ["--config", 'source.crates-io.replace-with="forge-registry"',
+                    "--config", f'source.forge-registry.directory="{self.registry}"']
+        return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+
+    def projects(self):
+        projects = []
+        gitmodules_path = os.path.join(self.work_dir, '.gitmodules')
+        if os.path.isfile(gitmodules_path):
+            with open(gitmodules_path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith('path = '):
+                        project = line.split('=', 1)[1].strip()
+                        if os.path.isdir(os.path.join(self.work_dir, project)):
+                            projects.append(project)
+        return projects
+
+    def pin(self, manifest_path):
+        """
+        Make sure manifest_path has a Cargo.lock the SGX toolchain can read and apply
+        the pins to it. Returns {package: "old -> new"} or {package: error} for the pins that applied.
+        """
+        manifest_dir = os.path.dirname(manifest_path)
+        lock_path = os.path.join(manifest_dir, "Cargo.lock")
+        if not os.path.isfile(lock_path):
+            result = self._cargo(["generate-lockfile"], manifest_dir)
+            if result.returncode != 0:
+                raise RuntimeError(f"cargo generate-lockfile failed in {manifest_dir}:\n{result.stderr}")
+            downgrade_lockfile(lock_path)
+        changes = {}
+        for package, version in self.pins.items():
+            for current in locked_versions(lock_path).get(package, []):
+                if current == version:
+                    continue
+                result = self._cargo(["update", "-p", f"{package}@{current}", "--precise", version], manifest_dir)
+                if result.returncode != 0:
+                    changes[package] = result.stderr.strip().splitlines()[-1]
+                elif version in locked_versions(lock_path).get(package, []):
+                    changes[package] = f"{current} -> {version}"
+                else:
+                    # 目录源会忽略 --precise：镜像里只放兼容版本才能固定
+                    changes[package] = f"kept {current}: the source ignored --precise {version}"
+        return changes
+
+    def _lock_digest(self, manifests):
+        digest = hashlib.sha1()
+        for path in manifests:
+            lock_path = os.path.join(os.path.dirname(path), "Cargo.lock")
+            digest.update(path.encode() + b"\0")
+            if os.path.isfile(lock_path):
+                with open(lock_path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    @contextlib.contextmanager
+    def _resolving(self):
+        """
+        Move our config aside while resolving: with it, cargo would only see the vendored crates.
+        """
+        aside = self.config_path + ".resolving"
+        moved = os.path.isfile(self.config_path) and offline_env(self.work_dir)
+        if moved:
+            os.replace(self.config_path, aside)
+        try:
+            yield
+        finally:
+            if moved and not os.path.isfile(self.config_path):
+                os.replace(aside, self.config_path)
+            elif moved:
+                os.remove(aside)
+
+    def vendor(self, force=False):
+        """
+        Pin and vendor every project, unless no lockfile changed since the last run.
+        Returns the report, also saved as vendor.json.
+        """
+        with self._resolving():
+            return self._vendor(force)
+
+    def _vendor(self, force):
+        start = time.perf_counter()
+        manifests, pins = [], {}
+        with span("vendor.pin", category="build"):
+            for project in self.projects():
+                for manifest_path in build_roots(os.path.join(self.work_dir, project)):
+                    try:
+                        changes = self.pin(manifest_path)
+                    except RuntimeError as e:
+                        print(f"Not vendoring {manifest_path}: {e}")
+                        continue
+                    manifests.append(manifest_path)
+                    if changes:
+                        pins[os.path.relpath(manifest_path, self.work_dir)] = changes
+        if not manifests:
+            raise RuntimeError(f"No Cargo project could be resolved under {self.work_dir}")
+
+        digest = self._lock_digest(manifests)
+        if not force and os.path.isfile(self.state_path) and os.path.isfile(self.config_path + ".resolving"):
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state.get("digest") == digest:
+                return dict(state, pins=pins, vendored=False)
+
+        with span("vendor.sync", category="build", manifests=len(manifests)):
+            args = ["vendor", "--versioned-dirs", "--manifest-path", manifests[0]]
+            if self.registry:
+                # 否则 cargo vendor 忽略源替换，直接访问 crates.io
+                args.append("--respect-source-config")
+            for manifest_path in manifests[1:]:
+                args += ["--sync", manifest_path]
+            result = self._cargo(args + [VENDOR_DIR], self.work_dir)
+        if result.returncode != 0:
+            raise RuntimeError(f"cargo vendor failed:\n{result.stderr}")
+        self._write_config(result.stdout)
+
+        report = {
+            "digest": digest,
+            "projects": len({os.path.relpath(path, self.work_dir).split(os.sep)[0] for path in manifests}),
+            "manifests": len(manifests),
+            "crates": sum(1 for name in os.listdir(self.vendor_dir) if os.path.isdir(os.path.join(self.vendor_dir, name))),
+            "pins": pins,
+            "seconds": time.perf_counter() - start,
+        }
+        with open(self.state_path + ".tmp", 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(self.state_path + ".tmp", self.state_path)
+        return dict(report, vendored=True)
+
+    def _write_config(self, source_config):
+        if os.path.isfile(self.config_path):
+            with open(self.config_path, 'r') as f:
+                if f.readline().strip() != CONFIG_MARKER:
+                    raise RuntimeError(f"{self.config_path} exists and was not written by the vendor manager")
+        os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
+        # 目录必须相对于 work_dir：容器里 work_dir 挂载在另一个路径
+        source_config = source_config.replace(f'"{self.vendor_dir}"', f'"{VENDOR_DIR}"')
+        with open(self.config_path + ".tmp", 'w') as f:
+            f.write(f"{CONFIG_MARKER}\n{source_config.strip()}\n\n[net]\noffline = true\n")
+        os.replace(self.config_path + ".tmp", self.config_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vendor the dependencies of every forked crate for offline builds.")
+    parser.add_argument("work_dir", nargs="?", default="forked_repo")
+    parser.add_argument("--registry", help="directory source replacing crates.io while resolving")
+    parser.add_argument("--force", action="store_true", help="vendor even if no lockfile changed")
+    parser.add_argument("--pin", action="append", default=[], metavar="PACKAGE=VERSION",
+                        help="pin in addition to the SGX defaults")
+    args = parser.parse_args()
+
+    pins = dict(SGX_PINS, **dict(pin.split("=", 1) for pin in args.pin))
+    report = VendorManager(args.work_dir, pins, args.registry).vendor(args.force)
+    print(json.dumps(report, indent=2))
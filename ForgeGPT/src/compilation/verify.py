@@ -0,0 +1,141 @@
+"""
+Tiered verification of an SGX project.
+
+Tier 1 runs `check` (type and resolution errors, no codegen) for every toolchain,
+tier 2 the full builds, and the first failure stops the run. The check tier is
+optional: it runs only where a docker-sgx-*-check helper is defined, and builds
+alone verify the project otherwise. Within a tier the
+toolchains are ordered by their historical failure rate for the project, so the
+toolchain most likely to fail is tried first. Outcomes and the time spent in each
+tier are kept per project in a JSON history file under changes/.forge/, next to the
+project diffs but outside the files iter_all_changes reads.
+
+    verify_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path))
+"""
+import json
+import os
+import threading
+import time
+
+from src.compilation.compile import run_sgx_helper, HelperNotFound, BuildTimeout, helper_source
+from src.tracing import span
+
+TOOLCHAINS = ("xargo", "cargo")
+TIERS = ("check", "build")
+HISTORY_PATH = os.getenv("FORGE_BUILD_HISTORY", "/workspaces/TEE-Forge-It/changes/.forge/build_history.json")
+
+
+class BuildHistory:
+    """
+    {project: {toolchain: {tier: {"runs", "failures", "seconds"}}}}. Saved after every
+    update when the parent of the history file's directory exists (the directory is
+    created), kept in memory otherwise.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self.projects = {}
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.projects = json.load(f)
+
+    def record(self, project, toolchain, tier, seconds, success):
+        with self._lock:
+            row = self.projects.setdefault(project, {}).setdefault(toolchain, {}).setdefault(
+                tier, {"runs": 0, "failures": 0, "seconds": 0.0})
+            row["runs"] += 1
+            row["seconds"] += seconds
+            if not success:
+                row["failures"] += 1
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(os.path.dirname(directory)):
+            return
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.projects, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def failure_rate(self, project, toolchain):
+        """
+        Failures over runs in all tiers, with add-one smoothing so unseen toolchains sit at 0.5.
+        """
+        rows = self.projects.get(project, {}).get(toolchain, {}).values()
+        runs = sum(r["runs"] for r in rows)
+        failures = sum(r["failures"] for r in rows)
+        return (failures + 1) / (runs + 2)
+
+    def order(self, project, toolchains=TOOLCHAINS):
+        # sorted() 是稳定的，失败率相同时保持原顺序
+        return sorted(toolchains, key=lambda t: -self.failure_rate(project, t))
+
+    def tier_seconds(self, project):
+        """
+        Total seconds spent per tier for project.
+        """
+        totals = dict.fromkeys(TIERS, 0.0)
+        for tiers in self.projects.get(project, {}).values():
+            for tier, row in tiers.items():
+                totals[tier] = totals.get(tier, 0.0) + row["seconds"]
+        return totals
+
+
+_HISTORY = BuildHistory()
+# check 脚本不存在时不再尝试
+_missing_helpers = set()
+
+
+def get_build_history():
+    return _HISTORY
+
+
+def verify_sgx_project(work_dir, project_name, toolchains=TOOLCHAINS, tiers=TIERS, history=None, timeout=None):
+    """
+    Verify project_name with the cheapest tier first and escalate to full builds only
+    when every check passes. Raises RuntimeError with the failing output like the
+    build functions. A tier whose helper is not defined (in ~/.bashrc, or the file
+    FORGE_SGX_HELPERS names) is skipped with a warning.
+    With a timeout (seconds for all steps) a step still running at the deadline is
+    killed and BuildTimeout raised.
+    Returns {"<tier>.<toolchain>": seconds} for the steps that ran.
+    """
+    history = history or _HISTORY
+    ordered = history.order(project_name, toolchains)
+    timings = {}
+    deadline = time.perf_counter() + timeout if timeout is not None else None
+    with span("verify", category="build", project=project_name, order=",".join(ordered)) as verify_span:
+        for tier in tiers:
+            for toolchain in ordered:
+                if (tier, toolchain) in _missing_helpers:
+                    continue
+                start = time.perf_counter()
+                if deadline is not None and start >= deadline:
+                    raise BuildTimeout(f"no time left for {tier}.{toolchain}")
+                try:
+                    run_sgx_helper(work_dir, project_name, toolchain, tier,
+                                   None if deadline is None else deadline - start)
+                except HelperNotFound as e:
+                    print(f"WARNING: {e} is not defined in {helper_source()}; the {tier} tier is inactive for "
+                          f"{toolchain} and every verification of it goes to the next tier")
+                    _missing_helpers.add((tier, toolchain))
+                    continue
+                except BuildTimeout:
+                    verify_span.set(timed_out=f"{tier}.{toolchain}", **timings)
+                    raise
+                except RuntimeError:
+                    seconds = time.perf_counter() - start
+                    timings[f"{tier}.{toolchain}"] = seconds
+                    history.record(project_name, toolchain, tier, seconds, False)
+                    verify_span.set(failed=f"{tier}.{toolchain}", **timings)
+                    raise
+                seconds = time.perf_counter() - start
+                timings[f"{tier}.{toolchain}"] = seconds
+                history.record(project_name, toolchain, tier, seconds, True)
+        verify_span.set(**timings)
+    return timings
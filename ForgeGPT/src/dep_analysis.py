@@ -1,14 +1,24 @@
 import os
 import subprocess
 import json
+import hashlib
+import threading
 
-def get_cargo_metadata(project_path):
+from src.tool.manifest import load_manifest
+
+# 依赖图缓存，Cargo.toml/Cargo.lock 不变时不再运行 cargo metadata；放在 changes/.forge/，不与项目 diff 混在一起
+DEP_CACHE_PATH = os.getenv("FORGE_DEP_CACHE", "/workspaces/TEE-Forge-It/changes/.forge/dep_graph_cache.json")
+
+def get_cargo_metadata(project_path, no_deps=True):
     """
     Runs `cargo metadata` in the given Rust project directory and returns parsed JSON output.
+    With no_deps=False the full dependency resolution ("resolve") is included.
     """
+    # 加上 --no-deps 只获取主包及直接依赖
+    cmd = ["cargo", "metadata", "--format-version", "1"] + (["--no-deps"] if no_deps else [])
     try:
         result = subprocess.run(
-            ["cargo", "metadata", "--format-version", "1", "--no-deps"],  # 加上 --no-deps 只获取主包及直接依赖
+            cmd,
             cwd=project_path,
             capture_output=True,
             text=True,
@@ -18,6 +28,9 @@ def get_cargo_metadata(project_path):
     except subprocess.CalledProcessError as e:
         print(f"Error running cargo metadata: {e.stderr}")
         return None
+    except FileNotFoundError:
+        print("cargo is not installed")
+        return None
 
 def analyze_dependencies(metadata):
     """
@@ -45,9 +58,192 @@ def print_dependencies(dependencies):
     for dep in dependencies:
         print(f"- {dep['name']} ({dep['req']}) [{dep['kind']}] Source: {dep['source']}")
 
+def _manifest_key(project_path):
+    digest = hashlib.sha1()
+    for name in ("Cargo.toml", "Cargo.lock"):
+        path = os.path.join(project_path, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                digest.update(name.encode() + f.read())
+    return digest.hexdigest()
+
+
+def _resolved_crates(metadata):
+    """
+    (root package name, {name: manifest_path}) of every package reachable from the root in the resolve graph.
+    """
+    packages = {p["id"]: p for p in metadata["packages"]}
+    resolve = metadata.get("resolve") or {}
+    nodes = {n["id"]: n for n in resolve.get("nodes", [])}
+    roots = [resolve["root"]] if resolve.get("root") else metadata.get("workspace_members", [])
+    reachable, stack = set(), list(roots)
+    while stack:
+        node_id = stack.pop()
+        if node_id in reachable:
+            continue
+        reachable.add(node_id)
+        node = nodes.get(node_id, {})
+        stack.extend(node.get("dependencies", []))
+    crates = {packages[i]["name"]: packages[i]["manifest_path"] for i in reachable - set(roots) if i in packages}
+    root_name = packages[roots[0]]["name"] if roots and roots[0] in packages else None
+    return root_name, crates
+
+
+def _manifest_crates(project_path):
+    # cargo metadata 失败时（没有网络等）只读 Cargo.toml 中的直接依赖
+    manifest = load_manifest(os.path.join(project_path, "Cargo.toml"))
+    crates = {}
+    for dep in manifest.dependencies:
+        if dep.kind in ("normal", "build", "patch"):
+            crates[dep.package] = os.path.join(project_path, dep.path, "Cargo.toml") if dep.path else None
+    return manifest.name, crates
+
+
+class DependencyCache:
+    """
+    {project_path: {"key", "name", "crates": {name: manifest_path}, "resolved"}} JSON
+    file; an entry is reused while the project's Cargo.toml and Cargo.lock are unchanged.
+    """
+
+    def __init__(self, path=DEP_CACHE_PATH):
+        self.path = path
+        self.projects = {}
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.projects = json.load(f)
+
+    def get(self, project_path):
+        key = _manifest_key(project_path)
+        entry = self.projects.get(project_path)
+        if entry and entry["key"] == key and entry["resolved"]:
+            return entry
+        metadata = get_cargo_metadata(project_path, no_deps=False)
+        if metadata is not None:
+            name, crates = _resolved_crates(metadata)
+            resolved = True
+        else:
+            name, crates = _manifest_crates(project_path)
+            resolved = False
+        # cargo metadata 可能刚生成 Cargo.lock
+        key = _manifest_key(project_path)
+        entry = {"key": key, "name": name or os.path.basename(project_path), "crates": crates, "resolved": resolved}
+        with self._lock:
+            self.projects[project_path] = entry
+            self._save()
+        return entry
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(os.path.dirname(directory)):
+            return
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.projects, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def build_dependency_graph(project_paths, cache=None):
+    """
+    {project_path: set of project_paths it depends on}, restricted to project_paths.
+    A dependency is one of the projects when the resolved package lives inside that
+    project's directory (path dependencies, [patch] entries) or has its package name.
+    """
+    cache = cache or DependencyCache()
+    entries = {p: cache.get(p) for p in project_paths}
+    by_name = {entry["name"]: p for p, entry in entries.items()}
+    by_dir = {os.path.abspath(p) + os.sep: p for p in project_paths}
+    graph = {}
+    for project_path, entry in entries.items():
+        deps = set()
+        for name, manifest_path in entry["crates"].items():
+            target = by_name.get(name)
+            if manifest_path:
+                target = next((p for d, p in by_dir.items() if os.path.abspath(manifest_path).startswith(d)), target)
+            if target and target != project_path:
+                deps.add(target)
+        graph[project_path] = deps
+    return graph
+
+
+def strongly_connected_components(graph):
+    """
+    The strongly connected components of graph ({node: dependencies}) as lists of
+    nodes, dependencies before their dependents (Tarjan, without recursion).
+    """
+    index, lowlink, on_stack = {}, {}, set()
+    stack, components = [], []
+    for root in sorted(graph):
+        if root in index:
+            continue
+        work = [(root, iter(sorted(graph[root] & graph.keys())))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            child = next(children, None)
+            if child is None:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+            elif child not in index:
+                index[child] = lowlink[child] = len(index)
+                stack.append(child)
+                on_stack.add(child)
+                work.append((child, iter(sorted(graph[child] & graph.keys()))))
+            elif child in on_stack:
+                lowlink[node] = min(lowlink[node], index[child])
+    return components
+
+
+def migration_levels(graph):
+    """
+    Topological levels of the graph: level 0 has no dependencies inside the graph and
+    every project comes after all of its dependencies. The projects of a dependency
+    cycle (a strongly connected component) share a level, placed after every
+    dependency of the cycle; the others keep their topological order.
+    """
+    graph = {p: set(deps) for p, deps in graph.items()}
+    component_of = {}
+    for component in strongly_connected_components(graph):
+        if len(component) > 1:
+            print(f"Dependency cycle between {[os.path.basename(p) for p in component]}")
+        for p in component:
+            component_of[p] = component[0]
+    # 缩点后按组件分层，同一个环的项目一起开始
+    members, remaining = {}, {}
+    for p, deps in graph.items():
+        c = component_of[p]
+        members.setdefault(c, []).append(p)
+        remaining.setdefault(c, set()).update(component_of[d] for d in deps if d in graph and component_of[d] != c)
+    levels = []
+    while remaining:
+        ready = [c for c, deps in remaining.items() if not deps]
+        levels.append(sorted(p for c in ready for p in members[c]))
+        for c in ready:
+            del remaining[c]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return levels
+
+
 if __name__ == "__main__":
     project_path = os.getenv("CARGO_PROJECT_PATH", ".")
     print(project_path)
     metadata = get_cargo_metadata(project_path)
     deps = analyze_dependencies(metadata)
-    print_dependencies(deps)
\ No newline at end of file
+    print_dependencies(deps)
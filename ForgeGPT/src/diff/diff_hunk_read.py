@@ -1,7 +1,13 @@
 import os
 import re
+import json
 
 HUNK_HEADER_RE = re.compile(r'^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@')
+# 一次扫描同时匹配 hunk 头和文件头（diff --git a/x b/y）
+_SECTION_RE = re.compile(r'^(?:@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@[^\n]*|diff ([^\n]*))$', re.M)
+_GIT_PATHS_RE = re.compile(r'^--git a/(.*) b/(.*)$')
+_BODY_PREFIXES = (' ', '+', '-', '\\')
+_FILE_HEADER_RE = re.compile(r'^(---|\+\+\+) (?:[ab]/)?([^\t\n]*)', re.M)
 
 class DiffHunk:
     def __init__(self, old_start, old_count, new_start, new_count, lines):
@@ -42,16 +48,185 @@ def parse_diff_hunks(diff_text):
     return hunks
 
 
-import json
+class FileHeader:
+    """
+    Per-file header of a diff (the `diff --git` line and the `---`/`+++` lines).
+    """
+    __slots__ = ('old_path', 'new_path', 'text')
 
+    def __init__(self, old_path, new_path, text):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.text = text
 
-def parse_changes_project(project_change_json_path):
+    @property
+    def path(self):
+        if self.new_path and self.new_path != '/dev/null':
+            return self.new_path
+        return self.old_path
+
+    def __repr__(self):
+        return f"<FileHeader {self.old_path} -> {self.new_path}>"
+
+
+class CompactHunk:
     """
-    Parses a JSON file containing changes for a project.
+    A hunk that keeps only offsets into the diff buffer it was parsed from.
+    Exposes the same attributes as DiffHunk; `lines` is materialized on access.
+    """
+    __slots__ = ('buffer', 'start', 'end', 'old_start', 'old_count', 'new_start', 'new_count', 'file')
+
+    def __init__(self, buffer, start, end, old_start, old_count, new_start, new_count, file=None):
+        self.buffer = buffer  # shared by every hunk of the same buffer
+        self.start = start  # offset of the first body line
+        self.end = end  # offset after the body (next header or end of buffer)
+        self.old_start = int(old_start)
+        self.old_count = int(old_count) if old_count else 1
+        self.new_start = int(new_start)
+        self.new_count = int(new_count) if new_count else 1
+        self.file = file  # FileHeader or None
+
+    @property
+    def lines(self):
+        lines = self.buffer[self.start:self.end].splitlines()
+        # hunk 头给出的行数用完后，剩下的是夹带的非 diff 文本（如 *_changes.txt 中的分隔线）
+        old, new = self.old_count, self.new_count
+        for i, line in enumerate(lines):
+            if old <= 0 and new <= 0 and not line.startswith('\\'):
+                return lines[:i]
+            tag = line[:1]
+            if tag == '-':
+                old -= 1
+            elif tag == '+':
+                new -= 1
+            elif tag != '\\':
+                # 上下文行；空行是去掉了前导空格的空上下文行
+                old -= 1
+                new -= 1
+        # 行数不够（头部不准）：只去掉末尾的非空非 diff 文本
+        while lines and lines[-1] and lines[-1][:1] not in _BODY_PREFIXES:
+            lines.pop()
+        return lines
+
+    def to_diff_hunk(self):
+        return DiffHunk(self.old_start, self.old_count, self.new_start, self.new_count, self.lines)
+
+    def __repr__(self):
+        return (f"<CompactHunk -{self.old_start},{self.old_count} "
+                f"+{self.new_start},{self.new_count} bytes={self.end - self.start}>")
+
+
+def _file_header(buffer, match, end):
+    """Build a FileHeader from a `diff ...` match and the header lines up to `end`."""
+    text = buffer[match.start():end]
+    old_path = new_path = None
+    paths = _GIT_PATHS_RE.match(match.group(5))
+    if paths:
+        old_path, new_path = paths.groups()
+    for tag, path in _FILE_HEADER_RE.findall(text):
+        if tag == '---':
+            old_path = path
+        else:
+            new_path = path
+    return FileHeader(old_path, new_path, text)
+
+
+def _iter_buffer_hunks(buffer, file=None):
+    hunk = None  # header match of the hunk whose body is still open
+    header = None  # `diff` match of the file header still open
+    for match in _SECTION_RE.finditer(buffer):
+        if hunk is not None:
+            yield CompactHunk(buffer, hunk.end() + 1, match.start(), *hunk.group(1, 2, 3, 4), file=file)
+            hunk = None
+        if header is not None:
+            # 文件头一直延伸到下一个 hunk 头或文件头
+            file = _file_header(buffer, header, match.start())
+            header = None
+        if match.group(5) is not None:
+            header = match
+        else:
+            hunk = match
+    if hunk is not None:
+        yield CompactHunk(buffer, hunk.end() + 1, len(buffer), *hunk.group(1, 2, 3, 4), file=file)
+
+
+def iter_diff_hunks(source, chunk_size=1 << 20):
+    """
+    Lazily parse hunks from a diff.
+
+    source is either a string (one shared buffer for all hunks) or a text file
+    object, which is read in chunks and cut at `diff ` file boundaries so that only
+    one file section is buffered at a time.
+    Yields CompactHunk objects; hunk.file carries the per-file header.
+    """
+    if isinstance(source, str):
+        yield from _iter_buffer_hunks(source)
+        return
+    pending = ''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        # 在最后一个文件边界处切分，剩余部分留到下一轮
+        cut = pending.rfind('\ndiff ')
+        if cut <= 0:
+            continue
+        section, pending = pending[:cut + 1], pending[cut + 1:]
+        yield from _iter_buffer_hunks(section)
+    if pending:
+        yield from _iter_buffer_hunks(pending)
+
+
+def load_project_changes(path):
+    """
+    The {rel_file: {"git_diff": ...}} of a project change JSON (as written by
+    repo_diff.py), or None for any other JSON kept in the changes directory.
+    """
+    if not path.endswith('.json') or path.endswith('.deltacompile.json'):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            changes = json.load(f)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(changes, dict) or not all(
+            isinstance(change, dict) and isinstance(change.get("git_diff"), str) for change in changes.values()):
+        return None
+    return changes
+
+
+def iter_changes_project(project_change_json_path):
+    """
+    Lazily parse a project change JSON (as written by repo_diff.py).
+    Yields (rel_file, CompactHunk); each file's git_diff text is the shared buffer.
+    Yields nothing for a file that is not a project change JSON.
+    """
+    changes = load_project_changes(project_change_json_path) or {}
+    for change_file in list(changes):
+        diff_text = changes.pop(change_file)["git_diff"]
+        for hunk in _iter_buffer_hunks(diff_text):
+            yield change_file, hunk
+
+
+def iter_all_changes(directory="changes"):
+    """
+    Lazily parse every project change JSON in `directory`, one project at a time.
+    Other JSON files in the directory (delta compile results, caches) are skipped.
+    Yields (json_file_name, rel_file, CompactHunk).
+    """
+    for fname in sorted(os.listdir(directory)):
+        path = os.path.join(directory, fname)
+        if os.path.isfile(path):
+            for rel_file, hunk in iter_changes_project(path):
+                yield fname, rel_file, hunk
+
+
+def parse_changes(changes):
+    """
+    Parses the changes returned by load_project_changes.
     Returns a dict: {filename: [DiffHunk, ...]}
     """
-    with open(project_change_json_path, 'r', encoding='utf-8') as f:
-        changes = json.load(f)
     result = {}
     for change_file in changes:
         diff_text = changes[change_file]["git_diff"]
@@ -60,6 +235,14 @@ def parse_changes_project(project_change_json_path):
     return result
 
 
+def parse_changes_project(project_change_json_path):
+    """
+    Parses a JSON file containing changes for a project.
+    Returns a dict: {filename: [DiffHunk, ...]}, empty for a file that is not a project change JSON.
+    """
+    return parse_changes(load_project_changes(project_change_json_path) or {})
+
+
 def parse_all_changes(directory="changes"):
     """
     Parses all .json files in the given directory as git diff hunks.
@@ -67,13 +250,17 @@ def parse_all_changes(directory="changes"):
     """
     result = {}
     for fname in os.listdir(directory):
-        if fname.endswith('.json'):
-            path = os.path.join(directory, fname)
-            result[fname] = parse_changes_project(path)
+        path = os.path.join(directory, fname)
+        # 分类时已经读入的数据直接解析，不再读第二遍
+        changes = load_project_changes(path) if os.path.isfile(path) else None
+        if changes is not None:
+            result[fname] = parse_changes(changes)
     return result
 
 # Example usage:
 if __name__ == "__main__":
-    all_hunks = parse_all_changes()
-    for fname, hunks in all_hunks.items():
-        print(f"{fname}: {hunks.keys()}")
+    files = {}
+    for fname, rel_file, hunk in iter_all_changes():
+        files.setdefault(fname, set()).add(rel_file)
+    for fname, rel_files in files.items():
+        print(f"{fname}: {sorted(rel_files)}")
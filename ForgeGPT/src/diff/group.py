@@ -11,8 +11,38 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../model'))
 import sys
 import os
 
+import difflib
+import json
+import re
+
 from src.model.chatgpt import gpt3_5_turbo as model
 from src.diff.git_util import get_git_diff
+from src.diff.diff_hunk_read import parse_diff_hunks
+from src.diff.rust_items import top_level_items, items_in_range
+
+# 常见的 SGX 移植改动：(pattern, 匹配改动行的正则, 摘要)，按顺序匹配
+SGX_PATTERNS = [
+    ("sgx_prelude", re.compile(r'no_std\b|extern crate sgx_tstd|feature\(rustc_private\)'),
+     "Add the no_std / `sgx_tstd as std` crate prelude"),
+    ("std_prelude_import", re.compile(r'^use std::(prelude::v1::\*|vec::Vec|string::(String|ToString)|boxed::Box|borrow::ToOwned|vec\b|format\b)'),
+     "Import std prelude items that sgx_tstd does not bring into scope"),
+    ("sgx_sync", re.compile(r'\bSgx(Mutex|RwLock|Condvar|Thread)\w*\b|sgx_tstd::sync'),
+     "Use the SGX synchronization primitives"),
+    ("sgx_cfg_gate", re.compile(r'#!?\[cfg(_attr)?\((not\()?(all\(|any\()?target_env\s*=\s*"sgx"'),
+     "Gate code on target_env = \"sgx\""),
+    ("sgx_crate", re.compile(r'\bsgx_(types|trts|tcrypto|rand|libc|tseal|tprotected_fs|tse|alloc|urts)\b'),
+     "Use SGX SDK crates"),
+    ("std_requirement", re.compile(r'compile_error!|feature\s*=\s*"std"'),
+     "Drop or adapt the std feature requirement"),
+    ("test_code", re.compile(r'#\[(cfg\(test\)|test)\]'),
+     "Remove tests that cannot run inside the enclave"),
+]
+# 这些模式匹配到一段连续改动的第一行时，整段都归到该模式
+BLOCK_PATTERNS = {"sgx_prelude", "sgx_cfg_gate", "test_code", "std_requirement"}
+_NEUTRAL_RE = re.compile(r'^\s*(#\[.*\]\s*|//.*)?$')
+_SIGNATURE_RE = re.compile(
+    r'^\s*(?:pub(?:\([^)]*\))?\s+)?(?:unsafe\s+|async\s+|const\s+|extern\s+"[^"]*"\s+)*'
+    r'(fn|struct|enum|union|trait|impl|mod|use|const|static|type|extern\s+crate|macro_rules!)\b')
 
 def parse_diff(diff_text: str) -> List[Dict[str, Any]]:
     """
@@ -53,7 +83,7 @@ def group_diff_actions(diff_text: str) -> List[Dict[str, Any]]:
     return parse_diff(diff_text)
 
 
-def semantic_group_diff_actions(diff_text: str) -> List[Dict[str, Any]]:
+def llm_group_diff_actions(diff_text: str) -> List[Dict[str, Any]]:
     """
     Use LLM to semantically group diff actions from diff text.
     """
@@ -75,6 +105,167 @@ def semantic_group_diff_actions(diff_text: str) -> List[Dict[str, Any]]:
         semantic_groups = [{"summary": "LLM输出解析失败", "actions": diff_text}]
     return semantic_groups
 
+def _item_label(lines, item):
+    body = [line for line in lines[item.start_line - 1:item.end_line] if line.strip()]
+    for line in body:
+        if _SIGNATURE_RE.match(line):
+            return line.strip().split('{')[0].strip()[:80]
+    return body[0].strip()[:80] if body else f"{item.kind} at line {item.start_line}"
+
+
+def _classify(text):
+    for name, regex, _ in SGX_PATTERNS:
+        if regex.search(text):
+            return name
+    return None
+
+
+def _hunk_changes(hunk_index, hunk):
+    """
+    (action, content, new-side line, contiguous block number, offset in hunk.lines) for
+    every +/- line of a hunk.
+    """
+    changes = []
+    new_line = hunk.new_start
+    block = -1
+    in_block = False
+    for offset, line in enumerate(hunk.lines):
+        if line.startswith('+') or line.startswith('-'):
+            if not in_block:
+                block += 1
+                in_block = True
+            action = 'addition' if line.startswith('+') else 'deletion'
+            changes.append((action, line[1:], new_line, (hunk_index, block), offset))
+            if action == 'addition':
+                new_line += 1
+        else:
+            in_block = False
+            if not line.startswith('\\'):
+                new_line += 1
+    return changes
+
+
+def _pattern_per_change(changes):
+    patterns = [None if _NEUTRAL_RE.match(content) else _classify(content.strip()) for _, content, _, _, _ in changes]
+    # 属性、注释和空行跟随同一段中同方向的下一条（没有则上一条）改动
+    for i, (action, content, _, block, _) in enumerate(changes):
+        if patterns[i] is None and _NEUTRAL_RE.match(content):
+            same_side = lambda j: changes[j][3] == block and changes[j][0] == action and not _NEUTRAL_RE.match(changes[j][1])
+            neighbours = [j for j in range(i + 1, len(changes)) if same_side(j)]
+            neighbours += [j for j in range(i - 1, -1, -1) if same_side(j)]
+            if neighbours:
+                patterns[i] = _classify(changes[neighbours[0]][1].strip())
+    # 整段归类：段内同方向第一条有内容的改动匹配 BLOCK_PATTERNS（比如整个 #[cfg(test)] mod）
+    heads = {}
+    for action, content, _, block, _ in changes:
+        if (block, action) not in heads and content.strip():
+            heads[(block, action)] = _classify(content.strip())
+    for i, (action, _, _, block, _) in enumerate(changes):
+        head = heads.get((block, action))
+        if patterns[i] is None and head in BLOCK_PATTERNS:
+            patterns[i] = head
+    # 同一段中相似的删除行和新增行是一次修改，归到同一模式
+    blocks = {}
+    for i, (action, content, _, block, _) in enumerate(changes):
+        if not _NEUTRAL_RE.match(content):
+            blocks.setdefault(block, {'addition': [], 'deletion': []})[action].append(i)
+    for sides in blocks.values():
+        for d in sides['deletion']:
+            ratio, a = max(((difflib.SequenceMatcher(None, changes[d][1].strip(), changes[a][1].strip()).ratio(), a)
+                            for a in sides['addition']), default=(0, None))
+            if ratio >= 0.6:
+                patterns[d] = patterns[d] or patterns[a]
+                patterns[a] = patterns[a] or patterns[d]
+    return patterns
+
+
+def _group_type(actions):
+    kinds = {a['action'] for a in actions}
+    if kinds == {'addition'}:
+        return 'addition'
+    if kinds == {'deletion'}:
+        return 'deletion'
+    return 'update'
+
+
+def _actions_of(changes):
+    text = "\n".join(('+' if action == 'addition' else '-') + content for action, content, _, _, _ in changes)
+    return parse_diff(text)
+
+
+def _llm_summaries(groups):
+    prompt = (
+        "You are an expert that understand code changes. For each numbered group of code changes below, "
+        "write a one-sentence summary of what the changes do.\n"
+        + "\n".join(f"Group {i}: {json.dumps(g['actions'], ensure_ascii=False)}" for i, g in enumerate(groups))
+        + "\nPlease output a JSON array of strings, one summary per group, in order."
+    )
+    response = model.invoke(prompt)
+    text = response.content if hasattr(response, 'content') else str(response)
+    try:
+        summaries = json.loads(text.replace("```", "").replace("json", ""))
+    except ValueError:
+        return None
+    if not isinstance(summaries, list) or len(summaries) != len(groups):
+        return None
+    return [str(summary) for summary in summaries]
+
+
+def semantic_group_diff_actions(diff_text: str, after_code: str = None, use_llm: bool = True) -> List[Dict[str, Any]]:
+    """
+    Group diff actions into semantic change groups without an LLM for the common SGX
+    porting patterns (SGX_PATTERNS). Changes matching a pattern are grouped by
+    pattern across hunks; the others are grouped by their enclosing top-level item
+    of after_code (tree-sitter, see rust_items), or by hunk when after_code is not
+    given. Returns the schema of llm_group_diff_actions plus "pattern", "items",
+    "hunks" (indices in parse_diff_hunks(diff_text)), "ranges" ([{"hunk", "lines"}]:
+    the offsets in hunk.lines of the +/- lines the group covers) and "source". The LLM is
+    asked only for the summaries of unclassified groups, in one call, when use_llm.
+    """
+    hunks = parse_diff_hunks(diff_text)
+    after_lines = after_code.splitlines() if after_code is not None else []
+    items = top_level_items(after_code) if after_code is not None else []
+    groups = {}
+    for hunk_index, hunk in enumerate(hunks):
+        changes = _hunk_changes(hunk_index, hunk)
+        # 不在 after_code 任何 item 里的改动（如整段删除）用段内第一个 item 签名命名
+        block_labels = {}
+        for _, content, _, block, _ in changes:
+            if block not in block_labels and _SIGNATURE_RE.match(content):
+                block_labels[block] = content.strip().split('{')[0].strip()[:80]
+        for change, pattern in zip(changes, _pattern_per_change(changes)):
+            touched = items_in_range(items, change[2], change[2] - (change[0] == 'deletion'))
+            labels = [_item_label(after_lines, items[i]) for i in touched] or [block_labels.get(change[3], f"hunk {hunk_index}")]
+            key = ("pattern", pattern) if pattern else ("item", labels[0])
+            group = groups.setdefault(key, {"changes": [], "items": [], "hunks": [], "lines": {}})
+            group["changes"].append(change)
+            group["lines"].setdefault(hunk_index, []).append(change[4])
+            for label in labels:
+                if label not in group["items"]:
+                    group["items"].append(label)
+            if hunk_index not in group["hunks"]:
+                group["hunks"].append(hunk_index)
+
+    summaries = dict((name, summary) for name, _, summary in SGX_PATTERNS)
+    semantic_groups = []
+    for (kind, key), group in groups.items():
+        actions = _actions_of(group["changes"])
+        group_type = _group_type(actions)
+        pattern = key if kind == "pattern" else None
+        summary = summaries[key] if pattern else f"{group_type.capitalize()} in {', '.join(group['items'][:3])}"
+        semantic_groups.append({
+            "type": group_type, "summary": summary, "actions": actions, "pattern": pattern,
+            "items": group["items"], "hunks": sorted(group["hunks"]), "source": "rules",
+            "ranges": [{"hunk": h, "lines": offsets} for h, offsets in sorted(group["lines"].items())],
+        })
+    unclassified = [g for g in semantic_groups if g["pattern"] is None]
+    if use_llm and unclassified:
+        llm_summaries = _llm_summaries(unclassified)
+        if llm_summaries:
+            for group, summary in zip(unclassified, llm_summaries):
+                group["summary"], group["source"] = summary, "llm"
+    return semantic_groups
+
 # Example usage:
 if __name__ == "__main__":
     file1 = "/workspaces/TEE-Forge-It/original_repo/bytes-sgx/src/lib.rs"
@@ -84,7 +275,8 @@ if __name__ == "__main__":
     actions = group_diff_actions(diff_text)
     for action in actions:
         print(action)
-    print("=== 语义分组（LLM） ===")
-    semantic_actions = semantic_group_diff_actions(diff_text)
+    print("=== 语义分组（AST + LLM） ===")
+    with open(file2, 'r') as f:
+        semantic_actions = semantic_group_diff_actions(diff_text, f.read())
     for group in semantic_actions:
         print(group)
\ No newline at end of file
@@ -0,0 +1,261 @@
+"""
+Multi-hunk patch engine.
+
+Applies (or reverts) a list of diff hunks against a file in one pass. Lines are
+normalized (stripped) and hashed once, candidate positions are looked up through
+an index on the hunk's most selective line, and the search starts at the position
+the hunk header predicts, shifted by the drift observed on the previous hunks.
+Hunks that cannot be located exactly are retried with reduced context (fuzz, as in
+GNU patch); hunks that still cannot be located are reported as conflicts and left
+out of the result instead of being pasted at a guessed position. A hunk whose
+target side, with its full context, is already in the file where the header puts it
+(within max_fuzz lines) is reported as already applied before any fuzz is tried.
+
+The hunk objects only need `old_start`, `new_start` and `lines` attributes, so
+`DiffHunk` (or anything shaped like it) is accepted.
+"""
+
+APPLIED = "applied"
+FUZZY = "fuzzy"
+ALREADY_APPLIED = "already_applied"
+CONFLICT = "conflict"
+
+
+class HunkOutcome:
+    def __init__(self, index, status, expected_line, actual_line=None, fuzz=0):
+        self.index = index
+        self.status = status
+        self.expected_line = expected_line  # 1-based line predicted by the hunk header (after drift)
+        self.actual_line = actual_line  # 1-based line where the hunk was matched, None on conflict
+        self.fuzz = fuzz  # context lines dropped at each end to find the match
+
+    @property
+    def offset(self):
+        if self.actual_line is None:
+            return None
+        return self.actual_line - self.expected_line
+
+    def to_dict(self):
+        return {
+            "hunk_index": self.index,
+            "status": self.status,
+            "expected_line": self.expected_line,
+            "actual_line": self.actual_line,
+            "offset": self.offset,
+            "fuzz": self.fuzz,
+        }
+
+    def __repr__(self):
+        return (f"<HunkOutcome #{self.index} {self.status} "
+                f"expected={self.expected_line} actual={self.actual_line} fuzz={self.fuzz}>")
+
+
+class PatchResult:
+    def __init__(self, content, outcomes):
+        self.content = content
+        self.outcomes = outcomes
+
+    @property
+    def conflicts(self):
+        return [o for o in self.outcomes if o.status == CONFLICT]
+
+    @property
+    def fuzzy(self):
+        return [o for o in self.outcomes if o.status == FUZZY]
+
+    @property
+    def ok(self):
+        return not self.conflicts
+
+    def __repr__(self):
+        return (f"<PatchResult hunks={len(self.outcomes)} conflicts={len(self.conflicts)} "
+                f"fuzzy={len(self.fuzzy)}>")
+
+
+def split_hunk_lines(hunk_lines):
+    """
+    Split the body of a hunk into (old_chunk, new_chunk, kinds).
+    kinds[i] is ' ', '-' or '+' for every body line kept, in order.
+    """
+    old_chunk, new_chunk, kinds = [], [], []
+    for line in hunk_lines:
+        if line.startswith('\\'):
+            # "\ No newline at end of file"
+            continue
+        tag = line[:1]
+        text = line[1:]
+        if tag == '-':
+            old_chunk.append(text)
+            kinds.append('-')
+        elif tag == '+':
+            new_chunk.append(text)
+            kinds.append('+')
+        else:
+            # 上下文行（空行在 splitlines 之后可能丢失前导空格）
+            old_chunk.append(text)
+            new_chunk.append(text)
+            kinds.append(' ')
+    return old_chunk, new_chunk, kinds
+
+
+def _key(line):
+    return hash(line.strip())
+
+
+class _LineIndex:
+    """Hashed, normalized view of the target file with a lazily built position index."""
+
+    def __init__(self, lines):
+        self.keys = [_key(line) for line in lines]
+        self._positions = None
+
+    def positions(self, key):
+        if self._positions is None:
+            positions = {}
+            for i, k in enumerate(self.keys):
+                positions.setdefault(k, []).append(i)
+            self._positions = positions
+        return self._positions.get(key, ())
+
+    def matches(self, pos, chunk_keys):
+        return self.keys[pos:pos + len(chunk_keys)] == chunk_keys
+
+    def find(self, chunk_keys, expected, lower_bound):
+        """
+        Return the match position of chunk_keys closest to `expected`, not before
+        `lower_bound`, or None.
+        """
+        n = len(self.keys)
+        m = len(chunk_keys)
+        if m == 0:
+            return max(lower_bound, min(expected, n))
+        if m > n - lower_bound:
+            return None
+        if 0 <= expected - lower_bound and expected + m <= n and self.matches(expected, chunk_keys):
+            return expected
+        # anchor on the chunk line with the fewest occurrences in the file
+        anchor, anchor_positions = 0, None
+        for j, key in enumerate(chunk_keys):
+            candidates = self.positions(key)
+            if anchor_positions is None or len(candidates) < len(anchor_positions):
+                anchor, anchor_positions = j, candidates
+                if len(candidates) <= 1:
+                    break
+        best = None
+        for p in anchor_positions:
+            start = p - anchor
+            if start < lower_bound or start + m > n:
+                continue
+            if best is not None and abs(start - expected) >= abs(best - expected):
+                continue
+            if self.matches(start, chunk_keys):
+                best = start
+        return best
+
+
+def _locate(index, source, kinds, expected, lower_bound, max_fuzz):
+    """
+    Try to locate `source` in the file, dropping up to max_fuzz leading/trailing
+    context lines. Returns (position, fuzz, drop_head, drop_tail) where position
+    is the line the complete source chunk would start at, or (None, None, 0, 0).
+    """
+    lead = 0
+    while lead < len(kinds) and kinds[lead] == ' ':
+        lead += 1
+    trail = 0
+    while trail < len(kinds) - lead and kinds[len(kinds) - 1 - trail] == ' ':
+        trail += 1
+    source_keys = [_key(line) for line in source]
+    for fuzz in range(0, max_fuzz + 1):
+        drop_head = min(fuzz, lead)
+        drop_tail = min(fuzz, trail)
+        if fuzz > 0 and (drop_head, drop_tail) == (min(fuzz - 1, lead), min(fuzz - 1, trail)):
+            # nothing more to drop
+            break
+        keys = source_keys[drop_head:len(source_keys) - drop_tail]
+        if not keys and source_keys:
+            break
+        pos = index.find(keys, expected + drop_head, lower_bound + drop_head)
+        if pos is not None:
+            return pos - drop_head, fuzz, drop_head, drop_tail
+    return None, None, 0, 0
+
+
+def _already_applied(index, target, expected, target_expected, lower_bound, max_fuzz):
+    """
+    True when the target chunk is in the file between the positions predicted by the
+    two sides of the hunk header, give or take max_fuzz lines. Farther away the
+    same lines are only a coincidence.
+    """
+    low, high = sorted((expected, target_expected))
+    pos = index.find([_key(line) for line in target], (low + high) // 2, lower_bound)
+    return pos is not None and low - max_fuzz <= pos <= high + max_fuzz
+
+
+def patch_hunks(content, hunks, reverse=False, max_fuzz=2):
+    """
+    Apply `hunks` (in order) to `content`.
+
+    reverse=False applies the hunks forward: the '-' side is located in `content`
+    and replaced by the '+' side. reverse=True reverts them: the '+' side is located
+    and replaced by the '-' side.
+
+    Returns a PatchResult carrying the patched content and one HunkOutcome per hunk.
+    """
+    lines = content.splitlines()
+    trailing_newline = content.endswith('\n')
+    index = _LineIndex(lines)
+
+    output = []
+    cursor = 0  # first line of `lines` not yet copied to output
+    drift = 0  # offset between header positions and actual matches so far
+    outcomes = []
+    for hunk_index, hunk in enumerate(hunks):
+        old_chunk, new_chunk, kinds = split_hunk_lines(hunk.lines)
+        if reverse:
+            source, target, start, target_start = new_chunk, old_chunk, hunk.new_start, hunk.old_start
+        else:
+            source, target, start, target_start = old_chunk, new_chunk, hunk.old_start, hunk.new_start
+        # 长度为 0 的一侧在 hunk 头中给出的是变更“之前”的行号
+        base = start - 1 if source else start
+        expected = min(max(base + drift, cursor), len(lines))
+        target_expected = min(max((target_start - 1 if target else target_start) + drift, cursor), len(lines))
+
+        pos, fuzz, drop_head, drop_tail = _locate(index, source, kinds, expected, cursor, max_fuzz)
+        # 在模糊匹配之前检查：否则纯插入的 hunk 会在去掉上下文后再插一次
+        if (pos is None or fuzz) and target \
+                and _already_applied(index, target, expected, target_expected, cursor, max_fuzz):
+            outcomes.append(HunkOutcome(hunk_index, ALREADY_APPLIED, expected + 1))
+            continue
+        if pos is None:
+            outcomes.append(HunkOutcome(hunk_index, CONFLICT, expected + 1))
+            continue
+
+        # context lines dropped by fuzz are kept as they are in the file
+        match_start = pos + drop_head
+        match_end = pos + len(source) - drop_tail
+        output.extend(lines[cursor:match_start])
+        output.extend(target[drop_head:len(target) - drop_tail])
+        cursor = match_end
+        drift = pos - base
+        outcomes.append(HunkOutcome(hunk_index, FUZZY if fuzz else APPLIED, expected + 1, pos + 1, fuzz))
+
+    output.extend(lines[cursor:])
+    result = '\n'.join(output)
+    if trailing_newline and output:
+        result += '\n'
+    return PatchResult(result, outcomes)
+
+
+def apply_hunks(content, hunks, max_fuzz=2):
+    """
+    Apply all hunks forward on `content`. See patch_hunks.
+    """
+    return patch_hunks(content, hunks, reverse=False, max_fuzz=max_fuzz)
+
+
+def revert_hunks(content, hunks, max_fuzz=2):
+    """
+    Revert all hunks on `content` (the post-change file). See patch_hunks.
+    """
+    return patch_hunks(content, hunks, reverse=True, max_fuzz=max_fuzz)
@@ -6,9 +6,11 @@ from src.knowledge.extract_code_change import get_fork_info, get_changed_files_s
 from src.diff.group import semantic_group_diff_actions
 from src.diff.git_util import get_git_diff
 
-def analyze_forked_repo(repo_path: str):
+def analyze_forked_repo(repo_path: str, use_llm: bool = False):
     """
     Analyze a forked repo, retrieve changed rust files since fork point, and compute semantic change groups for each file.
+    The groups are local (AST and SGX patterns); use_llm asks the LLM for the summaries
+    of the unclassified groups, one call per changed file.
     """
     # 获取fork信息
     upstream_remote, upstream_branch, fork_point = get_fork_info(repo_path)
@@ -48,9 +50,10 @@ def analyze_forked_repo(repo_path: str):
         if diff_text.strip() == "":
             os.remove(tmp_upstream_path)
             continue
-        # semantic_groups = semantic_group_diff_actions(diff_text)
-        # result[rust_file] = dict(git_diff = diff_text, semantic_changes = semantic_groups)
-        result[rust_file] = dict(git_diff = diff_text)
+        # 本地 AST 分组；默认不调用 LLM，use_llm 时只为无法归类的分组生成摘要
+        with open(file_path, 'r') as f:
+            semantic_groups = semantic_group_diff_actions(diff_text, f.read(), use_llm=use_llm)
+        result[rust_file] = dict(git_diff = diff_text, semantic_changes = semantic_groups)
         os.remove(tmp_upstream_path)
     return result
 
@@ -77,10 +80,10 @@ if __name__ == "__main__":
                     f.write(f"File: {file}\n")
                     f.write("Git Diff:\n")
                     f.write(change_info['git_diff'] + "\n")
-                    # if 'semantic_changes' in change_info:
-                    #     f.write("Semantic Changes:\n")
-                    #     for change in change_info['semantic_changes']:
-                    #         f.write(json.dumps(change, ensure_ascii=False) + "\n")
+                    if 'semantic_changes' in change_info:
+                        f.write("Semantic Changes:\n")
+                        for change in change_info['semantic_changes']:
+                            f.write(json.dumps(change, ensure_ascii=False) + "\n")
                     f.write("\n" + "="*80 + "\n\n")
             print(f"Saved text changes to {text_output_path}")
         
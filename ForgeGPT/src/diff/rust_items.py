@@ -0,0 +1,179 @@
+"""
+Top-level items of a Rust source file with their 1-based, inclusive line ranges.
+
+Outer attributes and doc comments are attached to the item they precede, so a hunk
+that only edits `#[cfg(...)]` above a function maps to that function. tree-sitter is
+used when it is installed; otherwise a brace-counting line scanner gives the same
+ranges for ordinary, rustfmt-formatted code.
+"""
+import re
+
+try:
+    from tree_sitter import Language, Parser
+    import tree_sitter_rust as tsrust
+    _PARSER = Parser(Language(tsrust.language()))
+except ImportError:
+    _PARSER = None
+
+# items whose change affects the whole crate/module rather than one item; a `use`
+# brings a name into scope for every item that mentions it
+CRATE_LEVEL_KINDS = {"inner_attribute_item", "extern_crate_declaration", "mod_item", "macro_definition",
+                     "use_declaration"}
+
+_ATTACHED_KINDS = {"attribute_item", "line_comment", "block_comment"}
+
+
+class RustItem:
+    __slots__ = ('kind', 'start_line', 'end_line')
+
+    def __init__(self, kind, start_line, end_line):
+        self.kind = kind
+        self.start_line = start_line
+        self.end_line = end_line
+
+    @property
+    def crate_level(self):
+        return self.kind in CRATE_LEVEL_KINDS
+
+    def __repr__(self):
+        return f"<RustItem {self.kind} {self.start_line}-{self.end_line}>"
+
+
+def _tree_sitter_items(source):
+    tree = _PARSER.parse(source.encode())
+    items = []
+    pending_start = None  # first line of attributes/comments waiting for their item
+    for node in tree.root_node.children:
+        start = node.start_point[0] + 1
+        end_row, end_col = node.end_point
+        # line_comment 的结束位置在下一行第 0 列
+        end = end_row if end_col == 0 and end_row > node.start_point[0] else end_row + 1
+        if node.type in _ATTACHED_KINDS:
+            if pending_start is None:
+                pending_start = start
+            continue
+        if node.type == "inner_attribute_item":
+            # `#![...]` 不带前面的注释（通常是 license 头）
+            items.append(RustItem(node.type, start, end))
+        else:
+            items.append(RustItem(node.type, pending_start or start, end))
+        pending_start = None
+    return items
+
+
+_KIND_RE = re.compile(
+    r'^(?:pub(?:\([^)]*\))?\s+)?(?:unsafe\s+|async\s+|const\s+|extern\s+"[^"]*"\s+)*'
+    r'(fn|struct|enum|union|trait|impl|mod|use|const|static|type|extern\s+crate|macro_rules!)\b')
+_SCAN_KINDS = {
+    "fn": "function_item", "struct": "struct_item", "enum": "enum_item", "union": "union_item",
+    "trait": "trait_item", "impl": "impl_item", "mod": "mod_item", "use": "use_declaration",
+    "const": "const_item", "static": "static_item", "type": "type_item",
+    "extern crate": "extern_crate_declaration", "macro_rules!": "macro_definition",
+}
+
+
+def _strip_code(line):
+    # 去掉字符串、字符字面量和行注释，只用于数括号
+    line = re.sub(r'"(?:\\.|[^"\\])*"', '""', line)
+    line = re.sub(r"'(?:\\.|[^'\\])'", "''", line)
+    return line.split('//', 1)[0]
+
+
+def _scanned_items(source):
+    items = []
+    pending_start = None  # first line of attributes/comments waiting for their item
+    attr_depth = 0  # open '[' of a multi-line attribute
+    current = None  # [kind, start_line]
+    depth = 0
+    for lineno, line in enumerate(source.splitlines(), 1):
+        stripped = line.strip()
+        code = _strip_code(line)
+        if current is None:
+            if attr_depth > 0:
+                attr_depth += code.count('[') - code.count(']')
+                continue
+            if not stripped:
+                continue
+            if stripped.startswith('#!['):
+                items.append(RustItem("inner_attribute_item", lineno, lineno))
+                pending_start = None
+                continue
+            if stripped.startswith(('#[', '//', '/*', '*')):
+                if pending_start is None:
+                    pending_start = lineno
+                if stripped.startswith('#['):
+                    attr_depth = code.count('[') - code.count(']')
+                continue
+            match = _KIND_RE.match(stripped)
+            kind = _SCAN_KINDS[re.sub(r'\s+', ' ', match.group(1))] if match else "macro_invocation"
+            current = [kind, pending_start or lineno]
+            pending_start = None
+            depth = 0
+        depth += code.count('{') - code.count('}')
+        if depth <= 0 and code.rstrip().endswith((';', '}')):
+            items.append(RustItem(current[0], current[1], lineno))
+            current = None
+    if current is not None:
+        items.append(RustItem(current[0], current[1], len(source.splitlines())))
+    return items
+
+
+def top_level_items(source):
+    """
+    Top-level items of `source` in file order.
+    """
+    if _PARSER is not None:
+        return _tree_sitter_items(source)
+    return _scanned_items(source)
+
+
+def items_in_range(items, start_line, end_line):
+    """
+    Indices of the items overlapping [start_line, end_line] (1-based, inclusive).
+    An empty range (end_line < start_line, e.g. a pure deletion) matches the item
+    containing start_line.
+    """
+    end_line = max(end_line, start_line)
+    return [i for i, item in enumerate(items) if item.start_line <= end_line and start_line <= item.end_line]
+
+
+def prelude_end(source):
+    """
+    Last line of the file's leading inner attributes (`#![...]`) and `//!` docs, 0 when
+    it has none: `use`, `extern crate` and other items added to the crate go after it.
+    """
+    items = top_level_items(source)
+    insert_at = 0
+    first_item = len(source.splitlines()) + 1
+    for item in items:
+        if item.kind == "inner_attribute_item":
+            insert_at = max(insert_at, item.end_line)
+        else:
+            first_item = min(first_item, item.start_line)
+    for lineno, line in enumerate(source.splitlines()[:first_item - 1], 1):
+        if line.lstrip().startswith(("//!", "/*!")):
+            insert_at = max(insert_at, lineno)
+    return insert_at
+
+
+def inner_items(source, item):
+    """
+    Items inside the braces of item (an impl, trait or inline mod), with line ranges in
+    source, and the last line of item's header (the line with the opening brace).
+    Returns ([], None) when item has no body.
+    """
+    lines = source.splitlines()
+    header_end = None
+    for lineno in range(item.start_line, item.end_line + 1):
+        code = _strip_code(lines[lineno - 1])
+        if code.lstrip().startswith('#'):
+            continue
+        if '{' in code:
+            header_end = lineno
+            break
+    if header_end is None or header_end >= item.end_line:
+        return [], None
+    body = "\n".join(lines[header_end:item.end_line - 1])
+    items = [RustItem(inner.kind, inner.start_line + header_end, inner.end_line + header_end)
+             for inner in top_level_items(body)]
+    return items, header_end
@@ -5,20 +5,66 @@ import json
 # 确保可以导入 group.py 和 chatgpt.py
 from src.diff.group import semantic_group_diff_actions
 from src.diff.git_util import get_git_diff
+from src.diff.diff_hunk_read import DiffHunk, parse_diff_hunks
+from src.diff.patch_engine import revert_hunks
 from src.model.chatgpt import gpt3_5_turbo as model
 
-def undo_semantic_change(diff_text: str, after_code: str, group_index: int) -> str:
+
+def partial_hunk(hunk, offsets):
+    """
+    The part of hunk that only contains the +/- lines at `offsets` (indices in hunk.lines).
+    Added lines outside the part stay as context, removed lines outside it are dropped,
+    so the new side, and with it the position in the post-change file, is unchanged.
+    """
+    offsets = set(offsets)
+    lines = []
+    for offset, line in enumerate(hunk.lines):
+        if line.startswith('+') and offset not in offsets:
+            lines.append(' ' + line[1:])
+        elif line.startswith('-') and offset not in offsets:
+            continue
+        else:
+            lines.append(line)
+    old_count = sum(1 for line in lines if line[:1] in (' ', '-'))
+    new_count = sum(1 for line in lines if line[:1] in (' ', '+'))
+    return DiffHunk(hunk.old_start, old_count, hunk.new_start, new_count, lines)
+
+
+def revert_semantic_group(diff_text: str, after_code: str, group: dict):
+    """
+    Revert one group of semantic_group_diff_actions on after_code with the hunk engine.
+    Returns the new content, or None when the group has no line ranges or a hunk
+    does not match after_code.
+    """
+    if not group.get("ranges"):
+        return None
+    hunks = parse_diff_hunks(diff_text)
+    partial = [partial_hunk(hunks[r["hunk"]], r["lines"]) for r in group["ranges"] if r["hunk"] < len(hunks)]
+    if len(partial) != len(group["ranges"]):
+        return None
+    result = revert_hunks(after_code, partial)
+    return None if result.conflicts else result.content
+
+
+def undo_semantic_change(diff_text: str, after_code: str, group_index: int, use_llm: bool = True) -> str:
     """
-    Use LLM to undo a specific semantic change group.
+    Undo a specific semantic change group.
     diff_text: git diff text between two files
     after_code: content of the file after change
-    group_index: index of the semantic group to undo
+    group_index: index of the semantic group to undo (as grouped without the LLM)
+    The group's lines are reverted mechanically; the LLM rewrites the file only when
+    they no longer match after_code (use_llm=False raises ValueError instead).
     Returns the new file content after undo.
     """
-    semantic_groups = semantic_group_diff_actions(diff_text)
+    semantic_groups = semantic_group_diff_actions(diff_text, after_code, use_llm=False)
     if group_index < 0 or group_index >= len(semantic_groups):
         raise ValueError("group_index out of range")
     group_to_undo = semantic_groups[group_index]
+    reverted = revert_semantic_group(diff_text, after_code, group_to_undo)
+    if reverted is not None:
+        return reverted
+    if not use_llm:
+        raise ValueError(f"group {group_index} does not apply to the current code")
     prompt = (
         "You are an expert in code change rollback. Given the following code content and a semantic change group to revert, "
         "please generate the new code with this change group reverted.\n"
@@ -0,0 +1,291 @@
+"""
+Offline clustering of the compiler-error store into a compact knowledge base.
+
+The error store keeps one document per failing delta-compile trial, so the same
+error shows up hundreds of times and near-duplicates compete for the top hits. This
+job clusters the stored embeddings with mini-batch k-means (NumPy, Sculley 2010) and
+writes a store with one document per cluster:
+    text      the member error closest to the cluster center
+    metadata  project/file/hunk_index of the best-supported fix, i.e. the hunk whose
+              normalized +/- lines fixed the most members (a document deduplicated by
+              index_builder counts once per source), plus "cluster" statistics
+so get_reference_example_from_metadata works on the compact store unchanged.
+
+evaluate() holds out a share of the documents, clusters the rest and compares vector
+retrieval of the held-out errors on the full store (held-out documents filtered out)
+and on the compact store. The measure that matters is whether the retrieved
+document's fix (its project/file/hunk_index, compared by fix_signature) is the fix
+the held-out error needed, at top-1 and in the top-k, on each store; cluster
+agreement (the compact hit is the cluster of the full store's top hit), query
+latency and index size are reported next to it.
+
+    python -m src.embed.error_clusters /workspaces/TEE-Forge-It/changes/compiler_error_faiss_db \
+        /workspaces/TEE-Forge-It/changes/compiler_error_clusters --ratio 0.1 --evaluate
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from src.embed.error_embed import load_deltacompile_results
+from src.embed.vector_store import INDEX_FILE, VECTORS_FILE, VectorStore, write_vector_store
+
+CHANGES_DIR = "/workspaces/TEE-Forge-It/changes"
+# 每个簇在 metadata 中最多保留的成员来源
+MAX_MEMBER_SOURCES = 20
+
+
+def _squared_distances(x, centers, center_norms):
+    return np.maximum((x * x).sum(axis=1)[:, None] - 2 * x @ centers.T + center_norms[None, :], 0)
+
+
+def _kmeans_plus_plus(sample, k, rng):
+    centers = np.empty((k, sample.shape[1]), dtype=np.float32)
+    centers[0] = sample[rng.integers(len(sample))]
+    closest = ((sample - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(sample), p=closest / total) if total > 0 else rng.integers(len(sample))
+        centers[i] = sample[index]
+        closest = np.minimum(closest, ((sample - centers[i]) ** 2).sum(axis=1))
+    return centers
+
+
+def minibatch_kmeans(vectors, k, batch_size=1024, max_iter=200, tol=1e-4, seed=0):
+    """
+    Cluster centers (k x dim float32) of vectors (N x dim, may be a memmap). Centers are
+    seeded with k-means++ on a sample and moved towards each mini-batch with a per-center
+    learning rate of 1/count; stops when no center moves more than tol.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = min(k, n)
+    sample = np.asarray(vectors[np.sort(rng.choice(n, min(n, max(10 * k, batch_size)), replace=False))], dtype=np.float32)
+    centers = _kmeans_plus_plus(sample, k, rng)
+    counts = np.zeros(k)
+    for _ in range(max_iter):
+        batch = np.asarray(vectors[np.sort(rng.choice(n, min(n, batch_size), replace=False))], dtype=np.float32)
+        labels = _squared_distances(batch, centers, (centers * centers).sum(axis=1)).argmin(axis=1)
+        members = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+        moved = members > 0
+        counts[moved] += members[moved]
+        previous = centers[moved].copy()
+        centers[moved] += (sums[moved] - members[moved, None] * centers[moved]) / counts[moved, None]
+        if np.abs(centers[moved] - previous).max(initial=0.0) < tol:
+            break
+    return centers
+
+
+def assign_clusters(vectors, centers, chunk=8192):
+    """
+    (labels, squared distances to the assigned center) of every vector, computed in chunks.
+    """
+    center_norms = (centers * centers).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    distances = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        d = _squared_distances(block, centers, center_norms)
+        labels[start:start + chunk] = d.argmin(axis=1)
+        distances[start:start + chunk] = d[np.arange(len(block)), labels[start:start + chunk]]
+    return labels, distances
+
+
+def _hunk_text(metadata, changes_dir):
+    json_path = os.path.join(changes_dir, f"{metadata.get('project')}.deltacompile.json")
+    if metadata.get("hunk_index") is None or not os.path.isfile(json_path):
+        return None
+    hunks = load_deltacompile_results(json_path).get(metadata.get("file"))
+    if isinstance(hunks, list):
+        for hunk_info in hunks:
+            if hunk_info.get("hunk_index") == metadata["hunk_index"]:
+                return hunk_info.get("hunk")
+    return None
+
+
+def fix_signature(metadata, changes_dir=CHANGES_DIR):
+    """
+    Hash of the changed lines of the hunk behind a document, or None when it cannot be read.
+    """
+    hunk = _hunk_text(metadata, changes_dir)
+    if not hunk:
+        return None
+    changed = [" ".join(line.split()) for line in hunk.splitlines() if line[:1] in ("+", "-") and line[1:].strip()]
+    return hashlib.sha1("\n".join(changed).encode()).hexdigest()[:16] if changed else None
+
+
+def _sources(metadata):
+    return metadata.get("sources") or [{k: v for k, v in metadata.items() if k != "sources"}]
+
+
+def summarize_clusters(store, labels, distances, ids, changes_dir=CHANGES_DIR):
+    """
+    One entry per non-empty cluster: {"representative", "fix", "size", "support", "members"}
+    with document ids of the representative and of the best-supported fix.
+    :param ids: document id of every row of labels/distances
+    """
+    by_cluster = {}
+    for doc_id, label, distance in zip(ids, labels, distances):
+        by_cluster.setdefault(int(label), []).append((float(distance), int(doc_id)))
+    clusters = []
+    for label, members in sorted(by_cluster.items()):
+        members.sort()
+        documents = store.get_documents([doc_id for _, doc_id in members])
+        support, closest = {}, {}
+        size = 0
+        # members 已按到中心的距离排序，closest 记下每种修复最近的成员及其位置
+        for position, (_, doc_id) in enumerate(members):
+            sources = _sources(documents[doc_id].metadata)
+            size += len(sources)
+            signature = fix_signature(sources[0], changes_dir) or f"doc:{doc_id}"
+            support[signature] = support.get(signature, 0) + len(sources)
+            closest.setdefault(signature, (position, doc_id))
+        # 支持数相同时取离中心最近的修复
+        best = max(support, key=lambda s: (support[s], -closest[s][0]))
+        clusters.append({
+            "label": label,
+            "representative": members[0][1],
+            "fix": closest[best][1],
+            "size": size,
+            "support": support[best],
+            "fixes": len(support),
+            "members": [doc_id for _, doc_id in members],
+        })
+    return clusters
+
+
+def build_cluster_store(store, path, k=None, ratio=0.1, exclude=(), changes_dir=CHANGES_DIR, seed=0,
+                        index_type="flat", compression=None):
+    """
+    Cluster the documents of store (except the ids in exclude) and write the compact store at
+    path. Returns (manifest, clusters, labels of every clustered document by id).
+    """
+    excluded = set(exclude)
+    ids = np.array([i for i in range(len(store)) if i not in excluded], dtype=np.int64)
+    vectors = store.vectors
+    data = vectors if not excluded else np.asarray(vectors[ids], dtype=np.float32)
+    k = k or max(1, int(round(len(ids) * ratio)))
+    start = time.perf_counter()
+    centers = minibatch_kmeans(data, k, seed=seed)
+    labels, distances = assign_clusters(data, centers)
+    clusters = summarize_clusters(store, labels, distances, ids, changes_dir)
+    print(f"Clustered {len(ids)} errors into {len(clusters)} clusters in {time.perf_counter() - start:.1f}s")
+
+    representatives = store.get_documents([c["representative"] for c in clusters])
+    fixes = store.get_documents([c["fix"] for c in clusters])
+    texts, metadatas = [], []
+    for cluster in clusters:
+        fix = fixes[cluster["fix"]].metadata
+        member_sources = [s for doc in store.get_documents(cluster["members"][:MAX_MEMBER_SOURCES]).values()
+                          for s in _sources(doc.metadata)][:MAX_MEMBER_SOURCES]
+        texts.append(representatives[cluster["representative"]].page_content)
+        metadatas.append(dict(
+            {k: v for k, v in fix.items() if k != "sources"},
+            cluster={"size": cluster["size"], "support": cluster["support"], "fixes": cluster["fixes"],
+                     "documents": len(cluster["members"])},
+            sources=member_sources,
+        ))
+    rows = np.array([c["representative"] for c in clusters], dtype=np.int64)
+    rep_vectors = np.asarray(vectors[rows], dtype=np.float32)
+    manifest = write_vector_store(path, rep_vectors, texts, metadatas, index_type, compression,
+                                  store.manifest["metric"])
+    by_id = {int(doc_id): position for position, cluster in enumerate(clusters) for doc_id in cluster["members"]}
+    return manifest, clusters, by_id
+
+
+def _store_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in (INDEX_FILE, VECTORS_FILE)
+               if os.path.exists(os.path.join(path, name)))
+
+
+def evaluate(store, path, embedder, holdout=0.1, k=4, ratio=0.1, changes_dir=CHANGES_DIR, seed=0):
+    """
+    Hold out a share of store's documents, cluster the rest into path and compare vector
+    retrieval of the held-out errors. Returns the report.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(store)
+    held_out = np.sort(rng.choice(count, max(1, int(count * holdout)), replace=False))
+    held_out_set = set(int(i) for i in held_out)
+    manifest, clusters, cluster_of = build_cluster_store(store, path, ratio=ratio, exclude=held_out_set,
+                                                         changes_dir=changes_dir, seed=seed)
+    compact = VectorStore(path, embedder)
+    held_out_docs = store.get_documents([int(i) for i in held_out])
+    queries = [doc.page_content for doc in held_out_docs.values()]
+    # 每个查询需要的修复：被留出文档（及其去重来源）自身的修复
+    needed = [{s for s in (fix_signature(source, changes_dir) for source in _sources(doc.metadata)) if s}
+              for doc in held_out_docs.values()]
+    signatures = {}
+
+    def signature(target, doc_id):
+        if (id(target), doc_id) not in signatures:
+            metadata = target.get_documents([doc_id])[doc_id].metadata
+            signatures[id(target), doc_id] = fix_signature(metadata, changes_dir)
+        return signatures[id(target), doc_id]
+
+    agree_top1 = agree_topk = 0
+    fix_hits = {"full_top1": 0, f"full_top{k}": 0, "compact_top1": 0, f"compact_top{k}": 0}
+    fix_queries = 0
+    full_seconds = compact_seconds = 0.0
+    for query, fixes in zip(queries, needed):
+        vector = store.query_vector(query)
+        start = time.perf_counter()
+        full_hits = [i for i, _ in store.search_vector(vector, min(count, 4 * k)) if i not in held_out_set]
+        full_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        compact_hits = [i for i, _ in compact.search_vector(vector, k)]
+        compact_seconds += time.perf_counter() - start
+        if fixes:
+            fix_queries += 1
+            for name, target, hits in (("full", store, full_hits[:k]), ("compact", compact, compact_hits)):
+                found = [signature(target, i) in fixes for i in hits]
+                fix_hits[f"{name}_top1"] += bool(found) and found[0]
+                fix_hits[f"{name}_top{k}"] += any(found)
+        if not full_hits:
+            continue
+        expected = cluster_of.get(full_hits[0])
+        agree_top1 += bool(compact_hits) and compact_hits[0] == expected
+        agree_topk += expected in compact_hits
+    report = {
+        "documents": count - len(held_out_set),
+        "clusters": manifest["count"],
+        "queries": len(queries),
+        "fix_queries": fix_queries,
+        **{f"{name}_fix_recall": hits / fix_queries if fix_queries else 0.0 for name, hits in fix_hits.items()},
+        "top1_agreement": agree_top1 / len(queries) if queries else 0.0,
+        f"top{k}_agreement": agree_topk / len(queries) if queries else 0.0,
+        "full_ms_per_query": full_seconds * 1000 / len(queries) if queries else 0.0,
+        "compact_ms_per_query": compact_seconds * 1000 / len(queries) if queries else 0.0,
+        "full_index_bytes": _store_bytes(store.path),
+        "compact_index_bytes": _store_bytes(path),
+        "largest_cluster": max(c["size"] for c in clusters),
+    }
+    compact.close()
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from src.embed.error_embed import get_embedding_fn
+    parser = argparse.ArgumentParser(description="Cluster the compiler-error store into a compact knowledge base.")
+    parser.add_argument("store", help="error vector store directory")
+    parser.add_argument("output", help="compact store directory")
+    parser.add_argument("--clusters", type=int, help="number of clusters (default: --ratio of the documents)")
+    parser.add_argument("--ratio", type=float, default=0.1)
+    parser.add_argument("--changes-dir", default=CHANGES_DIR)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--evaluate", action="store_true",
+                        help="hold out 10%% of the errors and compare retrieval on the full and compact stores")
+    args = parser.parse_args()
+
+    full = VectorStore(args.store, get_embedding_fn())
+    if args.evaluate:
+        print(json.dumps(evaluate(full, args.output + ".eval", full.embedder, ratio=args.ratio,
+                                  changes_dir=args.changes_dir), indent=2))
+    manifest, clusters, _ = build_cluster_store(full, args.output, args.clusters, args.ratio,
+                                                changes_dir=args.changes_dir, index_type=args.index_type)
+    print(f"Wrote {manifest['count']} cluster representatives ({len(full)} errors) to {args.output}")
@@ -6,9 +6,30 @@ import sys
 
 # 使用 langchain_community.embeddings.OllamaEmbeddings
 from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
+from src.embed.index_builder import StreamingIndexBuilder
 
 from src.diff.git_util import get_original_file_content, get_git_diff
+from src.tracing import span
+
+# json_path -> (mtime, data)；同一次迁移中会反复读取同一个 deltacompile.json
+_DELTACOMPILE_CACHE = {}
+
+
+def load_deltacompile_results(json_path):
+	"""
+	Load a *.deltacompile.json file, reusing the parsed data while the file is unchanged.
+	"""
+	mtime = os.path.getmtime(json_path)
+	with span("deltacompile.load", category="cache", path=os.path.basename(json_path)) as load_span:
+		cached = _DELTACOMPILE_CACHE.get(json_path)
+		if cached is not None and cached[0] == mtime:
+			load_span.set(cache="hit")
+			return cached[1]
+		load_span.set(cache="miss")
+		with open(json_path, 'r') as f:
+			data = json.load(f)
+		_DELTACOMPILE_CACHE[json_path] = (mtime, data)
+		return data
 
 def get_all_error_texts(changes_dir):
 	"""
@@ -59,8 +80,7 @@ def get_hunk_from_metadata(metadata):
         changes_dir = os.path.join(work_dir, "changes")
         json_path = os.path.join(changes_dir, f"{project}.deltacompile.json")
         if os.path.isfile(json_path):
-            with open(json_path, 'r') as f:
-                data = json.load(f)
+            data = load_deltacompile_results(json_path)
             if rel_file in data:
                 hunks = data[rel_file]
                 # hunks is a list of hunk info dicts
@@ -89,8 +109,7 @@ def get_reference_example_from_metadata(metadata):
         changes_dir = os.path.join(work_dir, "changes")
         json_path = os.path.join(changes_dir, f"{project}.deltacompile.json")
         if os.path.isfile(json_path):
-            with open(json_path, 'r') as f:
-                data = json.load(f)
+            data = load_deltacompile_results(json_path)
             if rel_file in data:
                 hunks = data[rel_file]
                 # hunks is a list of hunk info dicts
@@ -101,7 +120,8 @@ def get_reference_example_from_metadata(metadata):
                             hunk =  hunk_info.get('hunk')
                             rust_code = open(os.path.join(work_dir, "forked_repo", project, rel_file), 'r').read()
                             repo_path = os.path.join(work_dir, "forked_repo", project)
-                            original_code = get_original_file_content(repo_path, rel_file)
+                            with span("git.show", category="git", file=rel_file):
+                                original_code = get_original_file_content(repo_path, rel_file)
                             # save original_code to a temp file
                             # save rust_code to a temp file
                             import tempfile
@@ -114,7 +134,8 @@ def get_reference_example_from_metadata(metadata):
                                 with open(tmp_rust_path, 'w') as f:			
                                     f.write(rust_code)
                             # get git diff between the two temp files
-                            diff_text = get_git_diff(tmp_original_path, tmp_rust_path)
+                            with span("git.diff", category="git", file=rel_file):
+                                diff_text = get_git_diff(tmp_original_path, tmp_rust_path)
                             return original_code, diff_text
                         
     return None, None
@@ -126,21 +147,18 @@ def main():
 	if not error_entries:
 		print("No compiler errors found.")
 		return
-	documents = []
-	metadata = []
-	embedder = get_embedding_fn()
+	vectordb_path = os.path.join(changes_dir, "compiler_error_faiss_db")
+	# 分批嵌入并定期落盘；相同的错误文本只嵌入一次，来源记在 metadata["sources"]
+	builder = StreamingIndexBuilder(vectordb_path, get_embedding_fn(), index_type="hnsw", compression="fp16")
 	for project, rel_file, hunk_index, err_type, error_text in error_entries:
 		if not error_text.strip():
 			continue
-		documents.append(error_text)
-		metadata.append({"project": project, "file": rel_file, "hunk_index": hunk_index})
-	if not documents:
+		builder.add(error_text, {"project": project, "file": rel_file, "hunk_index": hunk_index})
+	if not builder.stats["added"]:
 		print("No error documents to embed.")
 		return
-	vectordb_path = os.path.join(changes_dir, "compiler_error_faiss_db")
-	vectordb = FAISS.from_texts(documents, embedder, metadatas=metadata)
-	vectordb.save_local(vectordb_path)
-	print(f"Saved {len(documents)} error embeddings to FAISS vector db at {vectordb_path}")
+	manifest = builder.finish()
+	print(f"Saved {manifest['count']} error embeddings ({builder.stats['added']} errors) to {manifest['factory']} vector store at {vectordb_path}")
 
 if __name__ == "__main__":
 	main()
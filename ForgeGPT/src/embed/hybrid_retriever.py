@@ -0,0 +1,104 @@
+"""
+Hybrid lexical + vector retrieval of reference migrations for a build log.
+
+The lexical index (error codes, message templates, quoted paths and identifiers) is
+consulted first: when its best documents reach `exact_threshold` they answer the
+query without an embedding call. Otherwise only the error diagnostics (not the whole
+log with its `Compiling` lines) are embedded, and lexical and vector candidates are
+fused into one score in [0, 1]:
+
+    score = alpha * lexical + (1 - alpha) * vector_similarity
+
+`min_score` is a real cutoff on that score, so callers get no reference rather than
+a weak one.
+"""
+from src.compilation.diagnostics import parse_diagnostics
+from src.embed.lexical_index import extract_keys
+from src.embed.vector_store import VectorStore, load_vector_store
+from src.tracing import current_span
+
+
+class HybridRetriever:
+    def __init__(self, store, alpha=0.5, exact_threshold=0.8, candidates=20):
+        self.store = store
+        self.alpha = alpha
+        self.exact_threshold = exact_threshold
+        self.candidates = candidates
+
+    def _vector_similarity(self, score):
+        # l2: 向量已归一化时平方距离 d = 2 - 2cos
+        if self.store.manifest["metric"] == "l2":
+            return min(1.0, max(0.0, 1.0 - score / 2))
+        return min(1.0, max(0.0, score))
+
+    @staticmethod
+    def embedding_text(error_text):
+        """
+        The part of a build log worth embedding: its error diagnostics.
+        """
+        diagnostics = [d for d in parse_diagnostics(error_text) if not d.is_summary]
+        return "\n\n".join(d.text for d in diagnostics) if diagnostics else error_text
+
+    def search(self, error_text, k=1, min_score=None):
+        """
+        [(Document, score), ...], best first, at most k and none below min_score.
+        Every document's metadata gets "retrieval_score" and "retrieval_source"
+        ("lexical" or "hybrid").
+        """
+        lexical = self.store.lexical.score(extract_keys(error_text))
+        if lexical and lexical[0][1] >= self.exact_threshold:
+            hits = [(doc_id, score) for doc_id, score in lexical[:k] if score >= self.exact_threshold]
+            source = "lexical"
+        else:
+            vector_hits = self.store.search_vector(
+                self.store.query_vector(self.embedding_text(error_text)), self.candidates)
+            lexical_scores = dict(lexical)
+            fused = {
+                doc_id: self.alpha * lexical_scores.get(doc_id, 0.0) + (1 - self.alpha) * self._vector_similarity(score)
+                for doc_id, score in vector_hits
+            }
+            for doc_id, score in lexical[:self.candidates]:
+                # 只有词法命中、不在向量候选里的文档按向量相似度 0 计
+                fused.setdefault(doc_id, self.alpha * score)
+            hits = sorted(fused.items(), key=lambda item: -item[1])[:k]
+            source = "hybrid"
+        if min_score is not None:
+            hits = [(doc_id, score) for doc_id, score in hits if score >= min_score]
+        current_span().set(retrieval_source=source, best_score=hits[0][1] if hits else None)
+        documents = self.store.get_documents([doc_id for doc_id, _ in hits])
+        results = []
+        for doc_id, score in hits:
+            if doc_id in documents:
+                document = documents[doc_id]
+                document.metadata.update(retrieval_score=score, retrieval_source=source)
+                results.append((document, score))
+        return results
+
+    def similarity_search(self, query, k=4, min_score=None, **kwargs):
+        return [doc for doc, _ in self.search(query, k, min_score)]
+
+
+def load_retriever(path, embedder, **kwargs):
+    """
+    HybridRetriever over the store at path; pickled FAISS stores are returned as they are.
+    """
+    store = load_vector_store(path, embedder)
+    if isinstance(store, VectorStore):
+        return HybridRetriever(store, **kwargs)
+    return store
+
+
+def retrieve(vectordb, error_text, k=1, min_score=None):
+    """
+    [(Document, score), ...] from a HybridRetriever, or from a langchain vector store
+    using its relevance scores in [0, 1].
+    """
+    if isinstance(vectordb, HybridRetriever):
+        return vectordb.search(error_text, k, min_score)
+    if hasattr(vectordb, "similarity_search_with_relevance_scores"):
+        hits = vectordb.similarity_search_with_relevance_scores(error_text, k=k)
+    else:
+        hits = vectordb.similarity_search_with_score(error_text, k=k)
+    if min_score is not None:
+        hits = [(doc, score) for doc, score in hits if score >= min_score]
+    return hits
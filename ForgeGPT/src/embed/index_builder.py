@@ -0,0 +1,195 @@
+"""
+Streaming construction of a vector store (vector_store.py format).
+
+Documents are added one at a time and embedded in batches of `batch_size`; each
+batch is appended to a raw float32 file and its rows to metadata.sqlite in a staging
+directory `<path>.building`, so memory holds one batch rather than the corpus. Every
+`checkpoint_every` batches the vectors are fsync'ed and the rows committed. A build
+that dies resumes from its last checkpoint: documents that are already embedded are
+recognised by their content hash and not embedded again.
+
+Documents are deduplicated by the sha1 of their text. A duplicate is not embedded;
+its metadata is appended to the "sources" list of the first copy, whose metadata
+otherwise stays the first source's, so vendored files shared by many forks are
+embedded once and still point to every fork.
+
+    builder = StreamingIndexBuilder(path, embedder, batch_size=64, index_type="hnsw", compression="fp16")
+    for text, metadata in documents:
+        builder.add(text, metadata)
+    manifest = builder.finish()   # ann index, lexical index, then store.json in path
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+from src.embed.lexical_index import LexicalIndex, extract_keys
+from src.embed.vector_store import (
+    INDEX_FILE, MANIFEST, METADATA_FILE, VECTORS_FILE, write_ann_index, write_manifest,
+)
+from src.tracing import span
+
+RAW_VECTORS_FILE = "vectors.f32"
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def _dumps(metadata):
+    return json.dumps(metadata, ensure_ascii=False, separators=(',', ':'))
+
+
+class StreamingIndexBuilder:
+    def __init__(self, path, embedder, batch_size=64, checkpoint_every=10, index_type="flat",
+                 compression=None, metric="l2", report_every=30.0):
+        self.path = path
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.index_type = index_type
+        self.compression = compression
+        self.metric = metric
+        self.report_every = report_every
+        self.staging = path.rstrip("/") + ".building"
+        os.makedirs(self.staging, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(self.staging, METADATA_FILE))
+        self._db.execute("CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, content BLOB, metadata TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS content_hashes (hash TEXT PRIMARY KEY, id INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS build_info (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        self._hashes = dict(self._db.execute("SELECT hash, id FROM content_hashes"))
+        self.count = len(self._hashes)
+        row = self._db.execute("SELECT value FROM build_info WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+
+        # 上次中断时可能多写了未提交的向量，截掉
+        raw_path = os.path.join(self.staging, RAW_VECTORS_FILE)
+        if os.path.exists(raw_path):
+            os.truncate(raw_path, self.count * (self.dim or 0) * 4)
+        self._vectors_file = open(raw_path, 'ab')
+
+        self._pending = []  # [(hash, text, metadata)]
+        self._pending_index = {}  # hash -> position in _pending
+        self._batches = 0
+        self._started = time.perf_counter()
+        self._last_report = self._started
+        self.stats = {"added": 0, "duplicates": 0, "embedded": 0, "resumed": self.count, "embed_seconds": 0.0}
+
+    def add(self, text, metadata):
+        """
+        Queue one document; it is embedded with the next full batch unless its content is already known.
+        """
+        self.stats["added"] += 1
+        digest = content_hash(text)
+        if digest in self._hashes:
+            self._add_source(self._hashes[digest], metadata)
+        elif digest in self._pending_index:
+            sources = self._pending[self._pending_index[digest]][2]["sources"]
+            if metadata not in sources:
+                sources.append(dict(metadata))
+                self.stats["duplicates"] += 1
+        else:
+            self._pending_index[digest] = len(self._pending)
+            self._pending.append((digest, text, dict(metadata, sources=[dict(metadata)])))
+            if len(self._pending) >= self.batch_size:
+                self._flush_batch()
+
+    def _add_source(self, doc_id, metadata):
+        row = self._db.execute("SELECT metadata FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        stored = json.loads(row[0])
+        # 续建时会再次看到同一来源，不重复记录
+        if metadata in stored["sources"]:
+            return
+        stored["sources"].append(dict(metadata))
+        self._db.execute("UPDATE documents SET metadata = ? WHERE id = ?", (_dumps(stored), doc_id))
+        self.stats["duplicates"] += 1
+
+    def _flush_batch(self):
+        if not self._pending:
+            return
+        texts = [text for _, text, _ in self._pending]
+        with span("embed.batch", category="embedding", documents=len(texts)):
+            start = time.perf_counter()
+            vectors = np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+            self.stats["embed_seconds"] += time.perf_counter() - start
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._db.execute("INSERT OR REPLACE INTO build_info VALUES ('dim', ?)", (str(self.dim),))
+        self._vectors_file.write(vectors.tobytes())
+        rows, hashes = [], []
+        for offset, (digest, text, metadata) in enumerate(self._pending):
+            doc_id = self.count + offset
+            rows.append((doc_id, zlib.compress(text.encode()), _dumps(metadata)))
+            hashes.append((digest, doc_id))
+        self._db.executemany("INSERT INTO documents VALUES (?, ?, ?)", rows)
+        self._db.executemany("INSERT INTO content_hashes VALUES (?, ?)", hashes)
+        self._hashes.update(hashes)
+        self.count += len(rows)
+        self.stats["embedded"] += len(rows)
+        self._pending = []
+        self._pending_index = {}
+        self._batches += 1
+        if self._batches % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Make everything embedded so far durable: vectors first, then the rows that refer to them.
+        """
+        self._vectors_file.flush()
+        os.fsync(self._vectors_file.fileno())
+        self._db.commit()
+        if time.perf_counter() - self._last_report >= self.report_every:
+            self._last_report = time.perf_counter()
+            print(self.progress())
+
+    def progress(self):
+        elapsed = time.perf_counter() - self._started
+        return (f"{self.stats['added']} documents read, {self.count} embedded "
+                f"({self.stats['resumed']} resumed, {self.stats['duplicates']} duplicate sources), "
+                f"{self.stats['embedded'] / elapsed if elapsed else 0.0:.1f} docs/s")
+
+    def finish(self):
+        """
+        Embed the last batch, build the ANN and lexical indexes and move the store into
+        path (store.json last). Returns the manifest, with the build stats under "build".
+        """
+        self._flush_batch()
+        self.checkpoint()
+        self._vectors_file.close()
+        if not self.count:
+            self._db.close()
+            raise ValueError("No documents were added to the index")
+        vectors = np.fromfile(os.path.join(self.staging, RAW_VECTORS_FILE), dtype=np.float32).reshape(self.count, self.dim)
+        with span("vectordb.save", category="retrieval", documents=self.count):
+            manifest = write_ann_index(self.staging, vectors, self.index_type, self.compression, self.metric)
+            del vectors
+            keys = [extract_keys(zlib.decompress(row[0]).decode())
+                    for row in self._db.execute("SELECT content FROM documents ORDER BY id")]
+            LexicalIndex.from_keys(keys).save(self._db)
+            self._db.execute("DROP TABLE content_hashes")
+            self._db.execute("DROP TABLE build_info")
+            self._db.commit()
+            self._db.execute("VACUUM")
+            self._db.close()
+
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(os.path.join(self.path, MANIFEST)):
+            os.remove(os.path.join(self.path, MANIFEST))
+        for name in (INDEX_FILE, VECTORS_FILE, METADATA_FILE):
+            os.replace(os.path.join(self.staging, name), os.path.join(self.path, name))
+        write_manifest(self.path, manifest)
+        shutil.rmtree(self.staging)
+
+        self.stats["seconds"] = time.perf_counter() - self._started
+        self.stats["documents"] = self.count
+        print(self.progress())
+        manifest["build"] = self.stats
+        return manifest
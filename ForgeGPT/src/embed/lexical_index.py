@@ -0,0 +1,156 @@
+"""
+Inverted index over the discriminative tokens of rustc errors.
+
+Keys are extracted from the error diagnostics of a build log:
+    code:E0433                    error codes
+    msg:unresolved import `_`     the message with its quoted parts blanked out
+    path:std::sync::Mutex         quoted paths, plus their root (root:std) and last segment
+    ident:Mutex                   quoted identifiers
+Each key is weighted by kind and idf. A document's score is the weighted Jaccard
+overlap between its keys and the query's keys: 1.0 when both carry exactly the same
+keys, and keys that never occur in the index still count against the query.
+
+Postings are stored in SQLite next to the vector store metadata, so opening the
+index reads nothing until a key is looked up.
+"""
+import math
+import re
+import threading
+from array import array
+
+from src.compilation.diagnostics import parse_diagnostics
+
+KEY_WEIGHTS = {"code": 1.0, "msg": 1.0, "path": 1.5, "root": 0.5, "ident": 1.0}
+
+_CODE_RE = re.compile(r'\bE\d{4}\b')
+_QUOTED_RE = re.compile(r'`([^`\n]{1,120})`')
+_IDENT_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_PATH_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(?:::[A-Za-z_][A-Za-z0-9_]*)+')
+
+
+def _quoted_keys(quoted, keys):
+    for path in _PATH_RE.findall(quoted):
+        segments = path.split("::")
+        keys.add(f"path:{path}")
+        keys.add(f"root:{segments[0]}")
+        keys.add(f"ident:{segments[-1]}")
+    if _IDENT_RE.match(quoted):
+        keys.add(f"ident:{quoted}")
+
+
+def extract_keys(error_text):
+    """
+    Lexical keys of a build log (see module docstring). Falls back to scanning the
+    whole text when it has no rustc error headers.
+    """
+    keys = set()
+    diagnostics = [d for d in parse_diagnostics(error_text) if not d.is_summary]
+    if diagnostics:
+        for diagnostic in diagnostics:
+            if diagnostic.code:
+                keys.add(f"code:{diagnostic.code}")
+            keys.add("msg:" + _QUOTED_RE.sub("`_`", diagnostic.message).strip().lower())
+            for quoted in _QUOTED_RE.findall(diagnostic.message):
+                _quoted_keys(quoted, keys)
+        return keys
+    keys.update(f"code:{code}" for code in _CODE_RE.findall(error_text))
+    for quoted in _QUOTED_RE.findall(error_text):
+        _quoted_keys(quoted, keys)
+    return keys
+
+
+def _weight(key):
+    return KEY_WEIGHTS.get(key.split(":", 1)[0], 1.0)
+
+
+class LexicalIndex:
+    """
+    key -> posting list of document ids, with the total key weight of every document.
+    Build with from_texts / from_keys, persist with save, reopen with load.
+    """
+
+    def __init__(self, count, doc_weights, postings=None, db=None, db_lock=None):
+        self.count = count
+        self.doc_weights = doc_weights  # array('d'), indexed by document id
+        self._postings = postings  # in-memory {key: array('i')} or None when backed by db
+        self._db = db
+        self._db_lock = db_lock or threading.Lock()
+        self._cache = {}
+
+    @classmethod
+    def from_keys(cls, keys_per_doc):
+        postings = {}
+        for doc_id, keys in enumerate(keys_per_doc):
+            for key in keys:
+                postings.setdefault(key, array('i')).append(doc_id)
+        count = len(keys_per_doc)
+        index = cls(count, array('d'), postings)
+        index.doc_weights = array('d', (sum(index.key_weight(k) for k in keys) for keys in keys_per_doc))
+        return index
+
+    @classmethod
+    def from_texts(cls, texts):
+        return cls.from_keys([extract_keys(text) for text in texts])
+
+    def save(self, db):
+        """
+        Write the postings into the lexical_terms/lexical_docs tables of an open sqlite3 connection.
+        """
+        db.execute("DROP TABLE IF EXISTS lexical_terms")
+        db.execute("DROP TABLE IF EXISTS lexical_docs")
+        db.execute("CREATE TABLE lexical_terms (key TEXT PRIMARY KEY, postings BLOB)")
+        db.execute("CREATE TABLE lexical_docs (id INTEGER PRIMARY KEY, weight REAL)")
+        db.executemany("INSERT INTO lexical_terms VALUES (?, ?)",
+                       ((key, ids.tobytes()) for key, ids in self._postings.items()))
+        db.executemany("INSERT INTO lexical_docs VALUES (?, ?)", enumerate(self.doc_weights))
+        db.commit()
+
+    @classmethod
+    def load(cls, db, db_lock=None):
+        """
+        Open the index stored in a sqlite3 connection, or return None if there is none.
+        :param db_lock: lock shared with the other users of the connection
+        """
+        has_table = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='lexical_docs'").fetchone()
+        if not has_table:
+            return None
+        weights = array('d', (row[0] for row in db.execute("SELECT weight FROM lexical_docs ORDER BY id")))
+        return cls(len(weights), weights, db=db, db_lock=db_lock)
+
+    def postings(self, key):
+        if self._postings is not None:
+            return self._postings.get(key, ())
+        if key not in self._cache:
+            with self._db_lock:
+                row = self._db.execute("SELECT postings FROM lexical_terms WHERE key = ?", (key,)).fetchone()
+            ids = array('i')
+            if row:
+                ids.frombytes(row[0])
+            self._cache[key] = ids
+        return self._cache[key]
+
+    def key_weight(self, key, df=None):
+        if df is None:
+            df = len(self.postings(key))
+        return _weight(key) * math.log(1 + self.count / (df + 1))
+
+    def score(self, keys, limit=None):
+        """
+        [(document id, score in [0, 1]), ...] for every document sharing a key with
+        `keys`, best first.
+        """
+        matched = {}
+        query_weight = 0.0
+        for key in keys:
+            ids = self.postings(key)
+            weight = self.key_weight(key, len(ids))
+            query_weight += weight
+            for doc_id in ids:
+                matched[doc_id] = matched.get(doc_id, 0.0) + weight
+        scored = [
+            (doc_id, m / (query_weight + self.doc_weights[doc_id] - m))
+            for doc_id, m in matched.items()
+        ]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit] if limit else scored
@@ -0,0 +1,296 @@
+"""
+Memory-mapped vector store for the compiler-error knowledge base.
+
+A store is a directory with
+    store.json        manifest (dimension, count, index type, compression, metric)
+    ann.index         faiss index, read with IO_FLAG_MMAP so its codes stay on disk
+    vectors.npy       the raw embeddings (float32, or float16 when compressed), memory-mapped
+    metadata.sqlite   page_content (zlib) and metadata (JSON) per document id, and the
+                      lexical index over error codes and identifiers (lexical_index.py)
+
+Unlike `FAISS.load_local(..., allow_dangerous_deserialization=True)` nothing is
+unpickled: loading reads the manifest and maps two files, and documents are fetched
+from SQLite only for the hits of a query.
+
+    store = build_vector_store(texts, metadatas, embedder, path, index_type="hnsw", compression="fp16")
+    store = load_vector_store(path, embedder)
+    docs = store.similarity_search(error_text, k=4)
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import zlib
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from src.embed.lexical_index import LexicalIndex
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+COMPRESSIONS = (None, "fp16", "pq")
+METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+
+MANIFEST = "store.json"
+INDEX_FILE = "ann.index"
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.sqlite"
+# FAISS.save_local 的旧格式
+LEGACY_INDEX_FILE = "index.pkl"
+
+
+def _pq_subquantizers(dim):
+    # 每个子量化器 8 维左右，且能整除维度
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_factory_string(index_type, compression, count, dim):
+    """
+    faiss.index_factory description for an index over `count` vectors.
+    IVF uses about 4*sqrt(count) lists, capped so every list gets ~39 training points.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+    if compression == "pq" and count < 256:
+        print(f"Only {count} vectors, too few to train PQ codebooks; using fp16 instead.")
+        compression = "fp16"
+    codec = {None: "Flat", "fp16": "SQfp16", "pq": f"PQ{_pq_subquantizers(dim)}"}[compression]
+    if index_type == "flat":
+        return codec
+    if index_type == "ivf":
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+        return f"IVF{nlist},{codec}"
+    return "HNSW32" if codec == "Flat" else f"HNSW32_{codec}"
+
+
+def _read_index(path):
+    for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, flag):
+            try:
+                return faiss.read_index(path, getattr(faiss, flag) | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                continue
+    return faiss.read_index(path)
+
+
+class VectorStore:
+    """
+    Read-only vector store with the similarity_search interface of the langchain FAISS
+    store. Scores are distances for the l2 metric (lower is closer) and similarities
+    for ip, as in langchain.
+    """
+
+    def __init__(self, path, embedder, nprobe=None, ef_search=None, rerank=None):
+        self.path = path
+        self.embedder = embedder
+        with open(os.path.join(path, MANIFEST), 'r') as f:
+            self.manifest = json.load(f)
+        self.index = _read_index(os.path.join(path, INDEX_FILE))
+        if "nlist" in self.manifest:
+            faiss.extract_index_ivf(self.index).nprobe = nprobe or max(1, self.manifest["nlist"] // 8)
+        if self.manifest["index_type"] == "hnsw":
+            faiss.downcast_index(self.index).hnsw.efSearch = ef_search or 64
+        # PQ 距离误差较大：多取候选，再用 vectors.npy 中的 fp16 向量精确重排
+        self.rerank = rerank if rerank is not None else (10 if self.manifest["compression"] == "pq" else 0)
+        self._vectors = None
+        self._lexical = None
+        self._db = sqlite3.connect(f"file:{os.path.join(path, METADATA_FILE)}?mode=ro", uri=True, check_same_thread=False)
+        self._db_lock = threading.Lock()
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def vectors(self):
+        # 只有重建索引或精确重排时才需要原始向量
+        if self._vectors is None:
+            self._vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode='r')
+        return self._vectors
+
+    @property
+    def lexical(self):
+        """
+        LexicalIndex over the documents; stores written before it existed get one built in memory.
+        """
+        if self._lexical is None:
+            with self._db_lock:
+                self._lexical = LexicalIndex.load(self._db, self._db_lock)
+            if self._lexical is None:
+                with self._db_lock:
+                    rows = self._db.execute("SELECT content FROM documents ORDER BY id").fetchall()
+                self._lexical = LexicalIndex.from_texts([zlib.decompress(row[0]).decode() for row in rows])
+        return self._lexical
+
+    def query_vector(self, query):
+        vector = np.asarray([self.embedder.embed_query(query)], dtype=np.float32)
+        if self.manifest["metric"] == "ip":
+            faiss.normalize_L2(vector)
+        return vector
+
+    def search_vector(self, vector, k=4):
+        """
+        Raw ANN search: [(document id, score), ...] for one float32 query row.
+        """
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        scores, ids = self.index.search(vector, k * self.rerank if self.rerank else k)
+        hits = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1]
+        if not self.rerank or not hits:
+            return hits
+        candidates = np.array(sorted(i for i, _ in hits))
+        rows = np.asarray(self.vectors[candidates], dtype=np.float32)
+        if self.manifest["metric"] == "l2":
+            exact = ((rows - vector) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+        else:
+            exact = rows @ vector[0]
+            order = np.argsort(-exact)[:k]
+        return [(int(candidates[j]), float(exact[j])) for j in order]
+
+    def get_documents(self, ids):
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT id, content, metadata FROM documents WHERE id IN ({placeholders})", list(ids)).fetchall()
+        return {
+            row[0]: Document(page_content=zlib.decompress(row[1]).decode(), metadata=json.loads(row[2]))
+            for row in rows
+        }
+
+    def similarity_search_with_score(self, query, k=4, score_threshold=None, **kwargs):
+        hits = self.search_vector(self.query_vector(query), k)
+        if score_threshold is not None:
+            if self.manifest["metric"] == "l2":
+                hits = [(i, s) for i, s in hits if s <= score_threshold]
+            else:
+                hits = [(i, s) for i, s in hits if s >= score_threshold]
+        documents = self.get_documents([i for i, _ in hits])
+        return [(documents[i], s) for i, s in hits if i in documents]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def close(self):
+        self._db.close()
+
+
+def write_ann_index(path, vectors, index_type="flat", compression=None, metric="l2"):
+    """
+    Write ann.index and vectors.npy for embeddings (N x dim) whose documents are row 0..N-1
+    of metadata.sqlite. Returns the manifest; the caller writes it with write_manifest.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if metric == "ip":
+        faiss.normalize_L2(vectors)
+    count, dim = vectors.shape
+    os.makedirs(path, exist_ok=True)
+
+    description = index_factory_string(index_type, compression, count, dim)
+    index = faiss.index_factory(dim, description, METRICS[metric])
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    faiss.write_index(index, os.path.join(path, INDEX_FILE))
+    np.save(os.path.join(path, VECTORS_FILE), vectors.astype(np.float16 if compression else np.float32))
+
+    manifest = {
+        "version": 2,
+        "count": count,
+        "dim": dim,
+        "index_type": index_type,
+        "compression": compression,
+        "metric": metric,
+        "factory": description,
+    }
+    if index_type == "ivf":
+        manifest["nlist"] = faiss.extract_index_ivf(index).nlist
+    return manifest
+
+
+def write_manifest(path, manifest):
+    # manifest 最后写入，作为写完的标志
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def write_vector_store(path, vectors, texts, metadatas, index_type="flat", compression=None, metric="l2"):
+    """
+    Write a store directory from precomputed embeddings (N x dim).
+    """
+    manifest = write_ann_index(path, vectors, index_type, compression, metric)
+
+    db_path = os.path.join(path, METADATA_FILE)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE documents (id INTEGER PRIMARY KEY, content BLOB, metadata TEXT)")
+    db.executemany(
+        "INSERT INTO documents VALUES (?, ?, ?)",
+        ((i, zlib.compress(text.encode()), json.dumps(metadata, ensure_ascii=False, separators=(',', ':')))
+         for i, (text, metadata) in enumerate(zip(texts, metadatas))))
+    LexicalIndex.from_texts(texts).save(db)
+    db.commit()
+    db.close()
+
+    write_manifest(path, manifest)
+    return manifest
+
+
+def build_vector_store(texts, metadatas, embedder, path, index_type="flat", compression=None, metric="l2"):
+    """
+    Embed texts and write them as a store at path. Returns the loaded VectorStore.
+    """
+    vectors = embedder.embed_documents(texts)
+    write_vector_store(path, vectors, texts, metadatas, index_type, compression, metric)
+    return VectorStore(path, embedder)
+
+
+def convert_legacy_store(legacy_path, path, index_type="flat", compression=None):
+    """
+    Convert a FAISS.save_local directory into a store directory without re-embedding.
+    """
+    from langchain_community.vectorstores import FAISS
+    legacy = FAISS.load_local(legacy_path, None, allow_dangerous_deserialization=True)
+    count = legacy.index.ntotal
+    vectors = legacy.index.reconstruct_n(0, count)
+    texts, metadatas = [], []
+    for i in range(count):
+        document = legacy.docstore.search(legacy.index_to_docstore_id[i])
+        texts.append(document.page_content)
+        metadatas.append(document.metadata)
+    metric = "ip" if legacy.index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+    return write_vector_store(path, vectors, texts, metadatas, index_type, compression, metric)
+
+
+def load_vector_store(path, embedder, **kwargs):
+    """
+    Open the store at path; directories still in the pickled FAISS.save_local format
+    are loaded with langchain's FAISS (convert them with convert_legacy_store).
+    """
+    if os.path.isfile(os.path.join(path, MANIFEST)):
+        return VectorStore(path, embedder, **kwargs)
+    if os.path.isfile(os.path.join(path, LEGACY_INDEX_FILE)):
+        from langchain_community.vectorstores import FAISS
+        print(f"{path} is a pickled FAISS store; convert it with `python -m src.embed.vector_store {path}`.")
+        return FAISS.load_local(path, embedder, allow_dangerous_deserialization=True)
+    raise FileNotFoundError(f"No vector store found at {path}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a pickled FAISS store into a memory-mapped vector store.")
+    parser.add_argument("legacy_path")
+    parser.add_argument("--output", help="store directory (default: convert in place)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--compression", choices=[c for c in COMPRESSIONS if c], default=None)
+    args = parser.parse_args()
+    manifest = convert_legacy_store(args.legacy_path, args.output or args.legacy_path, args.index_type, args.compression)
+    print(f"Converted {manifest['count']} vectors into a {manifest['factory']} store.")
@@ -4,7 +4,6 @@ from langchain.schema import Document
 from langchain.chains import create_retrieval_chain
 from langchain_core.documents import Document
 import os
-from langchain.vectorstores import FAISS
 from langchain.embeddings import OllamaEmbeddings
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
@@ -12,10 +11,33 @@ from langchain.llms import Ollama
 from typing import List, Tuple
 
 from langchain_openai import ChatOpenAI
-from extract_code_change import get_upstream_branch, get_fork_point
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+from src.embed.vector_store import load_vector_store
+from src.embed.index_builder import StreamingIndexBuilder
+from src.knowledge.extract_code_change import get_upstream_branch, get_fork_point
 import subprocess
 import random
 
+CHANGE_SEPARATOR = "=" * 80
+
+REVISION_PROMPT = (
+    "You are an expert Rust developer. Now we are working on migrating Rust library code to make it compatible for Rust-SGX SDK. Based on the following reference context:\n{context}\n\n "
+    "Please recommend code revision/addition/removal for the given Rust code file {input}\n,"
+    "having code: \n{new_rust_code}\n\n"
+    "MUST output only code revisions/additions/removals in pure text format like those of 'git diff' on file versions. Do not include any explanation in the output. The generated code revisions/additions/removals MUST be given after the annotation 'CODE MIGRATION:'\n"
+)
+
+
+def split_repositories(repos: List[str], train_ratio: float = 0.7, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """
+    Reproducible (training, testing) split: the repositories are sorted, then shuffled with `seed`.
+    """
+    repos = sorted(repos)
+    random.Random(seed).shuffle(repos)
+    split_index = int(train_ratio * len(repos))
+    return repos[:split_index], repos[split_index:]
+
 
 # Step 1: Embedding Rust code files and mapping to code changes
 def embed_rust_files(repo_dirs: str, code_change_dir: str, vectordb_path: str) -> None:
@@ -30,8 +52,8 @@ def embed_rust_files(repo_dirs: str, code_change_dir: str, vectordb_path: str) -
     """
     embeddings = OllamaEmbeddings(
         model="nomic-embed-text", base_url="http://localhost:11435")  # Use an open-source embedding model
-    documents = []
-    metadata = []
+    # Files vendored into several forks are embedded once, with every fork in metadata["sources"]
+    builder = StreamingIndexBuilder(vectordb_path, embeddings)
 
     for repo_path in repo_dirs:
         repo_name = os.path.basename(repo_path)
@@ -72,15 +94,14 @@ def embed_rust_files(repo_dirs: str, code_change_dir: str, vectordb_path: str) -
                                                                code_changes.split("================================================================================")))
 
                                     if len(code_changes) > 0:
-                                        documents.append(rust_code)
-                                        metadata.append({
+                                        builder.add(rust_code, {
                                             "repo_name": repo_name,
                                             "file_path": rust_file_path,
                                             "code_change_file": os.path.join(code_change_dir, f"{repo_name}_changes.txt")
                                         })
 
             except Exception as e:
-                pass
+                print(f"Skipping repository {repo_name}: {e}")
             finally:
                 if current_branch is not None:
                     # Checkout back to the original branch
@@ -89,11 +110,9 @@ def embed_rust_files(repo_dirs: str, code_change_dir: str, vectordb_path: str) -
                     print(
                         f"Checked back to branch {current_branch} for repository {repo_name}")
 
-    print(f"Embedding {len(documents)} Rust files...")
-    # Create and save the vector database
-    vectordb = FAISS.from_texts(documents, embeddings, metadatas=metadata)
-    vectordb.save_local(vectordb_path)
-    print(f"Vector database saved at {vectordb_path}")
+    # Embed the last batch and save the vector database
+    manifest = builder.finish()
+    print(f"Vector database of {manifest['count']} Rust files ({builder.stats['added']} seen) saved at {vectordb_path}")
 
 # Step 2: Search for similar Rust files and fetch relevant code changes
 
@@ -117,33 +136,44 @@ def fetch_similar_code_and_changes(vectordb: object, new_rust_file: str, top_k:
     with open(new_rust_file, "r") as f:
         new_rust_code = f.read()[:15000]
 
-    # Perform similarity search
-    results = vectordb.similarity_search(new_rust_code, k=top_k)
+    return [
+        (result.page_content, code_changes or "No relevant code changes found.")
+        for result, code_changes in search_similar_code(vectordb, new_rust_code, top_k)
+    ]
 
-    similar_code_and_changes = []
-    for result in results:
-        # print(result)
-        rust_code = result.page_content
-        code_change_file = result.metadata["code_change_file"]
-        matched_code_file = result.metadata["file_path"]
-        with open(code_change_file, "r") as f:
-            code_changes = f.read()
 
-        code_changes = list(filter(lambda code_change: code_change.find(os.path.basename(matched_code_file)) != -1,
-                                   code_changes.split("================================================================================")))
-        if len(code_changes) > 0:
-            code_changes = "\n".join(code_changes)
-        else:
-            code_changes = "No relevant code changes found."
-
-        similar_code_and_changes.append((rust_code, code_changes))
+def search_similar_code(vectordb: object, rust_code: str, top_k: int = 3) -> List[Tuple[Document, str]]:
+    """
+    [(Document, code changes of its file)] for the top_k most similar Rust files; the
+    changes are "" when the change file has none for that file. A file shared by
+    several repositories takes the changes of the first source that has some.
+    """
+    results = vectordb.similarity_search(rust_code, k=top_k)
 
-    return similar_code_and_changes
+    similar = []
+    for result in results:
+        code_changes = []
+        for source in result.metadata.get("sources", [result.metadata]):
+            matched_code_file = source["file_path"]
+            with open(source["code_change_file"], "r") as f:
+                code_changes = list(filter(lambda code_change: code_change.find(os.path.basename(matched_code_file)) != -1,
+                                           f.read().split(CHANGE_SEPARATOR)))
+            if code_changes:
+                break
+        similar.append((result, "\n".join(code_changes)))
+    return similar
+
+
+def format_reference_context(similar_code_and_changes: List[Tuple[str, str]]) -> str:
+    return "\n\n".join(
+        f"Similar Rust Code:\n{code[:15000]}...\n\nReference Code Changes:\n{changes}"
+        for code, changes in similar_code_and_changes
+    )
 
 
 def create_my_retriever_function(vectordb_path):
-    vectordb = FAISS.load_local(vectordb_path, OllamaEmbeddings(
-        model="nomic-embed-text", base_url="http://localhost:11435"), allow_dangerous_deserialization=True)
+    vectordb = load_vector_store(vectordb_path, OllamaEmbeddings(
+        model="nomic-embed-text", base_url="http://localhost:11435"))
 
     def my_retriever_function(query):
         query_file = query["input"]
@@ -151,10 +181,7 @@ def create_my_retriever_function(vectordb_path):
         # Replace with your specific retrieval logic
         similar_code_and_changes = fetch_similar_code_and_changes(
             vectordb, query["input"], top_k=1)
-        reference_context = "\n\n".join(
-            f"Similar Rust Code:\n{code[:15000]}...\n\nReference Code Changes:\n{changes}"
-            for code, changes in similar_code_and_changes
-        )
+        reference_context = format_reference_context(similar_code_and_changes)
         print(f"Reference context:\n {reference_context}\n")
         # return reference_context
         # Return the reference context wrapped in a Document object
@@ -185,12 +212,7 @@ def generate_revision(new_rust_file: str, custom_retriever: RunnableLambda) -> s
         new_rust_code = f.read()[:15000]
 
     # Define the prompt template
-    prompt_template = PromptTemplate.from_template(
-        "You are an expert Rust developer. Now we are working on migrating Rust library code to make it compatible for Rust-SGX SDK. Based on the following reference context:\n{context}\n\n "
-        "Please recommend code revision/addition/removal for the given Rust code file {input}\n,"
-        "having code: \n{new_rust_code}\n\n"
-        "MUST output only code revisions/additions/removals in pure text format like those of 'git diff' on file versions. Do not include any explanation in the output. The generated code revisions/additions/removals MUST be given after the annotation 'CODE MIGRATION:'\n"
-    )
+    prompt_template = PromptTemplate.from_template(REVISION_PROMPT)
 
     # Initialize the LLM using Ollama's qwen2.5:32b model
     llm = ChatOpenAI(
@@ -222,13 +244,11 @@ if __name__ == "__main__":
     vectordb_path = "/workspaces/TEE-Forge-It/automerge/sgx-world/vectordb"
 
     # Split repositories into training (70%) and testing (30%)
+    # 并行、带缓存和指标输出的评测见 rag_eval.py
     all_repos = [os.path.join(base_dir, repo) for repo in os.listdir(
         base_dir) if os.path.isdir(os.path.join(base_dir, repo))]
     # all_repos = all_repos[:20]  # Limit to 10 repositories for testing
-    random.shuffle(all_repos)
-    split_index = int(0.7 * len(all_repos))
-    training_repos = all_repos[:split_index]
-    testing_repos = all_repos[split_index:]
+    training_repos, testing_repos = split_repositories(all_repos, 0.7, seed=int(os.getenv("FORGE_EVAL_SEED", "0")))
 
     print(f"Training repositories: {len(training_repos)}")
     print("List of training repositories:")
@@ -281,7 +301,7 @@ if __name__ == "__main__":
                             print(
                                 f"Recommended Code Changes for {rust_file_path}:\n{revised_code}")
             except Exception as e:
-                pass
+                print(f"Testing repository {repo_name} failed: {e}")
             finally:
                 if current_branch is not None:
                     # Checkout back to the original branch
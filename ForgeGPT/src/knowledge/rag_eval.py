@@ -0,0 +1,299 @@
+"""
+Evaluation harness for the naive RAG pipeline of changes_naive_rag.py.
+
+Repositories are split with a fixed seed; the training split is embedded once per
+split (the index directory keeps a split.json and is rebuilt only when the split
+changes). Every `.rs` file of the testing split at its fork point is one task. Files
+are read with `git show <fork point>:<path>` instead of checking the repository out,
+so tasks of the same repository can run at the same time: they are sharded over a
+process pool, and each process runs its shard on an asyncio loop with at most
+`concurrency` files in flight (retrieval in a thread, generation with `ainvoke`).
+
+LLM answers are cached in SQLite by (model, temperature, prompt), so re-running a
+configuration, or a configuration that retrieves the same references, costs no LLM
+calls. Per-file results and the metrics of every configuration are written to a JSON
+file:
+    retrieval_hit_rate   files whose retrieved references come with code changes
+    applicable_rate      files whose generated diff has hunks that apply to the file
+    latency              mean / p50 / p95 seconds of retrieve, generate and apply
+
+    python -m src.knowledge.rag_eval --seed 0 --top-k 1 3 --workers 4 --concurrency 8 --output rag_eval.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.diff.diff_hunk_read import parse_diff_hunks
+from src.diff.patch_engine import apply_hunks
+from src.knowledge.changes_naive_rag import (
+    REVISION_PROMPT, embed_rust_files, format_reference_context, search_similar_code, split_repositories,
+)
+from src.knowledge.extract_code_change import get_fork_point, get_upstream_branch
+
+FORKED_REPO = "/workspaces/TEE-Forge-It/forked_repo"
+CODE_CHANGE_DIR = "/workspaces/TEE-Forge-It/automerge/sgx-world/extracted_changes"
+VECTORDB_PATH = "/workspaces/TEE-Forge-It/automerge/sgx-world/vectordb"
+LLM_CACHE_PATH = os.getenv("FORGE_LLM_CACHE", "/workspaces/TEE-Forge-It/changes/llm_cache.sqlite")
+MAX_CHARS = 15000
+STAGES = ("retrieve", "generate", "apply")
+
+
+class LLMCache:
+    """
+    SQLite table of LLM answers keyed by sha1(model, temperature, prompt). Safe to share
+    between processes: every process opens its own connection.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if path and os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            self._db = sqlite3.connect(path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT)")
+            self._db.commit()
+
+    @staticmethod
+    def key(llm, prompt):
+        model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+        return hashlib.sha1(f"{model}\0{getattr(llm, 'temperature', '')}\0{prompt}".encode()).hexdigest()
+
+    def get(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, response):
+        if self._db is None:
+            return
+        self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?)", (key, response))
+        self._db.commit()
+
+    async def generate(self, llm, prompt):
+        """
+        (answer, cached) for prompt.
+        """
+        key = self.key(llm, prompt)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached, True
+        response = await llm.ainvoke(prompt)
+        answer = response.content if hasattr(response, 'content') else str(response)
+        self.misses += 1
+        self.put(key, answer)
+        return answer, False
+
+
+def _git(repo_path, *args):
+    return subprocess.check_output(["git", *args], cwd=repo_path, text=True, errors="replace")
+
+
+def list_test_tasks(testing_repos, code_change_dir=CODE_CHANGE_DIR):
+    """
+    One task per `.rs` file of every testing repository (with a change file) at its fork
+    point: {"repo", "repo_path", "fork_point", "file"}. Repositories that fail are reported, not dropped silently.
+    """
+    tasks, skipped = [], {}
+    for repo_path in testing_repos:
+        repo_name = os.path.basename(repo_path)
+        if not os.path.exists(os.path.join(repo_path, ".git")):
+            continue
+        if not os.path.exists(os.path.join(code_change_dir, f"{repo_name}_changes.txt")):
+            continue
+        try:
+            fork_point = get_fork_point(repo_path, get_upstream_branch(repo_path))
+            files = _git(repo_path, "ls-tree", "-r", "--name-only", fork_point).splitlines()
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            skipped[repo_name] = str(e)
+            continue
+        for rel_path in sorted(f for f in files if f.endswith(".rs")):
+            tasks.append({"repo": repo_name, "repo_path": repo_path, "fork_point": fork_point, "file": rel_path})
+    return tasks, skipped
+
+
+def generated_diff(answer):
+    """
+    The diff part of an answer: the text after 'CODE MIGRATION:' without code fences.
+    """
+    _, marker, rest = answer.partition("CODE MIGRATION:")
+    text = rest if marker else answer
+    return "\n".join(line for line in text.splitlines() if not line.lstrip().startswith("```"))
+
+
+async def evaluate_file(task, vectordb, llm, cache, top_k=1, semaphore=None):
+    """
+    Retrieve, generate and apply for one file. Exceptions are recorded in "error".
+    """
+    result = {"repo": task["repo"], "file": task["file"], "timings": {}}
+    async with semaphore or asyncio.Semaphore(1):
+        try:
+            repo_path, fork_point, rel_path = task["repo_path"], task["fork_point"], task["file"]
+            rust_code = _git(repo_path, "show", f"{fork_point}:{rel_path}")
+            result["changed"] = bool(_git(repo_path, "diff", fork_point, "HEAD", "--", rel_path).strip())
+
+            start = time.perf_counter()
+            similar = await asyncio.to_thread(search_similar_code, vectordb, rust_code[:MAX_CHARS], top_k)
+            result["timings"]["retrieve"] = time.perf_counter() - start
+            result["references"] = [doc.metadata.get("file_path") for doc, _ in similar]
+            result["retrieval_hit"] = any(changes for _, changes in similar)
+
+            context = format_reference_context([
+                (doc.page_content, changes or "No relevant code changes found.") for doc, changes in similar
+            ])
+            prompt = REVISION_PROMPT.format(context=context, input=os.path.join(repo_path, rel_path),
+                                            new_rust_code=rust_code[:MAX_CHARS])
+            start = time.perf_counter()
+            answer, result["cached"] = await cache.generate(llm, prompt)
+            result["timings"]["generate"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            hunks = parse_diff_hunks(generated_diff(answer))
+            patch = apply_hunks(rust_code, hunks) if hunks else None
+            result["timings"]["apply"] = time.perf_counter() - start
+            result["hunks"] = len(hunks)
+            result["conflicts"] = len(patch.conflicts) if patch else 0
+            result["applicable"] = bool(hunks) and patch.ok
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def evaluate_files(tasks, vectordb, llm, cache, top_k=1, concurrency=8):
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(evaluate_file(t, vectordb, llm, cache, top_k, semaphore) for t in tasks))
+
+
+# 每个进程只加载一次向量库和 LLM 客户端
+_worker = {}
+
+
+def _init_worker(vectordb_path, cache_path):
+    from langchain.embeddings import OllamaEmbeddings
+    from src.embed.vector_store import load_vector_store
+    from src.model.qwen import qwen3coder_30b
+    _worker["vectordb"] = load_vector_store(vectordb_path, OllamaEmbeddings(
+        model="nomic-embed-text", base_url="http://localhost:11435"))
+    _worker["llm"] = qwen3coder_30b
+    _worker["cache_path"] = cache_path
+
+
+def _run_shard(tasks, top_k, concurrency):
+    cache = LLMCache(_worker["cache_path"])
+    return asyncio.run(evaluate_files(tasks, _worker["vectordb"], _worker["llm"], cache, top_k, concurrency))
+
+
+def run_configuration(tasks, vectordb_path, top_k=1, workers=4, concurrency=8, cache_path=LLM_CACHE_PATH):
+    """
+    Evaluate tasks on `workers` processes; results come back in task order.
+    """
+    if workers <= 1:
+        _init_worker(vectordb_path, cache_path)
+        return _run_shard(tasks, top_k, concurrency)
+    shards = [tasks[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(vectordb_path, cache_path)) as pool:
+        shard_results = list(pool.map(_run_shard, shards, [top_k] * workers, [concurrency] * workers))
+    results = [None] * len(tasks)
+    for i, shard in enumerate(shard_results):
+        results[i::workers] = shard
+    return results
+
+
+def _latency(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        "mean": sum(values) / len(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+    }
+
+
+def summarize(results):
+    """
+    Metrics of one configuration. Rates are over the files evaluated without error.
+    """
+    evaluated = [r for r in results if "error" not in r]
+    changed = [r for r in evaluated if r["changed"]]
+
+    def rate(rows, field):
+        return sum(1 for r in rows if r[field]) / len(rows) if rows else 0.0
+    return {
+        "files": len(results),
+        "errors": len(results) - len(evaluated),
+        "retrieval_hit_rate": rate(evaluated, "retrieval_hit"),
+        "applicable_rate": rate(evaluated, "applicable"),
+        "applicable_rate_changed": rate(changed, "applicable"),
+        "llm_cache_hit_rate": rate(evaluated, "cached"),
+        "latency": {stage: _latency([r["timings"][stage] for r in evaluated if stage in r["timings"]])
+                    for stage in STAGES},
+    }
+
+
+def ensure_index(training_repos, code_change_dir, vectordb_path, rebuild=False):
+    """
+    Embed the training split unless vectordb_path already holds an index of the same split.
+    """
+    split_path = os.path.join(vectordb_path, "split.json")
+    if not rebuild and os.path.isfile(split_path):
+        with open(split_path, 'r') as f:
+            if json.load(f) == sorted(training_repos):
+                return False
+    embed_rust_files(training_repos, code_change_dir, vectordb_path)
+    with open(split_path, 'w') as f:
+        json.dump(sorted(training_repos), f, indent=2)
+    return True
+
+
+def _write_report(path, report):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the naive RAG pipeline on a seeded testing split.")
+    parser.add_argument("--forked-repo", default=FORKED_REPO)
+    parser.add_argument("--code-change-dir", default=CODE_CHANGE_DIR)
+    parser.add_argument("--vectordb", default=VECTORDB_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--train-ratio", type=float, default=0.7)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1], help="retrieval configurations to compare")
+    parser.add_argument("--workers", type=int, default=4, help="evaluation processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="files in flight per process")
+    parser.add_argument("--limit", type=int, help="evaluate only the first N files")
+    parser.add_argument("--rebuild-index", action="store_true")
+    parser.add_argument("--output", default="rag_eval.json")
+    args = parser.parse_args()
+
+    all_repos = [os.path.join(args.forked_repo, repo) for repo in os.listdir(args.forked_repo)
+                 if os.path.isdir(os.path.join(args.forked_repo, repo))]
+    training_repos, testing_repos = split_repositories(all_repos, args.train_ratio, args.seed)
+    ensure_index(training_repos, args.code_change_dir, args.vectordb, args.rebuild_index)
+    tasks, skipped = list_test_tasks(testing_repos, args.code_change_dir)
+    tasks = tasks[:args.limit] if args.limit else tasks
+    print(f"{len(training_repos)} training / {len(testing_repos)} testing repositories, {len(tasks)} files")
+
+    report = {"seed": args.seed, "training": training_repos, "testing": testing_repos,
+              "skipped": skipped, "configurations": {}}
+    for top_k in args.top_k:
+        start = time.perf_counter()
+        results = run_configuration(tasks, args.vectordb, top_k, args.workers, args.concurrency)
+        metrics = summarize(results)
+        metrics["seconds"] = time.perf_counter() - start
+        report["configurations"][f"top_k={top_k}"] = {"metrics": metrics, "results": results}
+        _write_report(args.output, report)
+        print(f"top_k={top_k}: {json.dumps(metrics)}")
+    print(f"Report written to {args.output}")
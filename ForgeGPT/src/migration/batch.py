@@ -0,0 +1,270 @@
+"""
+Batch migration of many forked crates in one process.
+
+The vector DB, embedder and LLM client are loaded once and shared; projects run on a
+thread pool of `max_parallel` workers, each in its own project directory and
+BuildSession. Projects run in the topological order of their dependencies on each
+other: a crate starts only after the forked crates it depends on have been
+migrated and verified to build for SGX (verify_sgx_project), and crates of the same
+level run in parallel; the crates of a dependency cycle share the last level and
+start together. Per-project progress is
+checkpointed to a JSON file after every project, so an interrupted batch resumes
+with the projects that have not finished.
+
+Every project runs within a project budget (time, builds, LLM tokens; budget.py) and
+every file within a file budget, optionally under a budget for the whole batch;
+projects not started when the batch budget is exhausted are "skipped" and run again
+on resume. The worst-case duration is printed with the migration plan.
+
+    python -m src.migration.batch --forked-repo /workspaces/TEE-Forge-It/forked_repo --max-parallel 2
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.compilation.session import BuildSession, keep_containers
+from src.compilation.verify import verify_sgx_project
+from src.dep_analysis import build_dependency_graph, migration_levels
+from src.migration.budget import Budget, FILE_BUDGET, PROJECT_BUDGET
+from src.migration.fix_memo import get_fix_memo
+from src.migration.migrate import load_shared_state, migrate_project
+from src.tracing import span, get_tracer
+
+FORKED_REPO = "/workspaces/TEE-Forge-It/forked_repo"
+VECTORDB_PATH = "/workspaces/TEE-Forge-It/changes/compiler_error_faiss_db"
+
+
+class BatchCheckpoint:
+    """
+    {project: {"status": "done" | "failed" | "running" | "blocked" | "skipped", ...}} JSON file, rewritten
+    atomically after every update. "verified" is True once the migrated project built
+    for SGX; only then is it "done".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.projects = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.projects = json.load(f)
+
+    def status(self, project):
+        return self.projects.get(project, {}).get("status")
+
+    def verified(self, project):
+        return self.projects.get(project, {}).get("verified") is True
+
+    def update(self, project, **fields):
+        with self._lock:
+            self.projects.setdefault(project, {}).update(fields)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.projects, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def list_projects(forked_repo=FORKED_REPO):
+    """
+    Sub-directories of forked_repo that are git repositories, sorted by name.
+    """
+    return sorted(
+        os.path.join(forked_repo, name) for name in os.listdir(forked_repo)
+        if os.path.isdir(os.path.join(forked_repo, name, ".git"))
+    )
+
+
+def _run_project(project_path, shared_state, checkpoint, batch_budget=None, project_budget=None, file_budget=None):
+    project = os.path.basename(project_path)
+    exhausted = batch_budget.exhausted() if batch_budget else None
+    if exhausted:
+        checkpoint.update(project, status="skipped", reason=exhausted, duration=0.0)
+        return project, checkpoint.projects[project]
+    started = time.time()
+    checkpoint.update(project, status="running", started=started)
+    session = BuildSession(project_path)
+    limits = project_budget or PROJECT_BUDGET
+    budget = batch_budget.child("project", **limits) if batch_budget else Budget("project", **limits)
+    files, verified = {}, False
+    try:
+        with session:
+            files = migrate_project(project_path, *shared_state, budget=budget, file_budget=file_budget)
+            # migrate_project 不报错不代表能编译，依赖它的项目要等验证通过
+            verify_sgx_project(os.path.dirname(project_path), project)
+        status, error, verified = "done", None, True
+    except Exception as e:
+        print(f"Project {project} failed: {e}")
+        status, error = "failed", str(e)[:500]
+    fields = dict(status=status, verified=verified, finished=time.time(), duration=time.time() - started,
+                  files=files, budget=budget.to_dict(), **session.stats())
+    if error:
+        fields["error"] = error
+    checkpoint.update(project, **fields)
+    return project, checkpoint.projects[project]
+
+
+def throughput_report(records, wall_seconds):
+    """
+    Crates per hour over the batch wall time and builds per crate over the finished projects.
+    :param records: {project: checkpoint record}
+    """
+    finished = {p: r for p, r in records.items() if r.get("status") in ("done", "failed")}
+    builds = [r.get("builds", 0) for r in finished.values()]
+    return {
+        "projects": len(finished),
+        "done": sum(1 for r in finished.values() if r["status"] == "done"),
+        "failed": sum(1 for r in finished.values() if r["status"] == "failed"),
+        "wall_seconds": wall_seconds,
+        "crates_per_hour": len(finished) / wall_seconds * 3600 if wall_seconds else 0.0,
+        "builds_per_crate": sum(builds) / len(builds) if builds else 0.0,
+        "checks_per_crate": sum(r.get("checks", 0) for r in finished.values()) / len(finished) if finished else 0.0,
+        "failed_builds": sum(r.get("failures", 0) for r in finished.values()),
+        "build_seconds": sum(r.get("build_seconds", 0.0) for r in finished.values()),
+        "check_seconds": sum(r.get("check_seconds", 0.0) for r in finished.values()),
+        "per_project": {p: {k: r.get(k) for k in ("status", "duration", "builds", "failures")} for p, r in finished.items()},
+    }
+
+
+def worst_case_seconds(levels, max_parallel, project_budget=None, batch_seconds=None):
+    """
+    Upper bound of the batch wall time from the project time limit: every level runs
+    ceil(projects / max_parallel) rounds of projects that each stop at that limit.
+    None when projects have no time limit and the batch has none either.
+    """
+    project_seconds = (project_budget or PROJECT_BUDGET).get("seconds")
+    bound = None
+    if project_seconds is not None:
+        bound = sum(math.ceil(len(level) / max_parallel) for level in levels) * project_seconds
+    if batch_seconds is not None:
+        bound = batch_seconds if bound is None else min(bound, batch_seconds)
+    return bound
+
+
+def _blocking_dependencies(project_path, graph, checkpoint, level=()):
+    """
+    The dependencies of project_path that have not been verified to build for SGX.
+    Dependencies in the same level are on a dependency cycle with project_path (see
+    migration_levels): they start together and do not block.
+    """
+    return sorted(os.path.basename(d) for d in graph.get(project_path, ())
+                  if d not in level and not checkpoint.verified(os.path.basename(d)))
+
+
+def migrate_projects(project_paths, vectordb_path=VECTORDB_PATH, max_parallel=2,
+                     checkpoint_path="migration_checkpoint.json", retry_failed=False, shared_state=None,
+                     order="dependencies", project_budget=None, file_budget=None, batch_seconds=None):
+    """
+    Migrate project_paths concurrently with at most max_parallel projects in flight.
+    Projects already "done" in the checkpoint (and "failed" ones unless retry_failed)
+    are skipped. Returns the throughput report of the projects run in this call.
+    :param order: "dependencies" runs the projects level by level in the topological
+        order of their resolved dependencies on each other (src/dep_analysis.py); a
+        project whose forked dependencies were not verified to build is marked
+        "blocked" instead of run. "name" runs them all as one level.
+    :param project_budget: {"seconds", "builds", "tokens"} of each project (default
+        PROJECT_BUDGET), file_budget the same for each file (default FILE_BUDGET)
+    :param batch_seconds: wall-clock limit of the whole batch
+    """
+    checkpoint = BatchCheckpoint(checkpoint_path)
+    skip = {"done"} if retry_failed else {"done", "failed"}
+    pending = [p for p in project_paths if checkpoint.status(os.path.basename(p)) not in skip]
+    print(f"{len(project_paths) - len(pending)} projects already finished, {len(pending)} to run")
+    if order == "dependencies":
+        with span("dependencies.graph", projects=len(project_paths)):
+            graph = build_dependency_graph(project_paths)
+        levels = migration_levels({p: graph[p] for p in pending})
+        print(f"Migration plan: {len(levels)} levels of {[len(level) for level in levels]} projects")
+    else:
+        graph, levels = {}, [pending] if pending else []
+    bound = worst_case_seconds(levels, max_parallel, project_budget, batch_seconds)
+    if bound is not None:
+        print(f"Worst-case duration: {bound / 3600:.1f} h (plus the build or LLM call in flight at the limit)")
+    batch_budget = Budget("batch", seconds=batch_seconds)
+    if shared_state is None:
+        shared_state = load_shared_state(vectordb_path)
+
+    records = {}  # 只统计本次运行的项目
+    blocked = {}
+    start = time.perf_counter()
+    with span("migrate.batch", projects=len(pending), max_parallel=max_parallel, levels=len(levels)):
+        for level_index, level in enumerate(levels):
+            runnable = []
+            for project_path in level:
+                waiting_for = _blocking_dependencies(project_path, graph, checkpoint, set(level))
+                if waiting_for:
+                    project = os.path.basename(project_path)
+                    print(f"{project} is blocked by dependencies that do not build yet: {waiting_for}")
+                    checkpoint.update(project, status="blocked", blocked_by=waiting_for)
+                    blocked[project] = waiting_for
+                else:
+                    runnable.append(project_path)
+            # 同一个 work dir 下的项目共用容器，按 work dir 分组依次运行
+            groups = {}
+            for project_path in runnable:
+                groups.setdefault(os.path.dirname(os.path.abspath(project_path)), []).append(project_path)
+            with span("migrate.level", level=level_index, projects=len(runnable)):
+                for work_dir, group in groups.items():
+                    with keep_containers(work_dir), ThreadPoolExecutor(max_workers=max_parallel) as pool:
+                        futures = [pool.submit(_run_project, p, shared_state, checkpoint, batch_budget,
+                                               project_budget, file_budget) for p in group]
+                        for future in as_completed(futures):
+                            project, record = future.result()
+                            records[project] = record
+                            print(f"[{len(records)}/{len(pending)}] level {level_index} {project}: {record['status']} "
+                                  f"in {record['duration']:.0f}s, {record.get('builds', 0)} builds")
+    report = throughput_report(records, time.perf_counter() - start)
+    report["blocked"] = blocked
+    report["skipped"] = sorted(p for p, r in records.items() if r["status"] == "skipped")
+    report["worst_case_seconds"] = bound
+    report["fix_memo"] = get_fix_memo().report()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate several forked crates to SGX in one process.")
+    parser.add_argument("projects", nargs="*", help="project directories (default: every git repo under --forked-repo)")
+    parser.add_argument("--forked-repo", default=FORKED_REPO)
+    parser.add_argument("--vectordb", default=VECTORDB_PATH)
+    parser.add_argument("--max-parallel", type=int, default=2)
+    parser.add_argument("--checkpoint", default="migration_checkpoint.json")
+    parser.add_argument("--report", default="migration_report.json")
+    parser.add_argument("--retry-failed", action="store_true")
+    parser.add_argument("--order", choices=["dependencies", "name"], default="dependencies",
+                        help="run crates after their forked dependencies (default) or all at once")
+    parser.add_argument("--plan", action="store_true", help="only print the dependency levels and exit")
+    parser.add_argument("--project-seconds", type=float, default=PROJECT_BUDGET["seconds"])
+    parser.add_argument("--project-builds", type=int, default=PROJECT_BUDGET["builds"])
+    parser.add_argument("--project-tokens", type=int, default=PROJECT_BUDGET["tokens"])
+    parser.add_argument("--file-seconds", type=float, default=FILE_BUDGET["seconds"])
+    parser.add_argument("--file-builds", type=int, default=FILE_BUDGET["builds"])
+    parser.add_argument("--file-tokens", type=int, default=FILE_BUDGET["tokens"])
+    parser.add_argument("--batch-seconds", type=float, default=None, help="wall-clock limit of the whole batch")
+    parser.add_argument("--trace-dir", default=None)
+    args = parser.parse_args()
+
+    if args.trace_dir:
+        get_tracer().configure(enabled=True, output_dir=args.trace_dir)
+    projects = [os.path.abspath(p) for p in args.projects] or list_projects(args.forked_repo)
+    if args.plan:
+        graph = build_dependency_graph(projects)
+        for level, group in enumerate(migration_levels(graph)):
+            print(f"Level {level}:")
+            for p in group:
+                print(f"  {os.path.basename(p)} (after: {', '.join(sorted(os.path.basename(d) for d in graph[p])) or '-'})")
+        raise SystemExit(0)
+    report = migrate_projects(
+        projects, args.vectordb, args.max_parallel, args.checkpoint, args.retry_failed, order=args.order,
+        project_budget={"seconds": args.project_seconds, "builds": args.project_builds, "tokens": args.project_tokens},
+        file_budget={"seconds": args.file_seconds, "builds": args.file_builds, "tokens": args.file_tokens},
+        batch_seconds=args.batch_seconds)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"{report['projects']} crates, {report['crates_per_hour']:.2f} crates/hour, "
+          f"{report['builds_per_crate']:.1f} builds/crate; report saved to {args.report}")
+    memo = report["fix_memo"]
+    print(f"fix memo: {memo['hits']}/{memo['lookups']} hits ({memo['hit_rate']:.0%}), "
+          f"{memo['successes']} fixed builds, {memo['saved_seconds']:.0f}s of retrieval and generation saved")
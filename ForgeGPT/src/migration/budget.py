@@ -0,0 +1,99 @@
+"""
+Time, build and token budgets for the repair loop.
+
+Budgets nest: a file budget is a child of its project budget, which may be a child
+of a batch budget, and everything charged to a child is charged to its parents. A
+budget is exhausted as soon as any budget on the chain is, so a file stops when its
+own limits or its project's are reached and a batch has a worst-case duration of
+about (projects / max_parallel) * project seconds, plus the one build or LLM call in
+flight when the limit is reached (builds are killed at the remaining time).
+
+    project = Budget("project", **PROJECT_BUDGET)
+    file_budget = project.child("file", **FILE_BUDGET)
+    file_budget.exhausted(tokens=2000)   # "project tokens" or None
+"""
+import threading
+import time
+
+from src.model.token_util import count_tokens
+
+FILE_BUDGET = {"seconds": 20 * 60, "builds": 8, "tokens": 60_000}
+PROJECT_BUDGET = {"seconds": 2 * 3600, "builds": 60, "tokens": 500_000}
+
+
+class BudgetExhausted(Exception):
+    """Raised before a build or an LLM call that the budget no longer allows."""
+
+    def __init__(self, reason):
+        super().__init__(f"budget exhausted: {reason}")
+        self.reason = reason
+
+
+def estimate_tokens(text):
+    try:
+        return count_tokens(text)
+    except Exception:  # tiktoken 下载编码表失败（离线）时按 4 字符一个 token 估算
+        return len(text) // 4
+
+
+class Budget:
+    """
+    Limits on wall-clock seconds, builds and LLM tokens (None: unlimited), counted
+    from the budget's creation.
+    """
+
+    def __init__(self, name, seconds=None, builds=None, tokens=None, parent=None):
+        self.name = name
+        self.limits = {"seconds": seconds, "builds": builds, "tokens": tokens}
+        self.used = {"builds": 0, "tokens": 0}
+        self.parent = parent
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def child(self, name, seconds=None, builds=None, tokens=None):
+        return Budget(name, seconds, builds, tokens, parent=self)
+
+    def _chain(self):
+        budget = self
+        while budget is not None:
+            yield budget
+            budget = budget.parent
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def charge(self, builds=0, tokens=0):
+        for budget in self._chain():
+            with budget._lock:
+                budget.used["builds"] += builds
+                budget.used["tokens"] += tokens
+
+    def remaining_seconds(self):
+        """
+        Seconds left before the first time limit on the chain, or None when there is none.
+        """
+        remaining = [b.limits["seconds"] - b.elapsed() for b in self._chain() if b.limits["seconds"] is not None]
+        return max(0.0, min(remaining)) if remaining else None
+
+    def exhausted(self, builds=0, tokens=0):
+        """
+        The first limit on the chain that would be exceeded by `builds` more builds and
+        `tokens` more tokens, as "<name> <resource>", or None.
+        """
+        for budget in self._chain():
+            limits, used = budget.limits, budget.used
+            if limits["seconds"] is not None and budget.elapsed() >= limits["seconds"]:
+                return f"{budget.name} seconds"
+            if limits["builds"] is not None and used["builds"] + builds > limits["builds"]:
+                return f"{budget.name} builds"
+            if limits["tokens"] is not None and used["tokens"] + tokens > limits["tokens"]:
+                return f"{budget.name} tokens"
+        return None
+
+    def check(self, builds=0, tokens=0):
+        reason = self.exhausted(builds, tokens)
+        if reason:
+            raise BudgetExhausted(reason)
+
+    def to_dict(self):
+        return {"name": self.name, "limits": dict(self.limits), "seconds": self.elapsed(), **self.used}
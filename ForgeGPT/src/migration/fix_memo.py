@@ -0,0 +1,300 @@
+"""
+Fix memo: patches that made an SGX build succeed, keyed by error fingerprint.
+
+A fingerprint is a hash of the normalized error diagnostics of a build log: file
+positions, absolute paths, versions, hashes and numbers are removed, error codes and
+quoted identifiers are kept. The repair loop (RepairController in migrate.py) looks
+up the fingerprint of the whole log first and then of each single error, and tries a
+memoized fix before any retrieval or LLM call. Fixes are
+    {"kind": "hunks", "file": "src/lib.rs", "diff": "@@ ..."}   learned from runs
+    {"kind": "prelude"}                                          sgx_tstd prelude (Notes.md 1)
+    {"kind": "pin", "section": "dependencies", "package": "libc", "version": "=0.2.77"}
+The pins and the prelude are seeded from the recurring errors in Notes.md.
+
+    memo = get_fix_memo()
+    print(memo.report())  # lookups, hits, hit rate and seconds saved
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+
+from src.compilation.diagnostics import parse_diagnostics
+from src.diff.diff_hunk_read import parse_diff_hunks
+from src.diff.patch_engine import apply_hunks
+from src.diff.rust_items import prelude_end
+
+MEMO_PATH = os.getenv("FORGE_FIX_MEMO", "/workspaces/TEE-Forge-It/changes/.forge/fix_memo.json")
+# 学到的补丁超过这个行数就不记，通常是整文件重写
+MAX_LEARNED_DIFF_LINES = 200
+
+_PATH_RE = re.compile(r'(?:[A-Za-z]:)?(?:/[\w.@+-]+){2,}/?')
+_VERSION_RE = re.compile(r'\bv?\d+\.\d+(?:\.\d+)?(?:[-+][\w.]+)?\b')
+_HASH_RE = re.compile(r'\b[0-9a-f]{7,40}\b')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+SGX_PRELUDE = [
+    '#![cfg_attr(not(target_env = "sgx"), no_std)]',
+    '#![cfg_attr(target_env = "sgx", feature(rustc_private))]',
+    '',
+    '#[cfg(not(target_env = "sgx"))]',
+    '#[macro_use]',
+    'extern crate sgx_tstd as std;',
+    '',
+]
+
+# Notes.md 中反复出现的错误及其修复
+SEED_FIXES = [
+    ("error[E0463]: can't find crate for `std`", {"kind": "prelude"}),
+    ("error: failed to download `libc v0.2.175`",
+     {"kind": "pin", "section": "dependencies", "package": "libc", "version": "=0.2.77"}),
+    ("error: failed to download `cc v1.1.1`",
+     {"kind": "pin", "section": "build-dependencies", "package": "cc", "version": "=1.0.28"}),
+]
+
+
+def normalize_message(message):
+    message = _PATH_RE.sub("<path>", message)
+    message = _VERSION_RE.sub("<ver>", message)
+    message = _HASH_RE.sub("<hash>", message)
+    message = _NUMBER_RE.sub("<n>", message)
+    return " ".join(message.split())
+
+
+def _error_keys(error_text):
+    return sorted({
+        f"{d.code or ''}:{normalize_message(d.message)}"
+        for d in parse_diagnostics(error_text) if not d.is_summary
+    })
+
+
+def _hash(keys):
+    return hashlib.sha1("\n".join(keys).encode()).hexdigest()[:16]
+
+
+def fingerprint(error_text):
+    """
+    Fingerprint of all the errors in a build log, or None when it has no rustc/cargo errors.
+    """
+    keys = _error_keys(error_text)
+    return _hash(keys) if keys else None
+
+
+def lookup_keys(error_text):
+    """
+    [fingerprint of the whole log, fingerprint of each error...] without duplicates.
+    """
+    keys = _error_keys(error_text)
+    if not keys:
+        return []
+    fingerprints = [_hash(keys)]
+    for key in keys:
+        single = _hash([key])
+        if single not in fingerprints:
+            fingerprints.append(single)
+    return fingerprints
+
+
+def make_hunks_diff(before, after):
+    """
+    The `@@` hunks turning before into after (no file headers), as parse_diff_hunks reads them.
+    """
+    lines = difflib.unified_diff(before.splitlines(), after.splitlines(), lineterm="", n=3)
+    return "\n".join(line for line in lines if not line.startswith(("---", "+++")))
+
+
+def apply_prelude(rust_code):
+    if "sgx_tstd" in rust_code:
+        return None
+    lines = rust_code.splitlines()
+    # 插在开头的 `#![...]` 和 `//!` 文档之后
+    insert_at = prelude_end(rust_code)
+    patched = lines[:insert_at] + SGX_PRELUDE + lines[insert_at:]
+    return "\n".join(patched) + ("\n" if rust_code.endswith("\n") else "")
+
+
+def apply_pin(manifest, section, package, version):
+    """
+    Cargo.toml text with `package = "version"` set in [section], or None if it is already pinned.
+    """
+    line = f'{package} = "{version}"'
+    lines = manifest.splitlines()
+    header = f"[{section}]"
+    start = next((i for i, l in enumerate(lines) if l.strip() == header), None)
+    if start is None:
+        return manifest.rstrip("\n") + f"\n\n{header}\n{line}\n"
+    end = next((i for i in range(start + 1, len(lines)) if lines[i].lstrip().startswith("[")), len(lines))
+    for i in range(start + 1, end):
+        if re.match(rf'^\s*{re.escape(package)}\s*=', lines[i]):
+            if lines[i].strip() == line:
+                return None
+            lines[i] = line
+            break
+    else:
+        lines.insert(start + 1, line)
+    return "\n".join(lines) + "\n"
+
+
+def _fix_key(fix):
+    return tuple(fix.get(k) for k in ("kind", "file", "diff", "section", "package", "version"))
+
+
+class FixMemo:
+    """
+    {"entries": {fingerprint: {"example", "fixes": [fix, ...]}}, "llm_paths", "llm_seconds"}
+    JSON file, saved after every update when the parent of its directory exists (the
+    default lives in changes/.forge/, outside the project diffs). Every fix carries
+    its "source" (seed/learned), "successes" and "failures".
+    """
+
+    def __init__(self, path=MEMO_PATH, seed=True):
+        self.path = path
+        self.entries = {}
+        self.llm_paths = 0
+        self.llm_seconds = 0.0
+        self.counters = {"lookups": 0, "hits": 0, "successes": 0, "failures": 0, "saved_seconds": 0.0}
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+            self.llm_paths = data.get("llm_paths", 0)
+            self.llm_seconds = data.get("llm_seconds", 0.0)
+        if seed:
+            for error_text, fix in SEED_FIXES:
+                self._add(fingerprint(error_text), error_text, dict(fix, source="seed"))
+
+    def _add(self, key, error_text, fix):
+        entry = self.entries.setdefault(key, {"example": error_text.strip().splitlines()[0][:200], "fixes": []})
+        for existing in entry["fixes"]:
+            if _fix_key(existing) == _fix_key(fix):
+                return existing
+        fix.setdefault("successes", 0)
+        fix.setdefault("failures", 0)
+        entry["fixes"].append(fix)
+        return fix
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(os.path.dirname(directory)):
+            return
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"entries": self.entries, "llm_paths": self.llm_paths, "llm_seconds": self.llm_seconds},
+                      f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, error_text, rel_file):
+        """
+        (fingerprint, [fix, ...]) for the first fingerprint with fixes that may apply to
+        rel_file, best first, or (None, []). Fixes that failed more than twice as often
+        as they succeeded are left out.
+        """
+        with self._lock:
+            self.counters["lookups"] += 1
+            for key in lookup_keys(error_text):
+                fixes = [
+                    f for f in self.entries.get(key, {}).get("fixes", [])
+                    if f["failures"] <= f["successes"] + 2 and f.get("file", rel_file) == rel_file
+                ]
+                if fixes:
+                    fixes.sort(key=lambda f: -(f["successes"] + 1) / (f["successes"] + f["failures"] + 2))
+                    return key, fixes
+        return None, []
+
+    def record(self, fix, success):
+        """
+        Outcome of the build after applying fix; every recorded fix counts as a hit.
+        """
+        with self._lock:
+            fix["successes" if success else "failures"] += 1
+            self.counters["hits"] += 1
+            self.counters["successes" if success else "failures"] += 1
+            if success:
+                self.counters["saved_seconds"] += self.average_llm_seconds()
+            self._save()
+
+    def record_llm_path(self, seconds):
+        """
+        Time spent on retrieval and generation for one failing build; a successful memo fix saves this much.
+        """
+        with self._lock:
+            self.llm_paths += 1
+            self.llm_seconds += seconds
+            self._save()
+
+    def average_llm_seconds(self):
+        return self.llm_seconds / self.llm_paths if self.llm_paths else 0.0
+
+    def learn(self, error_text, rel_file, before, after):
+        """
+        Memoize the change before -> after of rel_file as the fix for error_text.
+        """
+        key = fingerprint(error_text)
+        diff = make_hunks_diff(before, after)
+        if key is None or not diff or diff.count("\n") >= MAX_LEARNED_DIFF_LINES:
+            return None
+        with self._lock:
+            fix = self._add(key, error_text, {"kind": "hunks", "file": rel_file, "diff": diff, "source": "learned"})
+            self._save()
+        return fix
+
+    def report(self):
+        """
+        Counters of this process plus the memo size.
+        """
+        with self._lock:
+            report = dict(self.counters)
+        report["hit_rate"] = report["hits"] / report["lookups"] if report["lookups"] else 0.0
+        report["fixed_rate"] = report["successes"] / report["lookups"] if report["lookups"] else 0.0
+        report["entries"] = len(self.entries)
+        return report
+
+
+def apply_fix(fix, rust_code, repo_path):
+    """
+    Apply a memoized fix. Returns (patched rust_code, undo) where undo restores any
+    file outside rust_code, or (None, None) when the fix does not apply.
+    """
+    if fix["kind"] == "hunks":
+        patch = apply_hunks(rust_code, parse_diff_hunks(fix["diff"]))
+        if patch.conflicts or patch.content == rust_code:
+            return None, None
+        return patch.content, lambda: None
+    if fix["kind"] == "prelude":
+        patched = apply_prelude(rust_code)
+        return (patched, lambda: None) if patched is not None else (None, None)
+    if fix["kind"] == "pin":
+        manifest_path = os.path.join(repo_path, "Cargo.toml")
+        if not os.path.isfile(manifest_path):
+            return None, None
+        with open(manifest_path, 'r') as f:
+            original = f.read()
+        pinned = apply_pin(original, fix["section"], fix["package"], fix["version"])
+        if pinned is None:
+            return None, None
+        with open(manifest_path, 'w') as f:
+            f.write(pinned)
+
+        def undo():
+            with open(manifest_path, 'w') as f:
+                f.write(original)
+        return rust_code, undo
+    return None, None
+
+
+_MEMO = None
+_memo_lock = threading.Lock()
+
+
+def get_fix_memo():
+    global _MEMO
+    with _memo_lock:
+        if _MEMO is None:
+            _MEMO = FixMemo()
+        return _MEMO
@@ -3,37 +3,82 @@ import os
 import json
 import subprocess
 import sys
-from langchain_community.vectorstores import FAISS
+import time
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.llms import Ollama
 from langchain_core.messages.ai import AIMessage
-from src.compilation.compile import xargo_compile_sgx_project, cargo_compile_sgx_project
+from src.compilation.compile import BuildTimeout
+from src.compilation.diagnostics import parse_diagnostics
+from src.compilation.verify import verify_sgx_project
 from src.compilation.format import remove_ansi_colors
+from src.compilation.session import BuildSession
 # Import helpers from knowledge and diff modules
 from src.diff.git_util import get_rust_files, get_original_file_content_with_upstream_branch, get_original_file_content, get_git_diff
+from src.embed.hybrid_retriever import HybridRetriever, load_retriever, retrieve
 from src.embed.error_embed import get_hunk_from_metadata, get_reference_example_from_metadata
 from src.diff.diff_hunk_read import parse_diff_hunks
-from src.diff.apply_diff_hunk import apply_hunk_on_new_file
+from src.diff.patch_engine import apply_hunks, APPLIED
 from src.model.chatgpt import gpt3_5_turbo
 from src.model.qwen import qwen3coder_30b
+from src.migration.budget import Budget, BudgetExhausted, FILE_BUDGET, PROJECT_BUDGET, estimate_tokens
+from src.migration.fix_memo import get_fix_memo, apply_fix, fingerprint, normalize_message
 from src.migration.prompt import prompt_hunk_gen, prompt_code_gen, prompt_git_diff_summary
+from src.migration.slicer import slice_source
+from src.tracing import span, get_tracer
 
-def analyze_forked_repo(repo_path: str, vectordb, embedder, llm):
+# 参考迁移的最低融合得分，低于此值不放入 prompt
+REFERENCE_MIN_SCORE = 0.35
+# 每个文件最多编译的候选版本数
+MAX_REPAIR_ITERATIONS = 3
+REPAIR_DIR = os.getenv("FORGE_REPAIR_DIR", "/workspaces/TEE-Forge-It/changes/repairs")
+
+
+def invoke_llm(llm, prompt, stage, budget=None):
+    """
+    Invoke the LLM inside an `llm.<stage>` span that records prompt/completion tokens.
+    With a budget the call is refused (BudgetExhausted) when the prompt alone does not
+    fit, and the tokens of the call are charged to it.
+    """
+    prompt_tokens = None
+    if budget is not None:
+        prompt_tokens = estimate_tokens(str(prompt))
+        budget.check(tokens=prompt_tokens)
+    with span(f"llm.{stage}", category="llm") as llm_span:
+        result = llm.invoke(prompt)
+        if get_tracer().enabled or budget is not None:
+            usage = getattr(result, "usage_metadata", None)
+            if usage:
+                prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            else:
+                completion = result if isinstance(result, str) else getattr(result, "content", str(result))
+                prompt_tokens = prompt_tokens if prompt_tokens is not None else estimate_tokens(str(prompt))
+                completion_tokens = estimate_tokens(completion)
+            llm_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            if budget is not None:
+                budget.charge(tokens=prompt_tokens + completion_tokens)
+    return result
+
+def analyze_forked_repo(repo_path: str, vectordb, embedder, llm, budget=None, file_budget=None):
     """
     Analyze a forked repo, retrieve changed rust files since fork point, and compute semantic change groups for each file.
+    Every file is repaired within file_budget ({"seconds", "builds", "tokens"}, default FILE_BUDGET)
+    and the project budget; files left once the project budget is exhausted are not started.
     """
+    budget = budget or Budget("project", **PROJECT_BUDGET)
     import tempfile
     import subprocess
     result = {}
-    changed_rust_files, upstream_branch,fork_point = get_rust_files(repo_path)
+    with span("git.changed_files", category="git"):
+        changed_rust_files, upstream_branch,fork_point = get_rust_files(repo_path)
     for rust_file in changed_rust_files:
         # 检查upstream分支是否存在该文件
-        file_exists_in_upstream = subprocess.call(
-            ["git", "cat-file", "-e", f"{upstream_branch}:{rust_file}"],
-            cwd=repo_path,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        ) == 0
+        with span("git.cat_file", category="git", file=rust_file):
+            file_exists_in_upstream = subprocess.call(
+                ["git", "cat-file", "-e", f"{upstream_branch}:{rust_file}"],
+                cwd=repo_path,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            ) == 0
         if not file_exists_in_upstream:
             print(f"Skipping {rust_file}: does not exist in upstream branch.")
             continue
@@ -41,178 +86,368 @@ def analyze_forked_repo(repo_path: str, vectordb, embedder, llm):
         with tempfile.NamedTemporaryFile(delete=False) as tmp_upstream:
             tmp_upstream_path = tmp_upstream.name
             with open(tmp_upstream_path, 'w') as f:
-                content = get_original_file_content_with_upstream_branch(repo_path, upstream_branch, rust_file)
+                with span("git.show", category="git", file=rust_file):
+                    content = get_original_file_content_with_upstream_branch(repo_path, upstream_branch, rust_file)
                 if content is None:
                     print(f"Skipping {rust_file}: could not retrieve original content.")
                     continue
                 f.write(content)
-        diff_text = get_git_diff(tmp_upstream_path, file_path)
+        with span("git.diff", category="git", file=rust_file):
+            diff_text = get_git_diff(tmp_upstream_path, file_path)
         if diff_text.strip() == "":
             os.remove(tmp_upstream_path)
             continue
         
         # copy rust_file to temp_file
         rust_file_content = open(file_path).read()
+        exhausted = budget.exhausted()
+        if exhausted:
+            print(f"Skipping {rust_file}: {exhausted} budget exhausted.")
+            result[rust_file] = {"migrated": False, "stop": exhausted}
+            os.remove(tmp_upstream_path)
+            continue
         try:
-            code = rag_guided_code_modification(open(tmp_upstream_path).read(),repo_path, rust_file, vectordb, embedder, llm)
+            with span("migrate.file", file=rust_file):
+                controller = RepairController(repo_path, rust_file, vectordb, llm,
+                                              budget.child("file", **(file_budget or FILE_BUDGET)))
+                outcome = controller.run(open(tmp_upstream_path).read())
+            outcome.pop("code")
+            result[rust_file] = {"migrated": outcome.pop("success"), **outcome}
         except Exception as e:
             print(f"Failed to modify {rust_file}: {e}")
-            os.remove(tmp_upstream_path)
+            result[rust_file] = {"migrated": False, "error": str(e)[:500]}
+        os.remove(tmp_upstream_path)
         # write back to original file
         with open(file_path, 'w') as f:
             f.write(rust_file_content)
             
     return result
 
-def rag_guided_code_modification(rust_code, repo_path, rel_file, vectordb, embedder, llm, depth=0):
-    # generate_code(rust_code, repo_path, rel_file, vectordb, embedder, llm, depth)
-    generate_hunk(rust_code, repo_path, rel_file, vectordb, embedder, llm, depth)
+def rag_guided_code_modification(rust_code, repo_path, rel_file, vectordb, embedder, llm, budget=None):
+    """
+    Repair rust_code until the project builds. Returns the fixed code or raises RuntimeError
+    with the reason the repair stopped (see RepairController for the outcome itself).
+    """
+    outcome = RepairController(repo_path, rel_file, vectordb, llm, budget).run(rust_code)
+    if not outcome["success"]:
+        raise RuntimeError(f"Repair stopped ({outcome['stop']}) with {outcome['best_errors']} errors left")
+    return outcome["code"]
 
-# set recusive call depth limit
-def generate_code(rust_code, repo_path, rel_file, vectordb, embedder, llm, depth=0):
-    if depth > 1:
-        print("Maximum recursion depth reached, stopping further modifications.")
-        raise RuntimeError("Maximum recursion depth reached")
 
-    # write rust_code to rel_file with suffix depth 
-    rel_file_with_depth = f"{rel_file}.mod_depth_{depth}"
-    with open(os.path.join(repo_path, rel_file_with_depth), 'w') as f:
-        f.write(rust_code)
-        
- 
-    # 0. Copy rust_code to rel_file and compile to get errors
-    with open(os.path.join(repo_path, rel_file), 'w') as f:
-        f.write(rust_code)
-    try:
-        xargo_compile_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path))
-        print(f"xargo build success for {rel_file}!")
-        cargo_compile_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path))
-        print(f"cargo build success for {rel_file}!")
-        return rust_code  # Compilation successful, return original code
-    except Exception as e:
-        print(f"build failed for {rel_file}: {e}")
-        # Assume error output is in e.args[0], adjust as needed
-        error_text = str(e)
-
- 
-        # 1. Retrieve relevant knowledge
-        context_docs = []
-        docs = vectordb.similarity_search(error_text, k=4)
-        context_docs.extend(docs)
-        
-        # 2. Build prompt
-        context_text = '\n\n'.join(["[Compilation error]:"+d.page_content + "\n" + "[Code Modification]:"+get_hunk_from_metadata(d.metadata) for d in context_docs])
-       
-        prompt = prompt_code_gen.format(rust_code=rust_code, error_text=error_text, context_text=context_text)
-        # 3. LLM generation
-        try:
-            result = llm(prompt)
-            return rag_guided_code_modification(rust_code=result, repo_path=repo_path, rel_file=rel_file, vectordb=vectordb, embedder=embedder, llm=llm, depth=depth+1)  # Recursive call to verify new code
-        except Exception as e:
-            print(f"LLM failed to generate code modification: {e}")
-            raise RuntimeError("LLM generation failed")
-
-
-# set recusive call depth limit
-def generate_hunk(rust_code, repo_path, rel_file, vectordb, embedder, llm, depth=0):
-   
-    # write rust_code to rel_file with suffix depth 
-    rel_file_with_depth = f"{rel_file}.mod_depth_{depth}"
-    with open(os.path.join(repo_path, rel_file_with_depth), 'w') as f:
-        f.write(rust_code)
-    
-    if depth > 2:
-        print("Maximum recursion depth reached, stopping further modifications.")
-        raise RuntimeError("Maximum recursion depth reached")
-    
- 
-    # 0. Copy rust_code to rel_file and compile to get errors
-    with open(os.path.join(repo_path, rel_file), 'w') as f:
-        f.write(rust_code)
-    try:
-        xargo_compile_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path))
-        print(f"xargo build success for {rel_file}!")
-        cargo_compile_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path))
-        print(f"cargo build success for {rel_file}!")
-        return rust_code  # Compilation successful, return original code
-    except Exception as e:
-        print(f"build failed for {rel_file}: {e}")
-        # Assume error output is in e.args[0], adjust as needed
-        error_text = remove_ansi_colors(str(e))
-
- 
-        # 1. Retrieve relevant knowledge
-        context_docs = []
-        docs = vectordb.similarity_search(error_text, k=1, threshold=0.7)
-        context_docs.extend(docs)
-        
-        # 2. Build prompt
-        # context_text = '\n\n'.join(["[Compilation error]:\n```\n"+d.page_content + "\n```\n" + "[Corresponding Code Modification]:\n```\n"+get_hunk_from_metadata(d.metadata) + "\n```\n" for d in context_docs])
-        assert len(context_docs) >= 1, "No context docs found"
-        context_text = []
-        for index, doc in enumerate(context_docs):
+def _retrieve_references(vectordb, error_text, k):
+    with span("retrieval.similarity_search", category="retrieval", k=k) as retrieval_span:
+        docs = [doc for doc, _ in retrieve(vectordb, error_text, k=k, min_score=REFERENCE_MIN_SCORE)]
+        retrieval_span.set(hits=len(docs))
+    return docs
+
+
+def _slice_for_prompt(rust_code, error_text, rel_file):
+    with span("prompt.slice", category="llm") as slice_span:
+        excerpt = slice_source(rust_code, error_text, rel_file)
+        slice_span.set(file_lines=len(excerpt.lines), kept_lines=excerpt.kept_lines)
+    return excerpt
+
+
+def propose_code_fix(rust_code, error_text, vectordb, llm, budget=None, log=None, rel_file=None):
+    """
+    One repair step that asks the LLM for the modified code around the diagnostics
+    (slicer.py) and splices it back into the file.
+    """
+    # 1. Retrieve relevant knowledge
+    context_docs = _retrieve_references(vectordb, error_text, 4)
+
+    # 2. Build prompt
+    context_text = '\n\n'.join(["[Compilation error]:"+d.page_content + "\n" + "[Code Modification]:"+str(get_hunk_from_metadata(d.metadata)[1]) for d in context_docs])
+
+    excerpt = _slice_for_prompt(rust_code, error_text, rel_file)
+    prompt = prompt_code_gen.format(rust_code=excerpt.text, error_text=error_text, context_text=context_text)
+    # 3. LLM generation
+    result = invoke_llm(llm, prompt, "code_gen", budget)
+    result = result.content if isinstance(result, AIMessage) else str(result)
+    if log is not None:
+        log.append("Used expert knowledge:\n{}\n=== LLM Result ===\nSuggested code:\n{}".format(context_text, result))
+    return excerpt.splice(result)
+
+
+def propose_hunk_fix(rust_code, error_text, vectordb, llm, budget=None, log=None, rel_file=None):
+    """
+    One repair step: retrieve a reference migration for error_text, ask the LLM for
+    hunks against the code around the diagnostics (slicer.py) and apply them to
+    rust_code. Returns the patched code.
+    """
+    # 1. Retrieve relevant knowledge
+    context_docs = _retrieve_references(vectordb, error_text, 1)
+
+    # 2. Build prompt
+    # context_text = '\n\n'.join(["[Compilation error]:\n```\n"+d.page_content + "\n```\n" + "[Corresponding Code Modification]:\n```\n"+get_hunk_from_metadata(d.metadata) + "\n```\n" for d in context_docs])
+    context_text = []
+    if not context_docs:
+        # 没有足够相似的参考迁移时，直接给出编译错误
+        print(f"No reference above score {REFERENCE_MIN_SCORE}, prompting with the compiler errors only.")
+        context_text.append(f"No similar migration in the knowledge base. Compiler errors:\n```\n{HybridRetriever.embedding_text(error_text)}\n```")
+    for index, doc in enumerate(context_docs):
+        with span("retrieval.reference_example", category="retrieval"):
             reference_original_code, git_diff = get_reference_example_from_metadata(doc.metadata)
-            git_diff_summary = llm.invoke(prompt_git_diff_summary.format(git_diff=git_diff))
-            context_text.append(f"Reference#{index}: original Rust code:\n```\n{reference_original_code}\n```\n was migrated into TEE-compatible code by the changes:\n```\n{git_diff_summary}\n```")
-        context_text = '\n\n'.join(context_text)
-       
-        prompt = prompt_hunk_gen.format(rust_code=rust_code, context_text=context_text)
-        # 3. LLM generation
+        git_diff_summary = invoke_llm(llm, prompt_git_diff_summary.format(git_diff=git_diff), "diff_summary", budget)
+        context_text.append(f"Reference#{index}: original Rust code:\n```\n{reference_original_code}\n```\n was migrated into TEE-compatible code by the changes:\n```\n{git_diff_summary}\n```")
+    context_text = '\n\n'.join(context_text)
+
+    # 行号锚点让 hunk 头对应完整文件，补丁仍然打在完整文件上
+    excerpt = _slice_for_prompt(rust_code, error_text, rel_file)
+    prompt = prompt_hunk_gen.format(rust_code=excerpt.text, context_text=context_text)
+    # 3. LLM generation
+    result = invoke_llm(llm, prompt, "hunk_gen", budget)
+    if isinstance(result,str):
+        result = result.replace("```", "").replace("diff", "").replace("git diff", "").strip()
+    elif isinstance(result, AIMessage):
+        result = result.content.replace("```", "").replace("diff", "").replace("git diff", "").strip()
+
+    print(f"LLM returned hunk:\n{result}")
+    hunks = parse_diff_hunks(result)  # Verify it's a valid hunk
+    with span("patch.apply", category="patch", hunks=len(hunks)) as patch_span:
+        patch = apply_hunks(rust_code, hunks)
+        patch_span.set(conflicts=len(patch.conflicts), fuzzy=len(patch.fuzzy))
+    for outcome in patch.outcomes:
+        if outcome.status != APPLIED:
+            print(f"Hunk {outcome.index}: {outcome.status} (expected line {outcome.expected_line}, actual line {outcome.actual_line}, fuzz {outcome.fuzz})")
+    if log is not None:
+        log.append("Used expert knowledge:\n{}\n=== LLM Result ===\nSuggested modification:\n{}".format(context_text, result))
+    return patch.content
+
+
+def _error_count(error_text):
+    return sum(1 for d in parse_diagnostics(error_text) if not d.is_summary) or 1
+
+
+class RepairController:
+    """
+    Iterative build-and-fix loop for one file of a project.
+
+    Every iteration writes the candidate into the repo and builds it. On failure the
+    fix memo is tried first, then one retrieval + LLM proposal (`propose`, default
+    propose_hunk_fix) becomes the next candidate. The loop stops when the build
+    passes or when
+        iterations   max_iterations candidates were built
+        <budget>     the file or project budget has no build, time or tokens left
+        stalled      a candidate fails with the same errors as the previous one
+        no_change    the proposal does not change the code
+        llm_error    the proposal failed
+    The file is left with the best candidate (the fewest errors), which is also saved
+    with the repair log under REPAIR_DIR/<project>/ when that directory's parent exists.
+    """
+
+    def __init__(self, repo_path, rel_file, vectordb, llm, budget=None, max_iterations=MAX_REPAIR_ITERATIONS,
+                 propose=propose_hunk_fix):
+        self.repo_path = repo_path
+        self.rel_file = rel_file
+        self.vectordb = vectordb
+        self.llm = llm
+        self.budget = budget or Budget("project", **PROJECT_BUDGET).child("file", **FILE_BUDGET)
+        self.max_iterations = max_iterations
+        self.propose = propose
+        self.log = []
+
+    def _build(self, rust_code):
+        """
+        Build the project with rust_code in rel_file. Returns None on success, the error text otherwise.
+        """
+        self.budget.check(builds=1)
+        with open(os.path.join(self.repo_path, self.rel_file), 'w') as f:
+            f.write(rust_code)
         try:
-            result = llm.invoke(prompt)
-            if isinstance(result,str):
-                result = result.replace("```", "").replace("diff", "").replace("git diff", "").strip()
-            elif isinstance(result, AIMessage):
-                result = result.content.replace("```", "").replace("diff", "").replace("git diff", "").strip()
-                
-            print(f"LLM returned hunk:\n{result}")
-            hunks = parse_diff_hunks(result)  # Verify it's a valid hunk
-            for hunk in hunks:
-                rust_code = apply_hunk_on_new_file(hunk, rust_code)
-            # save prompt, result, and modified code to a log file
-            with open(os.path.join(repo_path, f"{rel_file}.mod_log.txt"), 'a') as logf:
-                # write timestamp
-                import time
-                logf.write(f"=== Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                logf.write(f"=== Depth {depth} ===\n")
-                logf.write(f"Rust file path: {rel_file_with_depth}\n")
-                
-                logf.write("Used expert knowledge:\n{}\n".format(context_text))
-                logf.write("=== LLM Result ===\n")
-                logf.write("Suggested modification:\n" + result + "\n")
-                logf.write(f"modified Rust file path: {rel_file}.mod_depth_{depth+1}\n")
-             
-            return rag_guided_code_modification(rust_code=rust_code, repo_path=repo_path, rel_file=rel_file, vectordb=vectordb, embedder=embedder, llm=llm, depth=depth+1)  # Recursive call to verify new code
+            # check 通过后才做完整的 xargo/cargo 编译
+            verify_sgx_project(os.path.dirname(self.repo_path), os.path.basename(self.repo_path),
+                               timeout=self.budget.remaining_seconds())
+            return None
+        except BuildTimeout:
+            raise BudgetExhausted(self.budget.exhausted() or "build timeout")
         except Exception as e:
-            print(f"LLM failed to generate code modification: {e}")
-            raise RuntimeError("LLM generation failed")
+            print(f"build failed for {self.rel_file}: {str(e)[:500]}")
+            return remove_ansi_colors(str(e))
+        finally:
+            self.budget.charge(builds=1)
+
+    def run(self, rust_code):
+        """
+        {"success", "code" (the best candidate), "stop", "iterations", "best_errors",
+        "history": [{"iteration", "source", "errors", "fingerprint"}], "budget"}
+        """
+        memo = get_fix_memo()
+        candidate, source = rust_code, "input"
+        best_errors, best_code = None, rust_code
+        previous, history, llm_steps = None, [], []
+        stop = "iterations"
+        with span("repair.file", file=self.rel_file) as repair_span:
+            for iteration in range(self.max_iterations):
+                try:
+                    error_text = self._build(candidate)
+                except BudgetExhausted as e:
+                    stop = e.reason
+                    break
+                if error_text is None:
+                    print(f"xargo and cargo build success for {self.rel_file}!")
+                    history.append({"iteration": iteration, "source": source, "errors": 0, "fingerprint": None})
+                    best_errors, best_code, stop = 0, candidate, "success"
+                    # 最终通过编译的改动记入 fix memo
+                    for failing_error, failing_code in llm_steps:
+                        memo.learn(failing_error, self.rel_file, failing_code, candidate)
+                    break
+                errors = _error_count(error_text)
+                key = fingerprint(error_text) or normalize_message(error_text)
+                history.append({"iteration": iteration, "source": source, "errors": errors, "fingerprint": key})
+                self.log.append(f"=== Iteration {iteration} ({source}): {errors} errors ===")
+                if best_errors is None or errors < best_errors:
+                    best_errors, best_code = errors, candidate
+                if key == previous:
+                    stop = "stalled"
+                    break
+                previous = key
+                if iteration + 1 == self.max_iterations:
+                    break
+
+                # 已知的错误先试 fix memo 中的补丁，不做检索和 LLM 调用
+                try:
+                    fixed_code = try_memo_fix(memo, error_text, candidate, self.repo_path, self.rel_file, self.budget)
+                except BudgetExhausted as e:
+                    stop = e.reason
+                    break
+                if fixed_code is not None:
+                    history.append({"iteration": iteration, "source": "memo", "errors": 0, "fingerprint": None})
+                    best_errors, best_code, stop = 0, fixed_code, "success"
+                    break
+
+                llm_start = time.perf_counter()
+                try:
+                    proposal = self.propose(candidate, error_text, self.vectordb, self.llm, self.budget, self.log,
+                                            rel_file=self.rel_file)
+                except BudgetExhausted as e:
+                    stop = e.reason
+                    break
+                except Exception as e:
+                    print(f"LLM failed to generate code modification: {e}")
+                    stop = "llm_error"
+                    break
+                memo.record_llm_path(time.perf_counter() - llm_start)
+                if proposal == candidate:
+                    stop = "no_change"
+                    break
+                llm_steps.append((error_text, candidate))
+                candidate, source = proposal, "llm"
+            repair_span.set(stop=stop, iterations=len(history), best_errors=best_errors)
+
+        if stop != "success" or candidate != best_code:
+            with open(os.path.join(self.repo_path, self.rel_file), 'w') as f:
+                f.write(best_code)
+        print(f"Repair of {self.rel_file} stopped: {stop} (best: {best_errors} errors)")
+        self._save(best_code, stop)
+        return {"success": stop == "success", "code": best_code, "stop": stop, "iterations": len(history),
+                "best_errors": best_errors, "history": history, "budget": self.budget.to_dict()}
+
+    def _save(self, best_code, stop):
+        if not os.path.isdir(os.path.dirname(os.path.abspath(REPAIR_DIR))):
+            return
+        path = os.path.join(REPAIR_DIR, os.path.basename(self.repo_path), self.rel_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(best_code)
+        with open(path + ".log.txt", 'a') as logf:
+            logf.write(f"=== Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+            logf.write("\n".join(self.log) + f"\n=== Stopped: {stop} ===\n")
 
 
-def migrate_project_to_tee(project_path, vectordb_path):
+# generate_hunk 保留原来的调用方式
+generate_hunk = rag_guided_code_modification
+
+
+def try_memo_fix(memo, error_text, rust_code, repo_path, rel_file, budget=None):
+    """
+    Apply the memoized fix for error_text and verify the build. Returns the fixed code,
+    or None when no fix applies or the build still fails (the files are restored).
+    With a budget every verification is charged as a build (BudgetExhausted when none is left).
+    """
+    with span("fix_memo.lookup", category="memo") as memo_span:
+        key, fixes = memo.lookup(error_text, rel_file)
+        memo_span.set(fingerprint=key, candidates=len(fixes))
+    for fix in fixes:
+        patched, undo = apply_fix(fix, rust_code, repo_path)
+        if patched is None:
+            continue
+        if budget:
+            try:
+                budget.check(builds=1)
+            except BudgetExhausted:
+                undo()
+                raise
+        print(f"Trying the memoized {fix['kind']} fix for fingerprint {key}")
+        with open(os.path.join(repo_path, rel_file), 'w') as f:
+            f.write(patched)
+        with span("fix_memo.verify", category="memo", kind=fix["kind"], source=fix.get("source")) as verify_span:
+            try:
+                if budget:
+                    verify_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path),
+                                       timeout=budget.remaining_seconds())
+                else:
+                    verify_sgx_project(os.path.dirname(repo_path), os.path.basename(repo_path))
+            except Exception as e:
+                print(f"Memoized fix did not fix the build: {str(e)[:200]}")
+                undo()
+                with open(os.path.join(repo_path, rel_file), 'w') as f:
+                    f.write(rust_code)
+                if isinstance(e, BuildTimeout):
+                    raise BudgetExhausted(budget.exhausted() or "build timeout")
+                memo.record(fix, False)
+                verify_span.set(success=False)
+                return None
+            finally:
+                if budget:
+                    budget.charge(builds=1)
+            verify_span.set(success=True)
+        memo.record(fix, True)
+        print(f"xargo and cargo build success for {rel_file} with the memoized fix!")
+        return patched
+    return None
+
+
+def load_shared_state(vectordb_path):
+    """
+    Load the state shared by every project of a run: (vectordb, embedder, llm).
+    """
+    with span("vectordb.load", category="retrieval"):
+        embedder = OllamaEmbeddings(model="nomic-embed-text", base_url="http://localhost:11434")
+        vectordb = load_retriever(vectordb_path, embedder)
+    # llm = Ollama(model="qwen2.5:32b", base_url="http://localhost:11434")
+    llm = qwen3coder_30b
+    return vectordb, embedder, llm
+
+
+def migrate_project(project_path, vectordb, embedder, llm, budget=None, file_budget=None):
+    """
+    Migrate one project with already loaded shared state. All git and build commands
+    run with the project (or its work dir) as cwd, so several projects can run in one
+    process; the docker containers must be up (see BuildSession).
+    :param budget: the project's Budget (default PROJECT_BUDGET), file_budget the limits of each file
+    """
+    # git reset --hard to discard any local changes
+    with span("git.reset", category="git"):
+        subprocess.run("git reset --hard", shell=True, cwd=project_path)
+    with span("migrate.project", project=os.path.basename(project_path)):
+        return analyze_forked_repo(project_path, vectordb, embedder, llm, budget, file_budget)
+
+
+def migrate_project_to_tee(project_path, vectordb_path, trace_dir=None):
         """
         Iteratively compile and fix a Rust library for TEE compatibility using RAG and LLM, until no compiler errors remain.
+        If trace_dir is given, stage spans are exported there as trace.jsonl and trace.chrome.json.
+        For several projects use src.migration.batch, which loads the shared state once.
         """
-        # docker-sgx-xargo-create
-        subprocess.run(f"bash -i -c 'docker-sgx-xargo-create {os.path.basename(os.path.dirname(project_path))}'", shell=True)
-        # docker-sgx-cargo-create
-        subprocess.run(f"bash -i -c 'docker-sgx-cargo-create {os.path.basename(os.path.dirname(project_path))}'", shell=True)
-    
-        # change directory to project_path 
-        os.chdir(project_path)
-        # git reset --hard to discard any local changes
-        subprocess.run("git reset --hard", shell=True, cwd=project_path)
-        
-        # Load vector DB and LLM
-        embedder = OllamaEmbeddings(model="nomic-embed-text", base_url="http://localhost:11434")
-        vectordb = FAISS.load_local(vectordb_path, embedder, allow_dangerous_deserialization=True)
-        # llm = Ollama(model="qwen2.5:32b", base_url="http://localhost:11434")
-        llm =  qwen3coder_30b
-        analyze_forked_repo(project_path, vectordb, embedder, llm)
-        
-        #docker-sgx-xargo-destroy
-        subprocess.run("bash -i -c 'docker-sgx-xargo-destroy'", shell=True)
-        #docker-sgx-cargo-destroy
-        subprocess.run("bash -i -c 'docker-sgx-cargo-destroy'", shell=True)
+        if trace_dir:
+            get_tracer().configure(enabled=True, output_dir=trace_dir)
+        vectordb, embedder, llm = load_shared_state(vectordb_path)
+        with BuildSession(project_path):
+            result = migrate_project(project_path, vectordb, embedder, llm)
+        if trace_dir:
+            get_tracer().export()
+        return result
 
 	
 # Example usage
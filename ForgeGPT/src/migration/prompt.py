@@ -16,6 +16,7 @@ prompt_hunk_gen = PromptTemplate(template = """
     Related knowledge:
     {context_text}
 
+    If the code is an excerpt, each `// @@ lines a-b @@` marker gives the line numbers of the following block in the original file: use those line numbers in the hunk headers and never include the markers in the hunks.
     Please generate only the change hunks in the hunk form of `git diff` format, which can be directly applied to the original code using the `git apply` command. In the git diff output, apart from change hunk header information, MUST use "+" for addition while use "-" for removal.
     """)
     
@@ -33,6 +34,7 @@ prompt_code_gen = PromptTemplate(template = """
     {context_text}
 
     Please output the complete modified code directly.
+    If the code is an excerpt with `// @@ lines a-b @@` markers, output the modified excerpt instead: keep every marker unchanged on its own line, put each block's modified code after its marker, and leave out the omitted lines. Before the first marker only new `use`, `extern crate`, `mod x;` or `#![...]` lines are allowed, no other text.
     Please provide only the modified complete code without any explanations.
     """)
 
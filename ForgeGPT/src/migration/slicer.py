@@ -0,0 +1,210 @@
+"""
+Slices of a Rust file around the compiler's diagnostic spans, for the repair prompts.
+
+Instead of the whole file, a prompt gets the items enclosing the lines the errors
+point at (an impl, trait or inline mod longer than NARROW_LINES is cut down to its
+header, the inner items on the spans and its closing brace), the crate-level items
+(`#![...]`, `extern crate`, `mod x;`) and the `use` declarations whose names appear
+in the kept code or the errors. Every kept block starts with a `// @@ lines a-b @@`
+anchor holding its lines in the full file, so hunk headers written against the
+excerpt use the file's line numbers, and a modified excerpt is spliced back with
+SourceSlice.splice. Files under SLICE_MIN_LINES lines, errors without a span in the
+file and slices that keep most of the file are sent whole.
+
+    excerpt = slice_source(rust_code, error_text, "src/lib.rs")
+    prompt = prompt_code_gen.format(rust_code=excerpt.text, ...)
+    new_code = excerpt.splice(llm_output)
+"""
+import re
+
+from src.compilation.diagnostics import parse_diagnostics
+from src.diff.rust_items import inner_items, items_in_range, prelude_end, top_level_items
+
+SLICE_MIN_LINES = 150
+NARROW_LINES = 60
+FULL_RATIO = 0.8  # 保留超过这个比例时直接发整个文件
+SPAN_CONTEXT = 2  # lines around a span that falls outside every item
+
+_ANCHOR_RE = re.compile(r'^\s*// @@ lines (\d+)-(\d+) @@\s*$')
+_OMITTED_RE = re.compile(r'^\s*// \.\.\. \d+ lines omitted \.\.\.\s*$')
+_HEADER = "// Excerpt: each `// @@ lines a-b @@` block holds lines a-b of {file}; omitted lines are marked."
+_GUTTER_RE = re.compile(r'^\s*(\d+)\s*\|')
+_OTHER_FILE_RE = re.compile(r'^\s*(?:-->|:::) (.+?):\d+:\d+\s*$')
+_CONTAINER_KINDS = {"impl_item", "trait_item", "mod_item"}
+_WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# `use` 引入的名字：路径的最后一段或 `as` 的别名
+_USE_LEAF_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_]*)\s*(?=[,;}])')
+# 第一个锚点之前只接受这些 crate 级条目，其它文字（"Here is the fixed code:"）不是代码
+_PREFIX_ITEM_RE = re.compile(r'^\s*(?:#!?\[|(?:pub(?:\([^)]*\))?\s+)?(?:use\s|extern\s+crate\s|mod\s+\w+\s*;))')
+
+
+def span_lines(error_text, rel_file=None):
+    """
+    Lines of rel_file (any file when None) that the errors point at: each primary
+    `-->` span and the numbered source lines quoted under it.
+    """
+    lines = set()
+    for diagnostic in parse_diagnostics(error_text):
+        if diagnostic.file is None or (rel_file and not diagnostic.in_file(rel_file)):
+            continue
+        lines.add(diagnostic.line)
+        in_file = True
+        for line in diagnostic.text.splitlines():
+            other = _OTHER_FILE_RE.match(line)
+            if other:
+                path = other.group(1).replace('\\', '/')
+                in_file = path == diagnostic.file.replace('\\', '/')
+                continue
+            gutter = _GUTTER_RE.match(line)
+            if gutter and in_file:
+                lines.add(int(gutter.group(1)))
+    return sorted(lines)
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def _use_names(text):
+    return set(_USE_LEAF_RE.findall(text)) - {"self"}
+
+
+class SourceSlice:
+    """
+    The blocks `ranges` (1-based, inclusive, sorted) of source, or the whole file when ranges is None.
+    """
+
+    def __init__(self, source, ranges=None, rel_file="the file"):
+        self.source = source
+        self.lines = source.splitlines()
+        self.ranges = ranges
+        self.rel_file = rel_file
+
+    @property
+    def full(self):
+        return self.ranges is None
+
+    @property
+    def kept_lines(self):
+        return len(self.lines) if self.full else sum(end - start + 1 for start, end in self.ranges)
+
+    @property
+    def text(self):
+        if self.full:
+            return self.source
+        out = [_HEADER.format(file=self.rel_file)]
+        previous_end = 0
+        for start, end in self.ranges:
+            if start > previous_end + 1:
+                out.append(f"// ... {start - previous_end - 1} lines omitted ...")
+            out.append(f"// @@ lines {start}-{end} @@")
+            out.extend(self.lines[start - 1:end])
+            previous_end = end
+        if previous_end < len(self.lines):
+            out.append(f"// ... {len(self.lines) - previous_end} lines omitted ...")
+        return "\n".join(out)
+
+    def splice(self, response):
+        """
+        The full file with each anchored block of response (a modified excerpt) in
+        place of the lines it came from. Crate-level items before the first anchor
+        (`use`, `#![...]`, `#[...]`, `extern crate`, `mod x;`) are inserted after the
+        file's leading inner attributes and `//!` docs, new `#![...]` lines at the end
+        of that block and the others below it. Raises ValueError when the anchors do not match or other text
+        comes before the first anchor.
+        """
+        if self.full:
+            return response
+        attributes, prefix, blocks, current = [], [], {}, None
+        in_prefix_item = False  # 多行的 `use a::{...};`
+        for line in response.strip().strip('`').splitlines():
+            anchor = _ANCHOR_RE.match(line)
+            if anchor:
+                current = (int(anchor.group(1)), int(anchor.group(2)))
+                if current not in self.ranges or current in blocks:
+                    raise ValueError(f"unexpected anchor lines {current[0]}-{current[1]}")
+                blocks[current] = []
+            elif _OMITTED_RE.match(line) or line.startswith("// Excerpt: "):
+                current = None
+            elif current is not None:
+                blocks[current].append(line)
+            elif line.strip() in ("", "rust"):
+                continue
+            elif in_prefix_item or _PREFIX_ITEM_RE.match(line):
+                stripped = line.strip()
+                if not in_prefix_item and stripped.startswith("#!["):
+                    attributes.append(line)
+                    continue
+                prefix.append(line)
+                in_prefix_item = not stripped.startswith("#") and not stripped.endswith(";")
+            else:
+                raise ValueError(f"text before the first line anchor is not a crate-level item: {line.strip()[:80]}")
+        if not blocks:
+            raise ValueError("the response has no line anchors")
+        lines = list(self.lines)
+        # 从后往前替换，前面块的行号不受影响
+        for (start, end), block in sorted(blocks.items(), reverse=True):
+            lines[start - 1:end] = block
+        # 内部属性必须在文件的所有条目之前；已有的不再重复插入
+        code = "\n".join(lines)
+        insert_at = prelude_end(code)
+        existing = {line.strip() for line in lines[:insert_at]}
+        attributes = [line for line in attributes if line.strip() not in existing]
+        code = "\n".join(lines[:insert_at] + attributes + prefix + lines[insert_at:])
+        return code + "\n" if self.source.endswith("\n") else code
+
+
+def slice_source(source, error_text, rel_file=None):
+    """
+    The SourceSlice of source to show with error_text (see the module docstring).
+    """
+    lines = source.splitlines()
+    targets = [line for line in span_lines(error_text, rel_file) if 1 <= line <= len(lines)]
+    if len(lines) < SLICE_MIN_LINES or not targets:
+        return SourceSlice(source, rel_file=rel_file or "the file")
+
+    items = top_level_items(source)
+    ranges = []
+    for line in targets:
+        indices = items_in_range(items, line, line)
+        if not indices:
+            ranges.append((max(1, line - SPAN_CONTEXT), min(len(lines), line + SPAN_CONTEXT)))
+            continue
+        item = items[indices[0]]
+        if item.kind in _CONTAINER_KINDS and item.end_line - item.start_line + 1 > NARROW_LINES:
+            inner, header_end = inner_items(source, item)
+            if header_end is not None:
+                ranges.append((item.start_line, header_end))
+                ranges.append((item.end_line, item.end_line))
+                inner_indices = items_in_range(inner, line, line)
+                if inner_indices:
+                    ranges.append((inner[inner_indices[0]].start_line, inner[inner_indices[0]].end_line))
+                else:
+                    ranges.append((max(item.start_line, line - SPAN_CONTEXT), min(item.end_line, line + SPAN_CONTEXT)))
+                continue
+        ranges.append((item.start_line, item.end_line))
+
+    for item in items:
+        if item.kind == "use_declaration" or not item.crate_level:
+            continue  # `use` 只保留用到的，见下
+        if item.kind != "mod_item" or item.start_line == item.end_line:
+            ranges.append((item.start_line, item.end_line))
+    kept_text = "\n".join("\n".join(lines[start - 1:end]) for start, end in ranges) + "\n" + error_text
+    kept_words = set(_WORD_RE.findall(kept_text))
+    for item in items:
+        if item.kind != "use_declaration":
+            continue
+        use_text = "\n".join(lines[item.start_line - 1:item.end_line])
+        if "*" in use_text or _use_names(use_text) & kept_words:
+            ranges.append((item.start_line, item.end_line))
+
+    ranges = _merge(ranges)
+    if sum(end - start + 1 for start, end in ranges) >= FULL_RATIO * len(lines):
+        return SourceSlice(source, rel_file=rel_file or "the file")
+    return SourceSlice(source, ranges, rel_file or "the file")
@@ -0,0 +1,321 @@
+"""
+Cargo manifest model and a bulk index over every Cargo.toml under forked_repo.
+
+CargoManifest parses a Cargo.toml with tomllib, so inline tables, renamed packages,
+`[target.'cfg(...)'.dependencies]`, `[patch.<source>]` and `[replace]` are all seen.
+ManifestIndex walks forked_repo once, keeps the parsed manifests in a JSON file
+(changes/.forge/manifest_index.json, created when changes/ exists) and re-parses
+only the files whose mtime or size changed; queries run on in-memory maps.
+
+    index = get_manifest_index("/workspaces/TEE-Forge-It/forked_repo")
+    index.pins("sgx_tstd")          # which manifests pin sgx_tstd at which git rev/tag/branch
+    index.enabling_feature("std")   # which dependencies are built with their `std` feature
+"""
+import json
+import os
+import threading
+import tomllib
+
+FORKED_REPO = "/workspaces/TEE-Forge-It/forked_repo"
+INDEX_PATH = os.getenv("FORGE_MANIFEST_INDEX", "/workspaces/TEE-Forge-It/changes/.forge/manifest_index.json")
+SKIP_DIRS = {"target", ".git", "node_modules"}
+DEPENDENCY_SECTIONS = {"dependencies": "normal", "build-dependencies": "build", "dev-dependencies": "dev"}
+_SOURCE_KEYS = ("version", "git", "rev", "tag", "branch", "path", "registry")
+
+
+class Dependency:
+    """
+    One dependency entry. kind is normal/build/dev, or patch/replace for the
+    `[patch.<source>]` and `[replace]` tables; target is the `[target.<cfg>]` key.
+    """
+    __slots__ = ('name', 'package', 'kind', 'target', 'version', 'git', 'rev', 'tag', 'branch', 'path',
+                 'registry', 'features', 'default_features', 'optional', 'workspace', 'patch_source')
+
+    def __init__(self, name, package=None, kind="normal", target=None, version=None, git=None, rev=None,
+                 tag=None, branch=None, path=None, registry=None, features=(), default_features=True,
+                 optional=False, workspace=False, patch_source=None):
+        self.name = name
+        self.package = package or name
+        self.kind = kind
+        self.target = target
+        self.version = version
+        self.git = git
+        self.rev = rev
+        self.tag = tag
+        self.branch = branch
+        self.path = path
+        self.registry = registry
+        self.features = list(features)
+        self.default_features = default_features
+        self.optional = optional
+        self.workspace = workspace
+        self.patch_source = patch_source
+
+    @classmethod
+    def from_spec(cls, name, spec, kind="normal", target=None, patch_source=None):
+        if isinstance(spec, str):
+            spec = {"version": spec}
+        return cls(
+            name, spec.get("package"), kind, target,
+            features=spec.get("features", ()),
+            # 两种写法都合法
+            default_features=spec.get("default-features", spec.get("default_features", True)),
+            optional=spec.get("optional", False), workspace=spec.get("workspace", False),
+            patch_source=patch_source, **{k: spec.get(k) for k in _SOURCE_KEYS},
+        )
+
+    @property
+    def pin(self):
+        """
+        The git rev/tag/branch, or the version requirement, this entry resolves to.
+        """
+        return self.rev or self.tag or self.branch or self.version
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __str__(self):
+        source = self.path and f"path={self.path}" or self.git and f"git={self.git} {self.pin or ''}".rstrip() or self.version
+        text = f"{self.name} = {source or '*'} [{self.kind}]"
+        if self.package != self.name:
+            text += f" (package {self.package})"
+        if self.target:
+            text += f" (target {self.target})"
+        if self.features:
+            text += f" features={','.join(self.features)}"
+        if not self.default_features:
+            text += " no-default-features"
+        if self.optional:
+            text += " optional"
+        return text
+
+
+class CargoManifest:
+    def __init__(self, path, name=None, version=None, features=None, dependencies=None, members=()):
+        self.path = path
+        self.name = name
+        self.version = version
+        self.features = features or {}  # the crate's own [features] table
+        self.dependencies = dependencies or []
+        self.members = list(members)  # [workspace] members
+
+    @classmethod
+    def parse(cls, path, text):
+        data = tomllib.loads(text)
+        dependencies = []
+        tables = [(None, data)] + list(data.get("target", {}).items())
+        for target, table in tables:
+            for section, kind in DEPENDENCY_SECTIONS.items():
+                for name, spec in table.get(section, {}).items():
+                    dependencies.append(Dependency.from_spec(name, spec, kind, target))
+        for source, table in data.get("patch", {}).items():
+            for name, spec in table.items():
+                dependencies.append(Dependency.from_spec(name, spec, "patch", patch_source=source))
+        for name, spec in data.get("replace", {}).items():
+            # [replace] 的键是 "name:version"
+            dependencies.append(Dependency.from_spec(name.split(":")[0], spec, "replace"))
+        package = data.get("package", {})
+        version = package.get("version")
+        return cls(path, package.get("name"), version if isinstance(version, str) else None,
+                   data.get("features", {}), dependencies, data.get("workspace", {}).get("members", ()))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.parse(path, f.read())
+
+    def dependencies_of(self, kind=None):
+        return [d for d in self.dependencies if kind is None or d.kind == kind]
+
+    def to_dict(self):
+        return {"path": self.path, "name": self.name, "version": self.version, "features": self.features,
+                "dependencies": [d.to_dict() for d in self.dependencies], "members": self.members}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["path"], data["name"], data["version"], data["features"],
+                   [Dependency.from_dict(d) for d in data["dependencies"]], data["members"])
+
+    def __repr__(self):
+        return f"<CargoManifest {self.name} {self.path} deps={len(self.dependencies)}>"
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# 单个文件的解析缓存，mtime/size 不变时直接复用
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+
+def load_manifest(path):
+    """
+    Parsed CargoManifest of path, re-parsed only when the file changed.
+    """
+    key = _stat_key(path)
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+    manifest = CargoManifest.from_file(path)
+    with _file_cache_lock:
+        _file_cache[path] = (key, manifest)
+    return manifest
+
+
+class ManifestIndex:
+    """
+    Every Cargo.toml under root, with {dependency package: [(manifest, Dependency)]} for queries.
+    """
+
+    def __init__(self, root=FORKED_REPO, path=INDEX_PATH):
+        self.root = root
+        self.path = path
+        self.manifests = {}  # Cargo.toml path -> CargoManifest
+        self._stats = {}  # Cargo.toml path -> [mtime_ns, size]
+        self._by_package = {}
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get("root") == root:
+                for entry in data["manifests"]:
+                    self.manifests[entry["manifest"]["path"]] = CargoManifest.from_dict(entry["manifest"])
+                    self._stats[entry["manifest"]["path"]] = entry["stat"]
+
+    def _scan(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
+            if "Cargo.toml" in filenames:
+                yield os.path.join(dirpath, "Cargo.toml")
+
+    def refresh(self):
+        """
+        Walk root and re-parse new or changed manifests. Returns the number parsed.
+        """
+        parsed = 0
+        with self._lock:
+            seen = set()
+            for path in self._scan():
+                seen.add(path)
+                stat = _stat_key(path)
+                if self._stats.get(path) == stat:
+                    continue
+                try:
+                    self.manifests[path] = CargoManifest.from_file(path)
+                except (tomllib.TOMLDecodeError, UnicodeDecodeError) as e:
+                    print(f"Cannot parse {path}: {e}")
+                    self.manifests.pop(path, None)
+                self._stats[path] = stat
+                parsed += 1
+            removed = set(self._stats) - seen
+            for path in removed:
+                del self._stats[path]
+                self.manifests.pop(path, None)
+            self._by_package = {}
+            for manifest in self.manifests.values():
+                for dependency in manifest.dependencies:
+                    self._by_package.setdefault(dependency.package, []).append((manifest, dependency))
+            if parsed or removed:
+                self._save()
+        return parsed
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(os.path.dirname(directory)):
+            return
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"root": self.root, "manifests": [
+                {"stat": self._stats[p], "manifest": m.to_dict()} for p, m in self.manifests.items()
+            ]}, f)
+        os.replace(tmp_path, self.path)
+
+    def dependents(self, package, kind=None):
+        """
+        [(manifest, Dependency)] of every manifest that depends on package.
+        """
+        return [(m, d) for m, d in self._by_package.get(package, []) if kind is None or d.kind == kind]
+
+    def pins(self, package):
+        """
+        {manifest path: [(kind, git, pin)]} of every entry for package, e.g. pins("sgx_tstd").
+        """
+        result = {}
+        for manifest, dependency in self._by_package.get(package, []):
+            result.setdefault(manifest.path, []).append((dependency.kind, dependency.git, dependency.pin))
+        return result
+
+    def enabling_feature(self, feature):
+        """
+        [(manifest, Dependency)] of the dependencies built with `feature`: listed in
+        their features, or switched on through the crate's [features] table
+        ("dep/feature" or "dep?/feature").
+        """
+        found = []
+        for manifest in self.manifests.values():
+            forwarded = {
+                item.split("/")[0].rstrip("?")
+                for items in manifest.features.values() for item in items
+                if isinstance(item, str) and item.endswith("/" + feature)
+            }
+            for dependency in manifest.dependencies:
+                if feature in dependency.features or dependency.name in forwarded:
+                    found.append((manifest, dependency))
+        return found
+
+    def with_default_features(self, package):
+        """
+        Manifests that depend on package without `default-features = false`.
+        """
+        return [m for m, d in self._by_package.get(package, []) if d.default_features]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_manifest_index(root=FORKED_REPO):
+    """
+    The process-wide ManifestIndex of root, refreshed on first use.
+    """
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = ManifestIndex(root, INDEX_PATH if root == FORKED_REPO else None)
+            _indexes[root].refresh()
+        return _indexes[root]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Query the Cargo manifests under forked_repo.")
+    parser.add_argument("--forked-repo", default=FORKED_REPO)
+    parser.add_argument("--pins", metavar="PACKAGE", help="where and at which revision PACKAGE is pinned")
+    parser.add_argument("--dependents", metavar="PACKAGE", help="manifests depending on PACKAGE")
+    parser.add_argument("--feature", metavar="FEATURE", help="dependencies built with FEATURE (e.g. std)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = get_manifest_index(args.forked_repo)
+    print(f"{len(index.manifests)} manifests indexed in {(time.perf_counter() - start) * 1000:.1f} ms")
+    start = time.perf_counter()
+    if args.pins:
+        for path, pins in sorted(index.pins(args.pins).items()):
+            print(f"{path}: " + "; ".join(f"{kind} {git or ''} {pin}" for kind, git, pin in pins))
+    if args.dependents:
+        for manifest, dependency in index.dependents(args.dependents):
+            print(f"{manifest.path}: {dependency}")
+    if args.feature:
+        for manifest, dependency in index.enabling_feature(args.feature):
+            print(f"{manifest.path}: {dependency}")
+    print(f"query took {(time.perf_counter() - start) * 1000:.2f} ms")
@@ -4,6 +4,9 @@ from langchain.tools import BaseTool
 from typing import Optional, Type
 import os
 import shutil
+from src.tool.manifest import load_manifest
+from src.tool.snapshot import SnapshotStore
+from src.compilation.compile import container_env, helper_command
 
 class ProjectToolKit(BaseTool):
     name = "ProjectTool"
@@ -55,34 +58,24 @@ class ProjectToolKit(BaseTool):
             return "\n".join(files)
 
         elif command == "reset_project":
-            # Assuming we have a backup of the initial state at project_path_backup
-            backup_path = self.project_path + "_backup"
-            if os.path.exists(backup_path):
-                if os.path.exists(self.project_path):
-                    shutil.rmtree(self.project_path)
-                shutil.copytree(backup_path, self.project_path)
-                return "Project has been reset to its initial state."
-            else:
-                return "Error: Backup of the initial state does not exist." 
+            # 从快照恢复，只改写被修改过的文件；第一次 reset 时把 <project>_backup 导入快照
+            store = SnapshotStore(self.project_path + "_snapshots")
+            if not store.exists("initial"):
+                backup_path = self.project_path + "_backup"
+                if not os.path.exists(backup_path):
+                    return "Error: Backup of the initial state does not exist."
+                store.take(backup_path, "initial")
+            os.makedirs(self.project_path, exist_ok=True)
+            changes = store.restore(self.project_path, "initial")
+            return (f"Project has been reset to its initial state ({len(changes['modified'])} modified, "
+                    f"{len(changes['added'])} added and {len(changes['deleted'])} deleted files restored).")
         elif command == "get_dependencies":
             cargo_toml_path = os.path.join(self.project_path, "Cargo.toml")
             if not os.path.exists(cargo_toml_path):
                 return "Error: Cargo.toml does not exist in the project root."
-            with open(cargo_toml_path, 'r') as f:
-                content = f.read()
-            # Simple parsing to extract dependencies (this can be improved with a proper TOML parser)
-            dependencies = []
-            in_dependencies_section = False
-            for line in content.splitlines():
-                line = line.strip()
-                if line == "[dependencies]":
-                    in_dependencies_section = True
-                    continue
-                if line.startswith("[") and line.endswith("]"):
-                    in_dependencies_section = False
-                if in_dependencies_section and line and not line.startswith("#"):
-                    dependencies.append(line)
-            return "\n".join(dependencies)
+            # 按 mtime 缓存解析结果，包括 inline table、[target.*] 和 [patch] 中的依赖
+            manifest = load_manifest(cargo_toml_path)
+            return "\n".join(str(dep) for dep in manifest.dependencies)
         else:
             return f"Error: Unknown command {command}."
 
@@ -94,10 +87,13 @@ class Project(object):
         
     def setup_docker_environment(self) -> str:
         # This method can be expanded to set up a Docker environment if needed.
+        work_dir = os.path.dirname(os.path.abspath(self.project_path))
         # docker-sgx-xargo-create
-        subprocess.run(f"bash -i -c 'docker-sgx-xargo-create {os.path.basename(os.path.dirname(self.project_path))}'", shell=True)
+        subprocess.run(helper_command("docker-sgx-xargo-create", os.path.basename(work_dir)), shell=True,
+                       env=container_env(work_dir))
         # docker-sgx-cargo-create
-        subprocess.run(f"bash -i -c 'docker-sgx-cargo-create {os.path.basename(os.path.dirname(self.project_path))}'", shell=True)
+        subprocess.run(helper_command("docker-sgx-cargo-create", os.path.basename(work_dir)), shell=True,
+                       env=container_env(work_dir))
     
         # change directory to project_path 
         os.chdir(self.project_path)
@@ -114,6 +110,22 @@ class Project(object):
     def reset_project(self) -> str:
         return self.tool.run(command="reset_project")
 
+    @property
+    def snapshots(self) -> SnapshotStore:
+        return SnapshotStore(self.project_path + "_snapshots")
+
+    def take_snapshot(self, name: str = "initial") -> int:
+        """Snapshot the project (without target/); returns the number of files."""
+        return self.snapshots.take(self.project_path, name)
+
+    def restore_snapshot(self, name: str = "initial") -> dict:
+        """Restore only the files that differ from the snapshot; returns what was undone."""
+        return self.snapshots.restore(self.project_path, name)
+
+    def diff_snapshot(self, name: str = "initial") -> dict:
+        """{"modified", "added", "deleted"} relative to the snapshot."""
+        return self.snapshots.diff(self.project_path, name)
+
     def get_dependencies(self) -> str:
         return self.tool.run(command="get_dependencies")
     
@@ -0,0 +1,185 @@
+"""
+Content-addressed snapshots of a project tree.
+
+A snapshot is a manifest {rel_path: [sha1, mode, size, mtime_ns]} plus the file
+contents in a shared object store, so identical files are stored once across
+snapshots. Objects are reflinked (FICLONE) when the filesystem supports it and
+copied otherwise. Hard links are never used for working files: the pipeline writes
+files in place, which would modify the stored object too.
+
+Taking and restoring compare the tree with the manifest by (size, mtime) first and
+hash only the files whose stat changed, so a restore reads and writes only the
+edited files. `target/` directories are not part of a snapshot.
+
+    store = SnapshotStore(project_path + "_snapshots")
+    store.take(project_path, "initial")
+    store.diff(project_path, "initial")     # {"modified": [...], "added": [...], "deleted": [...]}
+    store.restore(project_path, "initial")
+"""
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+
+SKIP_DIRS = {"target"}
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotStore:
+    """
+    <path>/objects/<sha1[:2]>/<sha1[2:]>, <path>/snapshots/<name>.json and
+    <path>/stat_cache.json (the hash of every working file last seen, by path, size and mtime).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_dir = os.path.join(path, "objects")
+        self.snapshots_dir = os.path.join(path, "snapshots")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self._stat_cache_path = os.path.join(path, "stat_cache.json")
+        self._stat_cache = {}
+        if os.path.isfile(self._stat_cache_path):
+            with open(self._stat_cache_path, 'r') as f:
+                self._stat_cache = json.load(f)
+        self._reflink = True  # 第一次失败后不再尝试
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _clone(self, src, dst):
+        """
+        Reflink src to dst when possible, copy otherwise.
+        """
+        if self._reflink:
+            try:
+                with open(src, 'rb') as s, open(dst, 'wb') as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                    raise
+                self._reflink = False
+        shutil.copyfile(src, dst)
+
+    def _scan(self, root):
+        """
+        {rel_path: os.stat_result} of the files and symlinks under root, skipping SKIP_DIRS.
+        """
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                full = os.path.join(dirpath, name)
+                files[os.path.relpath(full, root)] = os.lstat(full)
+        return files
+
+    def _digest(self, full_path, st):
+        if stat.S_ISLNK(st.st_mode):
+            return "link:" + os.readlink(full_path)
+        cached = self._stat_cache.get(full_path)
+        if cached and cached[1] == st.st_size and cached[2] == st.st_mtime_ns:
+            return cached[0]
+        digest = _file_sha1(full_path)
+        self._stat_cache[full_path] = [digest, st.st_size, st.st_mtime_ns]
+        return digest
+
+    def _save_stat_cache(self):
+        tmp_path = self._stat_cache_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._stat_cache, f)
+        os.replace(tmp_path, self._stat_cache_path)
+
+    def names(self):
+        return sorted(n[:-len(".json")] for n in os.listdir(self.snapshots_dir) if n.endswith(".json"))
+
+    def exists(self, name):
+        return os.path.isfile(os.path.join(self.snapshots_dir, f"{name}.json"))
+
+    def load(self, name):
+        with open(os.path.join(self.snapshots_dir, f"{name}.json"), 'r') as f:
+            return json.load(f)
+
+    def take(self, root, name):
+        """
+        Snapshot the tree at root as `name`. Only new contents are written to the store.
+        Returns the number of files in the snapshot.
+        """
+        files = {}
+        for rel_path, st in self._scan(root).items():
+            full = os.path.join(root, rel_path)
+            digest = self._digest(full, st)
+            if not digest.startswith("link:"):
+                object_path = self._object_path(digest)
+                if not os.path.exists(object_path):
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    self._clone(full, object_path + ".tmp")
+                    os.replace(object_path + ".tmp", object_path)
+            files[rel_path] = [digest, stat.S_IMODE(st.st_mode), st.st_size, st.st_mtime_ns]
+        tmp_path = os.path.join(self.snapshots_dir, f"{name}.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"files": files}, f)
+        os.replace(tmp_path, os.path.join(self.snapshots_dir, f"{name}.json"))
+        self._save_stat_cache()
+        return len(files)
+
+    def diff(self, root, name):
+        """
+        {"modified", "added", "deleted"}: relative paths that differ between root and the snapshot.
+        """
+        files = self.load(name)["files"]
+        current = self._scan(root)
+        modified, added = [], []
+        for rel_path, st in current.items():
+            recorded = files.get(rel_path)
+            if recorded is None:
+                added.append(rel_path)
+            elif not (recorded[2] == st.st_size and recorded[3] == st.st_mtime_ns) \
+                    and self._digest(os.path.join(root, rel_path), st) != recorded[0]:
+                modified.append(rel_path)
+        self._save_stat_cache()
+        return {"modified": sorted(modified), "added": sorted(added), "deleted": sorted(set(files) - set(current))}
+
+    def restore(self, root, name):
+        """
+        Bring root back to the snapshot: rewrite modified and deleted files, remove added
+        ones. Returns the diff that was undone. Restored files get a new mtime so
+        cargo rebuilds them.
+        """
+        files = self.load(name)["files"]
+        changes = self.diff(root, name)
+        for rel_path in changes["added"]:
+            full = os.path.join(root, rel_path)
+            os.remove(full)
+            # 删掉因此变空的目录
+            parent = os.path.dirname(full)
+            while parent != root and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+        for rel_path in changes["modified"] + changes["deleted"]:
+            digest, mode, _, _ = files[rel_path]
+            full = os.path.join(root, rel_path)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            if os.path.lexists(full):
+                os.remove(full)
+            if digest.startswith("link:"):
+                os.symlink(digest[len("link:"):], full)
+                continue
+            self._clone(self._object_path(digest), full)
+            os.chmod(full, mode)
+            st = os.lstat(full)
+            self._stat_cache[full] = [digest, st.st_size, st.st_mtime_ns]
+        self._save_stat_cache()
+        return changes
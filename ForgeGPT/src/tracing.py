@@ -0,0 +1,307 @@
+"""
+Lightweight stage-level tracing for migration and delta-compile runs.
+
+    from src.tracing import span
+
+    with span("build.xargo", category="build", project=name) as s:
+        output = run_build()
+        s.set(success=True, output_bytes=len(output))
+
+Spans nest through a context variable, carry their duration and any attributes set
+on them (token counts, cache outcomes, ...), and are exported as JSONL (one span per
+line) and as a Chrome/Perfetto trace (chrome://tracing or ui.perfetto.dev).
+Stages listed in `profile_stages` additionally run a sampling profiler while they
+are open and record their hottest stacks on the span.
+
+Tracing is off unless `configure(enabled=True)` is called or FORGE_TRACE_DIR is set;
+a disabled tracer hands out a shared no-op span.
+Environment variables:
+    FORGE_TRACE_DIR        enable tracing and export to this directory at exit
+    FORGE_TRACE_PROFILE    comma separated span names/categories to profile
+"""
+import atexit
+import collections
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+_current_span = contextvars.ContextVar("forge_current_span", default=None)
+
+
+class Span:
+    __slots__ = ('name', 'category', 'span_id', 'parent_id', 'thread_id', 'start_ns', 'end_ns', 'attrs')
+
+    def __init__(self, name, category, span_id, parent_id, attrs):
+        self.name = name
+        self.category = category
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, key, value):
+        # accumulate a counter attribute, e.g. tokens over several calls
+        self.attrs[key] = self.attrs.get(key, 0) + value
+        return self
+
+    @property
+    def duration(self):
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e9
+
+    def to_dict(self, origin_ns=0):
+        return {
+            "name": self.name,
+            "category": self.category,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "thread_id": self.thread_id,
+            "start": (self.start_ns - origin_ns) / 1e9,
+            "duration": self.duration,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    name = None
+    duration = 0.0
+    attrs = {}
+
+    def set(self, **attrs):
+        return self
+
+    def add(self, key, value):
+        return self
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread every `interval` seconds and counts collapsed
+    stacks ("outer;...;inner" as used by flamegraph tools).
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.counts
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.output_dir = None
+        self.profile_stages = set()
+        self.profile_interval = 0.005
+        self.profile_top = 10
+        self.origin_ns = time.perf_counter_ns()
+        self.spans = []
+        self.stacks = collections.Counter()  # collapsed stacks of all profiled stages
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def configure(self, enabled=True, output_dir=None, profile_stages=None, profile_interval=None):
+        self.enabled = enabled
+        if output_dir is not None:
+            self.output_dir = output_dir
+            if not self._atexit_registered:
+                atexit.register(self.export)
+                self._atexit_registered = True
+        if profile_stages is not None:
+            self.profile_stages = set(profile_stages)
+        if profile_interval is not None:
+            self.profile_interval = profile_interval
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self.stacks = collections.Counter()
+            self.origin_ns = time.perf_counter_ns()
+
+    def span(self, name, category=None, **attrs):
+        if not self.enabled:
+            return _NoopContext()
+        return _SpanContext(self, name, category or name.split('.', 1)[0], attrs)
+
+    def _open(self, name, category, attrs):
+        parent = _current_span.get()
+        span = Span(name, category, next(self._ids), parent.span_id if parent else None, attrs)
+        sampler = None
+        if name in self.profile_stages or category in self.profile_stages:
+            sampler = _StackSampler(span.thread_id, self.profile_interval)
+            sampler.start()
+        return span, sampler
+
+    def _close(self, span, sampler, error):
+        span.end_ns = time.perf_counter_ns()
+        if error is not None:
+            span.attrs.setdefault("error", f"{type(error).__name__}: {str(error)[:200]}")
+        if sampler is not None:
+            counts = sampler.stop()
+            span.attrs["profile"] = {
+                "samples": sum(counts.values()),
+                "interval": self.profile_interval,
+                "top": counts.most_common(self.profile_top),
+            }
+        with self._lock:
+            self.spans.append(span)
+            if sampler is not None:
+                self.stacks.update(counts)
+
+    def summary(self):
+        """
+        Total/mean duration and count per span name, slowest first.
+        """
+        totals = {}
+        for span in list(self.spans):
+            row = totals.setdefault(span.name, {"count": 0, "total": 0.0})
+            row["count"] += 1
+            row["total"] += span.duration
+        for row in totals.values():
+            row["mean"] = row["total"] / row["count"]
+        return dict(sorted(totals.items(), key=lambda item: -item[1]["total"]))
+
+    def export_jsonl(self, path):
+        with open(path, 'w') as f:
+            for span in sorted(self.spans, key=lambda s: s.start_ns):
+                f.write(json.dumps(span.to_dict(self.origin_ns), ensure_ascii=False, default=str) + "\n")
+
+    def export_chrome_trace(self, path):
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start_ns - self.origin_ns) / 1e3,
+                "dur": (span.end_ns - span.start_ns) / 1e3,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {k: v for k, v in span.attrs.items() if k != "profile"},
+            })
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def export_collapsed_stacks(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def export(self, output_dir=None):
+        """
+        Write trace.jsonl, trace.chrome.json (and profile.folded when stages were profiled).
+        """
+        output_dir = output_dir or self.output_dir
+        if not output_dir or not self.spans:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        self.export_jsonl(os.path.join(output_dir, "trace.jsonl"))
+        self.export_chrome_trace(os.path.join(output_dir, "trace.chrome.json"))
+        if self.stacks:
+            self.export_collapsed_stacks(os.path.join(output_dir, "profile.folded"))
+        return output_dir
+
+
+class _SpanContext:
+    __slots__ = ('tracer', 'name', 'category', 'attrs', 'span', 'sampler', 'token')
+
+    def __init__(self, tracer, name, category, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span, self.sampler = self.tracer._open(self.name, self.category, self.attrs)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        self.tracer._close(self.span, self.sampler, exc)
+        return False
+
+
+class _NoopContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return _NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_TRACER = Tracer()
+if os.getenv("FORGE_TRACE_DIR"):
+    _TRACER.configure(
+        enabled=True,
+        output_dir=os.getenv("FORGE_TRACE_DIR"),
+        profile_stages=[s for s in os.getenv("FORGE_TRACE_PROFILE", "").split(",") if s],
+    )
+
+
+def get_tracer():
+    return _TRACER
+
+
+def configure(**kwargs):
+    return _TRACER.configure(**kwargs)
+
+
+def span(name, category=None, **attrs):
+    return _TRACER.span(name, category, **attrs)
+
+
+def current_span():
+    return _current_span.get() or _NOOP_SPAN
+
+
+def traced(name=None, category=None):
+    """
+    Decorator form of span(); the span is named after the function by default.
+    """
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        def wrapper(*args, **kwargs):
+            with _TRACER.span(span_name, category):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.__wrapped__ = fn
+        return wrapper
+    return decorate
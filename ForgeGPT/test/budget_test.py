@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+
+from src.migration import budget as budget_module
+from src.migration.budget import Budget, BudgetExhausted
+
+
+class BudgetTest(unittest.TestCase):
+    def test_charges_reach_every_parent(self):
+        batch = Budget("batch", builds=100)
+        project = batch.child("project", builds=10, tokens=1000)
+        file_budget = project.child("file", builds=3)
+        file_budget.charge(builds=2, tokens=400)
+        self.assertEqual([b.used for b in (file_budget, project, batch)], [{"builds": 2, "tokens": 400}] * 3)
+
+    def test_first_exhausted_limit_on_the_chain(self):
+        project = Budget("project", builds=10, tokens=1000)
+        file_budget = project.child("file", builds=3)
+        file_budget.charge(builds=2, tokens=900)
+        self.assertIsNone(file_budget.exhausted(builds=1))
+        self.assertEqual(file_budget.exhausted(builds=2), "file builds")
+        self.assertEqual(file_budget.exhausted(tokens=200), "project tokens")
+        # 兄弟预算只受共同父预算的限制
+        self.assertEqual(project.child("other").exhausted(tokens=200), "project tokens")
+        self.assertIsNone(project.child("other").exhausted(builds=5))
+
+    def test_check_raises(self):
+        file_budget = Budget("project", tokens=10).child("file")
+        with self.assertRaises(BudgetExhausted) as raised:
+            file_budget.check(tokens=11)
+        self.assertEqual(raised.exception.reason, "project tokens")
+        file_budget.check(tokens=10)
+
+    def test_time_limits(self):
+        with mock.patch.object(budget_module.time, "monotonic", return_value=100.0):
+            project = Budget("project", seconds=60)
+            file_budget = project.child("file", seconds=30)
+        with mock.patch.object(budget_module.time, "monotonic", return_value=120.0):
+            self.assertEqual(file_budget.remaining_seconds(), 10.0)
+            self.assertIsNone(file_budget.exhausted())
+        with mock.patch.object(budget_module.time, "monotonic", return_value=140.0):
+            self.assertEqual(file_budget.remaining_seconds(), 0.0)
+            self.assertEqual(file_budget.exhausted(), "file seconds")
+            self.assertEqual(project.remaining_seconds(), 20.0)
+        self.assertIsNone(Budget("unlimited").remaining_seconds())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from src.dep_analysis import migration_levels, strongly_connected_components
+
+
+class MigrationLevelsTest(unittest.TestCase):
+    def test_acyclic_graph(self):
+        graph = {"a": set(), "b": {"a"}, "c": {"a", "b"}, "d": set()}
+        self.assertEqual(migration_levels(graph), [["a", "d"], ["b"], ["c"]])
+
+    def test_only_the_cycle_shares_a_level(self):
+        # b <-> c is a cycle that depends on a; d depends on the cycle, e is independent
+        graph = {"a": set(), "b": {"a", "c"}, "c": {"b"}, "d": {"c"}, "e": set(), "f": {"e"}}
+        self.assertEqual(migration_levels(graph), [["a", "e"], ["b", "c", "f"], ["d"]])
+
+    def test_dependencies_outside_the_graph_are_ignored(self):
+        self.assertEqual(migration_levels({"a": {"x"}, "b": {"a", "b"}}), [["a"], ["b"]])
+
+    def test_components_come_after_their_dependencies(self):
+        graph = {"a": {"b"}, "b": {"a"}, "c": {"d"}, "d": {"c", "a"}}
+        self.assertEqual(strongly_connected_components(graph), [["a", "b"], ["c", "d"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from src.diff.diff_hunk_read import iter_diff_hunks, parse_diff_hunks, iter_all_changes, parse_all_changes
+
+LIB_DIFF = """diff --git a/src/lib.rs b/src/lib.rs
+index 1111111..2222222 100644
+--- a/src/lib.rs
++++ b/src/lib.rs
+@@ -1,3 +1,4 @@
+ fn a() {
+     let x = 1;
++    let x2 = x;
+ }
+@@ -10,2 +11,2 @@ fn b() {
+-    let y = 2;
++    let y = 20;
+ }
+"""
+
+MAIN_DIFF = """diff --git a/src/main.rs b/src/main.rs
+new file mode 100644
+--- /dev/null
++++ b/src/main.rs
+@@ -0,0 +1,3 @@
++fn main() {
++    println!("hi");
++}
+"""
+
+
+def _fields(hunk):
+    return hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count, hunk.lines
+
+
+class StreamingDiffTest(unittest.TestCase):
+    def test_file_object_matches_the_full_parse(self):
+        text = LIB_DIFF + MAIN_DIFF
+        expected = [_fields(h) for h in parse_diff_hunks(LIB_DIFF) + parse_diff_hunks(MAIN_DIFF)]
+        for chunk_size in (7, 64, 1 << 20):
+            hunks = list(iter_diff_hunks(io.StringIO(text), chunk_size=chunk_size))
+            self.assertEqual([_fields(h) for h in hunks], expected, chunk_size)
+            self.assertEqual([h.file.path for h in hunks], ["src/lib.rs", "src/lib.rs", "src/main.rs"])
+        self.assertEqual([_fields(h) for h in iter_diff_hunks(text)], expected)
+
+    def test_blank_context_lines_are_kept(self):
+        # 空的上下文行在 JSON 里常常丢了前导空格
+        text = "@@ -1,4 +1,4 @@\n fn a() {\n-    1\n+    2\n\n }\n"
+        self.assertEqual(next(iter_diff_hunks(text)).lines, [" fn a() {", "-    1", "+    2", "", " }"])
+        text = "@@ -1,2 +1,2 @@\n-a\n+b\n\n\n==========\n"
+        self.assertEqual(next(iter_diff_hunks(text)).lines, ["-a", "+b", ""])
+        text = "@@ -1 +1 @@\n-a\n+b\n\\ No newline at end of file\n==========\n"
+        self.assertEqual(next(iter_diff_hunks(text)).lines, ["-a", "+b", "\\ No newline at end of file"])
+
+    def test_hunk_body_stops_at_the_next_file(self):
+        hunks = list(iter_diff_hunks(io.StringIO(LIB_DIFF + MAIN_DIFF), chunk_size=16))
+        self.assertEqual(hunks[1].lines, ["-    let y = 2;", "+    let y = 20;", " }"])
+        self.assertEqual(hunks[2].file.old_path, "/dev/null")
+
+
+class ChangesDirectoryTest(unittest.TestCase):
+    """The changes/ directory also holds delta compile results and caches (regression)."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self._write("proj.json", {"src/lib.rs": {"git_diff": LIB_DIFF}})
+        self._write("proj.deltacompile.json", {"src/lib.rs": [{"hunk_index": 0, "hunk": "", "xargo_compilable": True}]})
+        self._write("build_history.json", {"proj": {"xargo": {"check": [1.5]}}})
+        self._write("fix_memo.json", {"entries": {"0123abcd": {"example": "error", "fixes": []}},
+                                      "llm_paths": 0, "llm_seconds": 0.0})
+        self._write("dep_graph_cache.json", [["proj", "other"]])
+        with open(os.path.join(self.directory, "broken.json"), 'w') as f:
+            f.write("{not json")
+        os.makedirs(os.path.join(self.directory, ".forge"))
+        self._write(os.path.join(".forge", "manifest_index.json"), {"root": "/", "manifests": []})
+
+    def _write(self, name, data):
+        with open(os.path.join(self.directory, name), 'w') as f:
+            json.dump(data, f)
+
+    def test_iter_all_changes_skips_other_json(self):
+        found = [(fname, rel_file, hunk.old_start) for fname, rel_file, hunk in iter_all_changes(self.directory)]
+        self.assertEqual(found, [("proj.json", "src/lib.rs", 1), ("proj.json", "src/lib.rs", 10)])
+
+    def test_parse_all_changes_skips_other_json(self):
+        changes = parse_all_changes(self.directory)
+        self.assertEqual(list(changes), ["proj.json"])
+        self.assertEqual(len(changes["proj.json"]["src/lib.rs"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
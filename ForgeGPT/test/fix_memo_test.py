@@ -0,0 +1,69 @@
+import unittest
+
+from src.migration.fix_memo import fingerprint, normalize_message, apply_pin
+
+LOG = """   Compiling foo v0.1.0 (/root/work_a/foo)
+error[E0433]: failed to resolve: use of undeclared crate or module `sgx_tstd`
+ --> /root/work_a/foo/src/lib.rs:12:5
+  |
+12 |     sgx_tstd::println!("x");
+  |     ^^^^^^^^ use of undeclared crate or module `sgx_tstd`
+
+error: failed to download `libc v0.2.175`
+
+error: aborting due to 2 previous errors
+"""
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_stable_across_paths_versions_and_positions(self):
+        moved = (LOG.replace("/root/work_a", "/workspaces/other/checkout")
+                 .replace("0.2.175", "0.2.176").replace(":12:5", ":40:9"))
+        self.assertEqual(fingerprint(LOG), fingerprint(moved))
+
+    def test_codes_and_identifiers_are_kept(self):
+        self.assertNotEqual(fingerprint(LOG), fingerprint(LOG.replace("E0433", "E0432")))
+        self.assertNotEqual(fingerprint(LOG), fingerprint(LOG.replace("`sgx_tstd`", "`sgx_types`")))
+
+    def test_no_errors(self):
+        self.assertIsNone(fingerprint("   Compiling foo v0.1.0\n    Finished release [optimized]\n"))
+
+    def test_normalize_message(self):
+        self.assertEqual(normalize_message("failed to download `libc v0.2.175` from /root/.cargo/registry"),
+                         "failed to download `libc <ver>` from <path>")
+
+
+MANIFEST = """[package]
+name = "foo"
+
+[dependencies]
+sgx_tstd = { git = "https://github.com/apache/teaclave-sgx-sdk.git" }
+libc = "0.2"
+
+[features]
+default = []
+"""
+
+
+class ApplyPinTest(unittest.TestCase):
+    def test_replaces_an_existing_entry(self):
+        pinned = apply_pin(MANIFEST, "dependencies", "libc", "=0.2.77")
+        self.assertIn('libc = "=0.2.77"\n', pinned)
+        self.assertNotIn('libc = "0.2"', pinned)
+        self.assertIsNone(apply_pin(pinned, "dependencies", "libc", "=0.2.77"))
+
+    def test_adds_to_the_section(self):
+        pinned = apply_pin(MANIFEST, "dependencies", "cc", "=1.0.28")
+        lines = pinned.splitlines()
+        self.assertLess(lines.index('cc = "=1.0.28"'), lines.index("[features]"))
+        self.assertGreater(lines.index('cc = "=1.0.28"'), lines.index("[dependencies]"))
+
+    def test_adds_a_missing_section(self):
+        pinned = apply_pin(MANIFEST, "build-dependencies", "cc", "=1.0.28")
+        self.assertTrue(pinned.endswith('\n\n[build-dependencies]\ncc = "=1.0.28"\n'))
+        # 其他 section 里的同名依赖不受影响
+        self.assertIn('libc = "0.2"', apply_pin(MANIFEST, "build-dependencies", "libc", "=0.2.77"))
+
+
+if __name__ == "__main__":
+    unittest.main()
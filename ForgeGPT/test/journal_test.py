@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.compilation.journal import DeltaCompileJournal
+
+
+class DeltaCompileJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "proj.deltacompile.jsonl")
+
+    def test_replay_after_reopen(self):
+        journal = DeltaCompileJournal(self.path, "proj")
+        journal.record("src/lib.rs", 0, "xargo", "+a", True)
+        journal.record("src/lib.rs", 0, "cargo", "+a", False, "\x1b[31merror\x1b[0m: boom")
+        journal.record("src/lib.rs", 1, "xargo", "+b", True)
+
+        reopened = DeltaCompileJournal(self.path, "proj")
+        self.assertTrue(reopened.is_done("src/lib.rs", 0))
+        self.assertTrue(reopened.is_done("src/lib.rs", 1, "xargo"))
+        self.assertFalse(reopened.is_done("src/lib.rs", 1))
+        self.assertFalse(reopened.complete)
+        errors = [r["error"] for r in reopened.records() if "error" in r]
+        self.assertEqual(errors, ["error: boom"])
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = DeltaCompileJournal(self.path, "proj")
+        journal.record("src/lib.rs", 0, "xargo", "+a", True)
+        with open(self.path, 'a') as f:
+            f.write('{"project": "proj", "file": "src/lib.rs", "hunk_in')
+        reopened = DeltaCompileJournal(self.path, "proj")
+        self.assertEqual(reopened.completed, {("src/lib.rs", 0, "xargo")})
+
+    def test_append_after_truncated_line(self):
+        journal = DeltaCompileJournal(self.path, "proj")
+        journal.record("src/lib.rs", 0, "xargo", "+a", True)
+        with open(self.path, 'a') as f:
+            f.write('{"project": "proj", "fi')
+        reopened = DeltaCompileJournal(self.path, "proj")
+        reopened.record("src/lib.rs", 1, "xargo", "+b", False, "error: boom")
+        replayed = DeltaCompileJournal(self.path, "proj")
+        self.assertEqual(replayed.completed, {("src/lib.rs", 0, "xargo"), ("src/lib.rs", 1, "xargo")})
+        self.assertEqual(len(list(replayed.records())), 2)
+
+    def test_only_partial_line(self):
+        with open(self.path, 'w') as f:
+            f.write('{"project": "proj", "fi')
+        DeltaCompileJournal(self.path, "proj").record("src/lib.rs", 0, "cargo", "+a", True)
+        self.assertEqual(DeltaCompileJournal(self.path, "proj").completed, {("src/lib.rs", 0, "cargo")})
+
+    def test_mark_complete(self):
+        DeltaCompileJournal(self.path, "proj").mark_complete()
+        self.assertTrue(DeltaCompileJournal(self.path, "proj").complete)
+
+    def test_compact_keeps_the_last_record(self):
+        journal = DeltaCompileJournal(self.path, "proj")
+        journal.record("src/lib.rs", 1, "cargo", "+b", False, "error: first")
+        journal.record("src/lib.rs", 0, "xargo", "+a", True)
+        journal.record("src/lib.rs", 1, "cargo", "+b", True)
+        journal.mark_complete()
+        output = os.path.join(self.directory, "proj.deltacompile.json")
+        results = journal.compact(output)
+        self.assertEqual(results, {"src/lib.rs": [
+            {"hunk_index": 0, "hunk": "+a", "xargo_compilable": True},
+            {"hunk_index": 1, "hunk": "+b", "cargo_compilable": True},
+        ]})
+        with open(output, 'r') as f:
+            self.assertEqual(json.load(f), results)
+
+
+if __name__ == "__main__":
+    unittest.main()
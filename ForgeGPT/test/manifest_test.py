@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from src.tool.manifest import ManifestIndex
+
+ENCLAVE = """[package]
+name = "enclave"
+version = "0.1.0"
+
+[features]
+default = ["std"]
+std = ["serde/std"]
+
+[dependencies]
+sgx_tstd = { git = "https://github.com/apache/teaclave-sgx-sdk.git", rev = "v1.1.3" }
+serde = { version = "1.0", default-features = false, optional = true }
+"""
+
+APP = """[package]
+name = "app"
+version = "0.1.0"
+
+[dependencies]
+sgx_tstd = { git = "https://github.com/apache/teaclave-sgx-sdk.git", tag = "v1.1.2", features = ["backtrace"] }
+log = { version = "0.4", features = ["std"] }
+
+[target.'cfg(unix)'.dependencies]
+libc = "0.2"
+"""
+
+
+class ManifestIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.index_path = os.path.join(tempfile.mkdtemp(), ".forge", "manifest_index.json")
+        self._write("enclave/Cargo.toml", ENCLAVE)
+        self._write("app/Cargo.toml", APP)
+        # target/ 下的清单不算
+        self._write("app/target/release/build/x/Cargo.toml", "[package]\nname = \"x\"\n")
+
+    def _write(self, rel_path, text):
+        path = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def test_refresh_parses_only_changed_files(self):
+        index = ManifestIndex(self.root, self.index_path)
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(index.refresh(), 0)
+        self.assertTrue(os.path.isfile(self.index_path))
+        self._write("app/Cargo.toml", APP + 'cc = "1.0"\n')
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual([m.name for m, _ in index.dependents("cc")], ["app"])
+
+        reloaded = ManifestIndex(self.root, self.index_path)
+        self.assertEqual(reloaded.refresh(), 0)
+        self.assertEqual(len(reloaded.dependents("sgx_tstd")), 2)
+
+    def test_removed_manifest_leaves_the_index(self):
+        index = ManifestIndex(self.root, None)
+        index.refresh()
+        os.remove(os.path.join(self.root, "enclave", "Cargo.toml"))
+        index.refresh()
+        self.assertEqual([m.name for m, _ in index.dependents("sgx_tstd")], ["app"])
+
+    def test_queries(self):
+        index = ManifestIndex(self.root, None)
+        index.refresh()
+        pins = {os.path.basename(os.path.dirname(path)): entries for path, entries in index.pins("sgx_tstd").items()}
+        git = "https://github.com/apache/teaclave-sgx-sdk.git"
+        self.assertEqual(pins, {"enclave": [("normal", git, "v1.1.3")], "app": [("normal", git, "v1.1.2")]})
+        self.assertEqual(sorted(d.name for _, d in index.enabling_feature("std")), ["log", "serde"])
+        self.assertEqual([d.target for _, d in index.dependents("libc")], ["cfg(unix)"])
+        self.assertEqual([m.name for m in index.with_default_features("serde")], [])
+        self.assertEqual(index.dependents("log", kind="build"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
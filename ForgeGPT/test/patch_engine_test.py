@@ -0,0 +1,100 @@
+import unittest
+
+from src.diff.diff_hunk_read import parse_diff_hunks
+from src.diff.patch_engine import apply_hunks, revert_hunks, APPLIED, FUZZY, ALREADY_APPLIED, CONFLICT
+
+OLD = """fn a() {
+    let x = 1;
+}
+
+fn b() {
+    let y = 2;
+}
+
+fn c() {
+    let z = 3;
+}
+"""
+
+NEW = """fn a() {
+    let x = 1;
+    let x2 = x;
+}
+
+fn b() {
+    let y = 20;
+}
+
+fn c() {
+    let z = 3;
+}
+"""
+
+DIFF = """@@ -1,3 +1,4 @@
+ fn a() {
+     let x = 1;
++    let x2 = x;
+ }
+@@ -5,3 +6,3 @@
+ fn b() {
+-    let y = 2;
++    let y = 20;
+ }
+"""
+
+
+class PatchEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.hunks = parse_diff_hunks(DIFF)
+
+    def test_round_trip(self):
+        applied = apply_hunks(OLD, self.hunks)
+        self.assertEqual(applied.content, NEW)
+        self.assertEqual([o.status for o in applied.outcomes], [APPLIED, APPLIED])
+        reverted = revert_hunks(NEW, self.hunks)
+        self.assertEqual(reverted.content, OLD)
+        self.assertTrue(reverted.ok)
+
+    def test_drift_is_reported_as_offset(self):
+        header = "// license\n// header\n\n"
+        applied = apply_hunks(header + OLD, self.hunks)
+        self.assertEqual(applied.content, header + NEW)
+        self.assertEqual([o.offset for o in applied.outcomes], [3, 0])
+        self.assertEqual([o.actual_line for o in applied.outcomes], [4, 8])
+
+    def test_already_applied(self):
+        applied = apply_hunks(NEW, self.hunks)
+        self.assertEqual([o.status for o in applied.outcomes], [ALREADY_APPLIED, ALREADY_APPLIED])
+        self.assertEqual(applied.content, NEW)
+
+    def test_target_far_away_is_not_already_applied(self):
+        hunks = parse_diff_hunks("@@ -2 +2 @@\n-    let x = 1;\n+    return;\n")
+        content = "fn a() {\n    let x = 5;\n}\n" + "\n" * 300 + "fn b() {\n    return;\n}\n"
+        applied = apply_hunks(content, hunks)
+        self.assertEqual(applied.outcomes[0].status, CONFLICT)
+        self.assertEqual(applied.content, content)
+
+    def test_conflict_leaves_the_file_unchanged(self):
+        edited = OLD.replace("let y = 2;", "let y = 5;")
+        applied = apply_hunks(edited, self.hunks)
+        self.assertEqual([o.status for o in applied.outcomes], [APPLIED, CONFLICT])
+        self.assertIsNone(applied.conflicts[0].actual_line)
+        self.assertFalse(applied.ok)
+        self.assertIn("let y = 5;", applied.content)
+        self.assertIn("let x2 = x;", applied.content)
+
+    def test_fuzzy_keeps_the_file_context(self):
+        edited = OLD.replace("fn b() {", "fn renamed() {")
+        applied = apply_hunks(edited, self.hunks)
+        self.assertEqual([o.status for o in applied.outcomes], [APPLIED, FUZZY])
+        self.assertEqual(applied.outcomes[1].fuzz, 1)
+        self.assertEqual(applied.content, NEW.replace("fn b() {", "fn renamed() {"))
+
+    def test_no_fuzz_is_a_conflict(self):
+        edited = OLD.replace("fn b() {", "fn renamed() {")
+        applied = apply_hunks(edited, self.hunks, max_fuzz=0)
+        self.assertEqual(applied.outcomes[1].status, CONFLICT)
+
+
+if __name__ == "__main__":
+    unittest.main()
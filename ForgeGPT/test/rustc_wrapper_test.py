@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+from src.compilation.rustc_wrapper import cacheable, cache_key
+
+REGISTRY_SOURCE = "/root/.cargo/registry/src/github.com-1ecc6299db9ec823/libc-0.2.77/src/lib.rs"
+
+
+def rustc_args(build_root, source=REGISTRY_SOURCE, crate_type="lib", metadata="6b3a"):
+    deps = f"{build_root}/target/release/deps"
+    return ["--crate-name", "libc", "--edition=2015", source, "--crate-type", crate_type,
+            "-C", "opt-level=3", "-C", f"metadata={metadata}", "-C", f"extra-filename=-{metadata}",
+            "--out-dir", deps, "-L", f"dependency={deps}", "--cfg", 'feature="default"']
+
+
+class CacheableTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_registry_library(self):
+        self.assertEqual(cacheable(rustc_args("/root/a")), ("libc", "-6b3a", "/root/a/target/release/deps"))
+
+    def test_vendored_and_git_sources(self):
+        for source in ("/root/a/.forge-vendor/libc/src/lib.rs",
+                       "/root/.cargo/git/checkouts/teaclave-sgx-sdk-3c9d/8f065be/sgx_tstd/src/lib.rs"):
+            self.assertIsNotNone(cacheable(rustc_args("/root/a", source=source)), source)
+
+    def test_primary_package_is_not_cached(self):
+        os.environ["CARGO_PRIMARY_PACKAGE"] = "1"
+        self.assertIsNone(cacheable(rustc_args("/root/a")))
+
+    def test_project_sources_and_binaries_are_not_cached(self):
+        self.assertIsNone(cacheable(rustc_args("/root/a", source="/root/a/proj/src/lib.rs")))
+        self.assertIsNone(cacheable(rustc_args("/root/a", crate_type="bin")))
+
+    def test_missing_options(self):
+        args = rustc_args("/root/a")
+        for option in ("--out-dir", "--crate-name"):
+            i = args.index(option)
+            self.assertIsNone(cacheable(args[:i] + args[i + 2:]), option)
+        self.assertIsNone(cacheable([a for a in args if not a.startswith("extra-filename=")]))
+
+
+class CacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"CARGO_PKG_NAME": "libc", "CARGO_PKG_VERSION": "0.2.77"}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def key(self, build_root, **kwargs):
+        args = rustc_args(build_root, **kwargs)
+        return cache_key(sys.executable, args, cacheable(args)[2])
+
+    def test_independent_of_the_build_root(self):
+        self.assertEqual(self.key("/root/work_a"), self.key("/workspaces/other/work_b"))
+
+    def test_depends_on_the_arguments_and_package(self):
+        self.assertNotEqual(self.key("/root/a"), self.key("/root/a", metadata="9f01"))
+        base = self.key("/root/a")
+        os.environ["CARGO_PKG_VERSION"] = "0.2.78"
+        self.assertNotEqual(self.key("/root/a"), base)
+
+
+if __name__ == "__main__":
+    unittest.main()
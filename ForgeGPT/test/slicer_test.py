@@ -0,0 +1,60 @@
+import unittest
+
+from src.migration.slicer import SourceSlice
+
+SOURCE = "\n".join(f"line {i}" for i in range(1, 13)) + "\n"
+
+
+class SpliceTest(unittest.TestCase):
+    def setUp(self):
+        self.excerpt = SourceSlice(SOURCE, [(2, 3), (8, 9)], "src/lib.rs")
+
+    def test_text_round_trip(self):
+        self.assertEqual(self.excerpt.splice(self.excerpt.text), SOURCE)
+
+    def test_blocks_replace_their_lines(self):
+        response = "```rust\n// @@ lines 8-9 @@\nnew 8\n// @@ lines 2-3 @@\nnew 2\nnew 2b\nnew 3\n```"
+        lines = self.excerpt.splice(response).splitlines()
+        self.assertEqual(lines[:5], ["line 1", "new 2", "new 2b", "new 3", "line 4"])
+        self.assertEqual(lines[7:10], ["line 7", "new 8", "line 10"])
+        self.assertEqual(len(lines), 12)
+
+    def test_unanchored_blocks_keep_their_lines(self):
+        response = "// @@ lines 8-9 @@\nnew 8\nnew 9\n// ... 3 lines omitted ..."
+        self.assertEqual(self.excerpt.splice(response), SOURCE.replace("line 8\nline 9", "new 8\nnew 9"))
+
+    def test_crate_level_items_go_to_the_top(self):
+        response = ("use std::fmt;\npub(crate) use std::io::{\n    Read,\n    Write,\n};\n#![no_std]\n"
+                    "extern crate sgx_tstd as std;\nmod util;\n\n// @@ lines 2-3 @@\nline 2\nline 3")
+        lines = self.excerpt.splice(response).splitlines()
+        self.assertEqual(lines[:9], ["#![no_std]", "use std::fmt;", "pub(crate) use std::io::{", "    Read,",
+                                     "    Write,", "};", "extern crate sgx_tstd as std;", "mod util;", "line 1"])
+
+    def test_crate_level_items_go_below_inner_attributes(self):
+        source = "//! Crate docs.\n#![no_std]\n#![feature(rustc_private)]\n\n" + SOURCE
+        excerpt = SourceSlice(source, [(6, 7)], "src/lib.rs")
+        response = "#![no_std]\n#![allow(dead_code)]\nextern crate sgx_tstd as std;\nuse std::fmt;\n// @@ lines 6-7 @@\nx"
+        lines = excerpt.splice(response).splitlines()
+        self.assertEqual(lines[:9], ["//! Crate docs.", "#![no_std]", "#![feature(rustc_private)]", "#![allow(dead_code)]",
+                                     "extern crate sgx_tstd as std;", "use std::fmt;", "", "line 1", "x"])
+
+    def test_prose_before_the_first_anchor(self):
+        for response in ("Here is the fixed code:\n// @@ lines 2-3 @@\nx",
+                         "use std::fmt;\nfn helper() {}\n// @@ lines 2-3 @@\nx"):
+            with self.assertRaisesRegex(ValueError, "not a crate-level item"):
+                self.excerpt.splice(response)
+
+    def test_bad_anchors(self):
+        with self.assertRaisesRegex(ValueError, "unexpected anchor lines 4-5"):
+            self.excerpt.splice("// @@ lines 4-5 @@\nx")
+        with self.assertRaisesRegex(ValueError, "unexpected anchor lines 2-3"):
+            self.excerpt.splice("// @@ lines 2-3 @@\nx\n// @@ lines 2-3 @@\ny")
+        with self.assertRaisesRegex(ValueError, "no line anchors"):
+            self.excerpt.splice("use std::fmt;\n")
+
+    def test_full_file_is_returned_as_is(self):
+        self.assertEqual(SourceSlice(SOURCE).splice("fn main() {}\n"), "fn main() {}\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from src.tool.snapshot import SnapshotStore
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = SnapshotStore(tempfile.mkdtemp())
+        self._write("Cargo.toml", "[package]\nname = \"proj\"\n")
+        self._write("src/lib.rs", "fn a() {}\n")
+        self._write("src/util.rs", "fn b() {}\n")
+        self._write("target/release/libproj.rlib", "build output")
+
+    def _write(self, rel_path, text):
+        path = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def _read(self, rel_path):
+        with open(os.path.join(self.root, rel_path), 'r') as f:
+            return f.read()
+
+    def test_take_skips_target(self):
+        self.assertEqual(self.store.take(self.root, "initial"), 3)
+        self.assertEqual(self.store.names(), ["initial"])
+        self.assertEqual(sorted(self.store.load("initial")["files"]), ["Cargo.toml", "src/lib.rs", "src/util.rs"])
+
+    def test_identical_contents_are_stored_once(self):
+        self._write("src/copy.rs", "fn a() {}\n")
+        self.store.take(self.root, "initial")
+        files = self.store.load("initial")["files"]
+        self.assertEqual(files["src/copy.rs"][0], files["src/lib.rs"][0])
+        objects = [name for _, _, names in os.walk(self.store.objects_dir) for name in names]
+        self.assertEqual(len(objects), 3)
+
+    def test_diff_and_restore(self):
+        self.store.take(self.root, "initial")
+        self._write("src/lib.rs", "fn a() { changed }\n")
+        os.remove(os.path.join(self.root, "src", "util.rs"))
+        self._write("src/new/mod.rs", "mod x;\n")
+        self._write("target/release/other.rlib", "more output")
+        changes = {"modified": ["src/lib.rs"], "added": ["src/new/mod.rs"], "deleted": ["src/util.rs"]}
+        self.assertEqual(self.store.diff(self.root, "initial"), changes)
+
+        self.assertEqual(self.store.restore(self.root, "initial"), changes)
+        self.assertEqual(self._read("src/lib.rs"), "fn a() {}\n")
+        self.assertEqual(self._read("src/util.rs"), "fn b() {}\n")
+        self.assertFalse(os.path.exists(os.path.join(self.root, "src", "new")))
+        self.assertTrue(os.path.exists(os.path.join(self.root, "target", "release", "other.rlib")))
+        self.assertEqual(self.store.diff(self.root, "initial"), {"modified": [], "added": [], "deleted": []})
+
+    def test_same_size_edit_is_detected(self):
+        self.store.take(self.root, "initial")
+        path = os.path.join(self.root, "src", "lib.rs")
+        stat = os.stat(path)
+        self._write("src/lib.rs", "fn z() {}\n")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertEqual(self.store.diff(self.root, "initial")["modified"], ["src/lib.rs"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import difflib
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.compilation import delta_compile
+from src.compilation.diagnostics import Diagnostic
+from src.compilation.journal import DeltaCompileJournal
+from src.compilation.trial_planner import make_trial_hunks, plan_groups, attribute
+from src.diff.diff_hunk_read import parse_diff_hunks
+
+OLD = """use std::fmt;
+
+fn a() {
+    let x = 1;
+}
+
+fn b() {
+    let y = 2;
+}
+
+fn c() {
+    let z = 3;
+}
+"""
+
+NEW = """use std::fmt;
+use std::io;
+
+fn a() {
+    let x = 1;
+    let x2 = x;
+}
+
+fn b() {
+    let y = 2;
+    let y2 = y;
+}
+
+fn c() {
+    let z = 3;
+    let z2 = z;
+}
+"""
+
+
+def make_diff(before, after):
+    lines = difflib.unified_diff(before.splitlines(), after.splitlines(), lineterm="", n=1)
+    return "\n".join(line for line in lines if not line.startswith(("---", "+++")))
+
+
+class TrialPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.hunks = parse_diff_hunks(make_diff(OLD, NEW))
+
+    def test_crate_level_hunks_are_solo(self):
+        trial_hunks = make_trial_hunks("src/lib.rs", NEW, self.hunks, range(len(self.hunks)))
+        self.assertEqual(len(trial_hunks), 4)
+        self.assertEqual([th.solo for th in trial_hunks], [True, False, False, False])
+        self.assertEqual(len({tuple(th.items) for th in trial_hunks[1:]}), 3)
+
+    def test_plan_groups(self):
+        trial_hunks = make_trial_hunks("src/lib.rs", NEW, self.hunks, range(len(self.hunks)))
+        groups = plan_groups(trial_hunks)
+        self.assertEqual([[th.index for th in group] for group in groups], [[0], [1, 2, 3]])
+        self.assertEqual(len(plan_groups(trial_hunks, max_group_size=2)), 3)
+        self.assertEqual(len(plan_groups(trial_hunks, max_group_size=1)), 4)
+
+    def test_hunks_on_the_same_item_are_not_grouped(self):
+        trial_hunks = make_trial_hunks("src/lib.rs", NEW, self.hunks, [1, 2])
+        trial_hunks.append(make_trial_hunks("src/lib.rs", NEW, self.hunks, [1])[0])
+        groups = plan_groups(trial_hunks)
+        self.assertEqual([[th.index for th in group] for group in groups], [[1, 2], [1]])
+
+    def test_attribute(self):
+        regions = {("src/lib.rs", 0): [(3, 5)], ("src/lib.rs", 1): [(7, 9)], ("src/other.rs", 0): [(1, 9)]}
+        inside = Diagnostic("error", "E0425", "cannot find value `y`", "/root/w/proj/src/lib.rs", 8)
+        elsewhere = Diagnostic("error", "E0425", "cannot find value `q`", "src/main.rs", 8)
+        untouched = Diagnostic("error", "E0308", "mismatched types", "src/lib.rs", 12)
+        attributed, unattributed = attribute([inside, elsewhere, untouched], regions)
+        self.assertEqual(attributed, {("src/lib.rs", 1): [inside]})
+        self.assertEqual(unattributed, [elsewhere, untouched])
+
+    def test_overlapping_regions_are_unattributed(self):
+        regions = {("src/lib.rs", 0): [(3, 9)], ("src/lib.rs", 1): [(7, 9)]}
+        diagnostic = Diagnostic("error", "E0425", "cannot find value `y`", "src/lib.rs", 8)
+        self.assertEqual(attribute([diagnostic], regions), ({}, [diagnostic]))
+
+
+class DeltaCompileTrialTest(unittest.TestCase):
+    """Attributed failures are confirmed by a build of their own before they are recorded."""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.changes_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.work_dir, "proj", "src"))
+        with open(os.path.join(self.work_dir, "proj", "src", "lib.rs"), 'w') as f:
+            f.write(NEW)
+        # 只有改函数体的三个 hunk，use 的那一行算作原有代码
+        diff = make_diff(OLD.replace("use std::fmt;\n", "use std::fmt;\nuse std::io;\n"), NEW)
+        with open(os.path.join(self.changes_dir, "proj.json"), 'w') as f:
+            json.dump({"src/lib.rs": {"git_diff": diff}}, f)
+        self.builds = []
+
+    def build(self, work_dir, project_name):
+        with open(os.path.join(work_dir, project_name, "src", "lib.rs"), 'r') as f:
+            content = f.read()
+        self.builds.append(content.count("2 = "))
+        if "let y2 = y;" not in content:
+            line = content.splitlines().index("fn b() {") + 1
+            raise RuntimeError(f"error[E0425]: cannot find value `y2`\n --> src/lib.rs:{line}:5\n")
+
+    def test_attributed_hunk_gets_a_solo_build(self):
+        journal = DeltaCompileJournal(os.path.join(self.changes_dir, "proj.deltacompile.jsonl"), "proj")
+        with mock.patch.dict(delta_compile.BUILDERS, {"xargo": self.build, "cargo": self.build}):
+            results = delta_compile.delta_compile_sgx_project(self.work_dir, "proj", journal, self.changes_dir)
+        # 3 个 hunk 一起还原，然后 a 和 c 一起，b 单独
+        self.assertEqual(self.builds, [0, 1, 2] * 2)
+        compilable = {(e["hunk_index"], t): e[f"{t}_compilable"]
+                      for e in results["src/lib.rs"] for t in ("xargo", "cargo") if f"{t}_compilable" in e}
+        self.assertEqual(compilable, {(i, t): i != 1 for i in range(3) for t in ("xargo", "cargo")})
+        with open(os.path.join(self.work_dir, "proj", "src", "lib.rs"), 'r') as f:
+            self.assertEqual(f.read(), NEW)
+
+
+if __name__ == "__main__":
+    unittest.main()